@@ -221,6 +221,7 @@ class CouncilDocumentsViewSet(viewsets.ReadOnlyModelViewSet):
                 council__authority_code=self.kwargs["authority_code"]
             )
             .select_related("council")
+            .defer("text")
             .order_by("updated_at")
             .all()
         )
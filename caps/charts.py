@@ -1,6 +1,6 @@
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, List, Tuple
 
-from .models import Council, DataPoint
+from .models import Council, EmissionsSeries
 
 import altair as alt
 import pandas as pd
@@ -10,18 +10,7 @@ from charting import ChartBundle
 def multi_emissions_chart(council: Council, year: int):
 
     # get just the total emissions data
-    totals = [
-        "Industry Total",
-        "Commercial Total",
-        "Public Sector Total",
-        "Transport Total",
-        "Domestic Total",
-        "Agriculture Total",
-    ]
-
-    df = DataPoint.objects.filter(
-        council=council, data_type__name_in_source__in=totals
-    ).to_dataframe("year", ("data_type__name_in_source", "emissions_type"), "value")
+    df = EmissionsSeries.for_council(council).sector_totals()
 
     # get row percentages
     pdf = df.pivot_table("value", index="year", columns="emissions_type", aggfunc="sum")
@@ -111,3 +100,15 @@ def multi_emissions_chart(council: Council, year: int):
         alt_title=alt_title,
         data_source=data_source,
     )
+
+
+def multi_emissions_chart_args() -> List[Tuple[Council, int]]:
+    """
+    The council and year for every emissions chart shown on a council page,
+    which is for the latest year of emissions data for the council.
+    """
+    return [
+        (series.council, series.latest_year)
+        for series in EmissionsSeries.objects.select_related("council")
+        if series.years
+    ]
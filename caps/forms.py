@@ -7,7 +7,8 @@ from haystack.forms import SearchForm
 from haystack.inputs import Exact
 from haystack.query import SearchQuerySet
 
-from caps.models import ComparisonType, Council, Distance, PlanDocument
+from caps.models import ComparisonType, Council, DataVersion, Distance, PlanDocument
+from caps.search_cache import CachedSearchResults
 from caps.search_funcs import (
     condense_highlights,
     get_semantic_query,
@@ -68,7 +69,50 @@ class HighlightedSearchForm(SearchForm):
         required=False, widget=Select(attrs={"class": "form-control"})
     )
 
+    def get_cache_options(self) -> dict:
+        """
+        The options that change the results of a search, with the query
+        normalised so trivially different queries share results.
+        """
+        match_method = self.cleaned_data["match_method"] or self.DEFAULT_SEARCH
+        query = " ".join(self.cleaned_data["q"].split())
+        # only exact matches are case sensitive
+        if match_method != self.MATCH_EXACT:
+            query = query.lower()
+
+        similar_council = self.cleaned_data["similar_council"]
+        similar_type = self.cleaned_data["similar_type"]
+        return {
+            "q": query,
+            "match_method": match_method,
+            "document_type": self.cleaned_data["document_type"] or "-1",
+            "council_name": self.cleaned_data["council_name"],
+            "similar_council": similar_council.slug if similar_council else None,
+            "similar_type": similar_type.slug if similar_type else None,
+        }
+
     def search(self):
+        """
+        Returns the results and possible related terms, cached until the
+        search index or keyphrases are next updated.
+        """
+        index_version = DataVersion.get_version(DataVersion.SEARCH_INDEX)
+        if (
+            index_version is None
+            or not self.cleaned_data["q"]
+            or self.cleaned_data["document_id"]
+        ):
+            return self.search_solr()
+
+        key = CachedSearchResults.get_key(
+            self.get_cache_options(),
+            index_version,
+            DataVersion.get_version(DataVersion.KEYPHRASES),
+        )
+        results = CachedSearchResults(key, self.search_solr)
+        return results, results.related_terms
+
+    def search_solr(self):
         highlighter_kwargs = highlighter_config
 
         possible_related_terms = []
@@ -0,0 +1,142 @@
+import time
+from collections import defaultdict
+from typing import Iterable, Optional
+
+import numpy as np
+
+from caps.models import (
+    CachedSearch,
+    Council,
+    DataVersion,
+    KeyPhrase,
+    KeyPhraseOverlap,
+    PlanDocument,
+)
+
+
+class KeyPhraseMatrix:
+    """
+    The keyphrases found in each council's documents, held as a row of bits
+    per council, so the keyphrases councils share can be worked out with array
+    operations rather than by loading the cached searches for every document.
+
+    There is one matrix per process. It is loaded the first time it's needed
+    and rebuilt once the cached searches DataVersion changes. If no search run
+    has recorded a version there is no matrix and callers should use the
+    database instead.
+    """
+
+    # how long to trust the matrix's version before checking the database again
+    VERSION_CHECK_AFTER = 60
+
+    _matrix = None
+    _checked = None
+
+    def __init__(self, version: int):
+        self.version = version
+
+        pairs = np.array(
+            CachedSearch.objects.values_list("document__council_id", "search_term_id")
+            .distinct()
+            .order_by(),
+            dtype=int,
+        ).reshape(-1, 2)
+        self.council_ids = np.unique(pairs[:, 0])
+        self.keyphrase_ids = np.unique(pairs[:, 1])
+
+        bits = np.zeros((len(self.council_ids), len(self.keyphrase_ids)), dtype=bool)
+        bits[
+            np.searchsorted(self.council_ids, pairs[:, 0]),
+            np.searchsorted(self.keyphrase_ids, pairs[:, 1]),
+        ] = True
+        self.bits = np.packbits(bits, axis=1)
+        self.empty_row = np.zeros(self.bits.shape[1], dtype=np.uint8)
+        self.rows = {id: row for row, id in enumerate(self.council_ids.tolist())}
+
+    @classmethod
+    def get(cls) -> Optional["KeyPhraseMatrix"]:
+        now = time.monotonic()
+        if cls._checked is not None and now - cls._checked < cls.VERSION_CHECK_AFTER:
+            return cls._matrix
+
+        version = DataVersion.get_version(DataVersion.CACHED_SEARCHES)
+        matrix = cls._matrix
+        if version is None:
+            matrix = None
+        elif matrix is None or matrix.version != version:
+            matrix = cls(version)
+
+        cls._matrix = matrix
+        cls._checked = now
+
+        return matrix
+
+    @classmethod
+    def clear(cls):
+        cls._matrix = None
+        cls._checked = None
+
+    def get_rows(self, council_ids: list[int]) -> np.ndarray:
+        return np.array(
+            [
+                self.bits[self.rows[id]] if id in self.rows else self.empty_row
+                for id in council_ids
+            ],
+            dtype=np.uint8,
+        ).reshape(-1, self.bits.shape[1])
+
+    def get_ids(self, row: np.ndarray) -> list[int]:
+        found = np.unpackbits(row, count=len(self.keyphrase_ids))
+        return self.keyphrase_ids[np.flatnonzero(found)].tolist()
+
+    def keyphrase_overlap(
+        self, main: Council, councils: Iterable[Council]
+    ) -> dict[Council, KeyPhraseOverlap]:
+        """
+        The overlap of keyphrases between the main council and each of the
+        councils. As with PlanDocument.keyphrase_overlap, councils without any
+        documents are left out and get an empty overlap.
+        """
+        councils = list(councils)
+        with_documents = set(
+            PlanDocument.objects.filter(council__in=councils)
+            .values_list("council_id", flat=True)
+            .distinct()
+        )
+        councils = [
+            council
+            for council in dict.fromkeys(councils)
+            if council.id in with_documents and council.id != main.id
+        ]
+
+        main_row = self.get_rows([main.id])
+        rows = self.get_rows([council.id for council in councils])
+        overlaps = rows & main_row
+        just_in_a = main_row & ~rows
+        just_in_b = rows & ~main_row
+
+        ids = {
+            council: [
+                self.get_ids(overlaps[row]),
+                self.get_ids(just_in_a[row]),
+                self.get_ids(just_in_b[row]),
+            ]
+            for row, council in enumerate(councils)
+        }
+
+        # only fetch the keyphrases that are in the results
+        keyphrases = KeyPhrase.objects.in_bulk(
+            {id for lists in ids.values() for id_list in lists for id in id_list}
+        )
+
+        results = defaultdict(
+            lambda: KeyPhraseOverlap(overlap=[], just_in_a=[], just_in_b=[])
+        )
+        for council, (overlap, a, b) in ids.items():
+            results[council] = KeyPhraseOverlap(
+                overlap=[keyphrases[id] for id in overlap],
+                just_in_a=[keyphrases[id] for id in a],
+                just_in_b=[keyphrases[id] for id in b],
+            )
+
+        return results
@@ -5,7 +5,9 @@ from caps.models import (
     ComparisonLabel,
     ComparisonLabelAssignment,
     ComparisonType,
+    CouncilProfileSnapshot,
     Distance,
+    RelatedCouncilGroups,
 )
 from django.core.management.base import BaseCommand, CommandError
 
@@ -59,6 +61,7 @@ def add_related_councils():
     ComparisonLabel.populate()
     ComparisonLabelAssignment.populate()
     Distance.populate()
+    RelatedCouncilGroups.build()
 
 
 class Command(BaseCommand):
@@ -73,6 +76,7 @@ class Command(BaseCommand):
             download_data()
             print("adding related authorities")
             add_related_councils()
+            CouncilProfileSnapshot.mark_stale()
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -0,0 +1,50 @@
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from caps.import_utils import rollback_atomic
+from caps.models import (
+    KeyPhrasePairWise,
+    bulk_create_df_to_model,
+    copy_df_to_model,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Times loading the pairwise keyphrase file with bulk_create and with "
+        "COPY. Nothing is saved."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch_size",
+            type=int,
+            default=10000,
+            help="Rows to write at a time",
+        )
+
+    def time_load(self, method, df, batch_size):
+        with rollback_atomic():
+            KeyPhrasePairWise.objects.all().delete()
+            start = perf_counter()
+            method(KeyPhrasePairWise, df, batch_size=batch_size, quiet=True)
+            return perf_counter() - start
+
+    def handle(self, *args, **options):
+        df = KeyPhrasePairWise.get_source_df()
+        batch_size = options["batch_size"]
+        self.stdout.write(f"Loading {len(df)} keyphrase pairs")
+
+        methods = {"bulk_create": bulk_create_df_to_model}
+        if connection.vendor == "postgresql":
+            methods["COPY"] = copy_df_to_model
+        else:
+            self.stdout.write("COPY needs PostgreSQL, skipping")
+
+        for name, method in methods.items():
+            seconds = self.time_load(method, df, batch_size)
+            self.stdout.write(
+                f"{name}: {seconds:.2f}s, {len(df) / seconds:,.0f} rows/s"
+            )
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+import caps.charts as charts
+from caps.models import DataVersion
+from charting import ChartCache
+
+
+class Command(BaseCommand):
+    help = "Builds the charts shown on council pages ahead of time"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Rebuild every chart, not just ones missing from the cache",
+        )
+
+    def handle(self, *args, **options):
+        version = DataVersion.get_version(DataVersion.EMISSIONS)
+        if version is None:
+            self.stderr.write(
+                "No emissions data version, run import_emissions_data first"
+            )
+            return
+
+        count = ChartCache.warm(
+            charts.multi_emissions_chart,
+            version,
+            charts.multi_emissions_chart_args(),
+            rebuild=options["all"],
+        )
+
+        self.stdout.write(f"Built {count} emissions charts")
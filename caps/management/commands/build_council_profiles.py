@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from tqdm import tqdm
+
+from caps.models import Council, CouncilProfileSnapshot
+from caps.views import CouncilDetailView
+
+
+class Command(BaseCommand):
+    help = "Stores a snapshot of each council page's data"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Rebuild every snapshot, not just stale or missing ones",
+        )
+
+    def handle(self, *args, **options):
+        councils = Council.objects.all()
+        if not options["all"]:
+            councils = councils.filter(
+                Q(profile_snapshot=None)
+                | Q(profile_snapshot__stale=True)
+                | ~Q(
+                    profile_snapshot__format_version=CouncilProfileSnapshot.FORMAT_VERSION
+                )
+            )
+
+        view = CouncilDetailView()
+        count = 0
+        for council in tqdm(councils, disable=options["verbosity"] < 2):
+            CouncilProfileSnapshot.store(council, view.get_profile_context(council))
+            count += 1
+
+        self.stdout.write(f"Stored {count} council profiles")
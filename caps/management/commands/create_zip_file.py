@@ -1,4 +1,4 @@
-from os.path import join, basename
+from os.path import join, basename, splitext
 from datetime import date
 import math
 import zipfile
@@ -23,8 +23,14 @@ class Command(BaseCommand):
         plans = PlanDocument.objects.all()
         with zipfile.ZipFile(zip_path, "w") as zip_file:
             zip_file.write(csv_file, arcname=settings.PROCESSED_CSV_NAME)
-            for plan in plans:
+            for plan in plans.iterator():
                 plan_count += 1
-                zip_file.write(plan.file.path, arcname=basename(plan.file.path))
+                name = basename(plan.file.path)
+                zip_file.write(plan.file.path, arcname=name)
+                # along with the text stored by extract_plan_text
+                if plan.text:
+                    zip_file.writestr(
+                        join("text", splitext(name)[0] + ".txt"), plan.text
+                    )
 
         print("zip file with %d plans generated" % plan_count)
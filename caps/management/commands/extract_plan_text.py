@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from caps.models import PlanDocument
+
+
+class Command(BaseCommand):
+    help = "Stores the text of plan documents whose files have changed"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Extract the text of every document, even if it's not changed",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=None,
+            help="Number of processes to extract text with (default: one per CPU)",
+        )
+
+    def handle(self, *args, **options):
+        count = PlanDocument.update_text(
+            workers=options["workers"], rebuild=options["all"]
+        )
+        self.stdout.write(f"Extracted text for {count} plan documents")
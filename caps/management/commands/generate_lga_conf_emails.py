@@ -83,7 +83,7 @@ class Command(BaseCommand):
                 )
                 for group in related_councils:
                     for c in group["councils"]:
-                        c.plan_overlap = related_councils_intersection[c]
+                        c.plan_overlap = related_councils_intersection[c.council]
                     if group["type"].slug == "composite":
                         context["twin"] = group["councils"][0]
 
@@ -3,7 +3,7 @@ import requests
 
 import pandas as pd
 
-from caps.models import Council, PlanDocument
+from caps.models import Council, CouncilProfileSnapshot, PlanDocument
 from pathlib import Path
 from django.core.management.base import BaseCommand
 from django.core.files import File
@@ -119,3 +119,5 @@ class Command(BaseCommand):
                 title=f"{start_year} Citizens Assembly report",
             ).save()
             document_file.close()
+
+        CouncilProfileSnapshot.mark_stale()
@@ -7,7 +7,7 @@ from django.core.management.base import BaseCommand
 from django.conf import settings
 from django.db import transaction
 
-from caps.models import Council, CouncilProject
+from caps.models import Council, CouncilProfileSnapshot, CouncilProject
 
 
 class Command(BaseCommand):
@@ -17,6 +17,7 @@ class Command(BaseCommand):
         self.options = options
 
         self.import_projects()
+        CouncilProfileSnapshot.mark_stale()
 
     @transaction.atomic
     def import_projects(self):
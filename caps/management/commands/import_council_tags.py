@@ -6,7 +6,7 @@ from django.conf import settings
 
 from django.db.models import F
 
-from caps.models import Tag, CouncilTag, Council
+from caps.models import Tag, CouncilTag, Council, CouncilProfileSnapshot
 from scoring.models import PlanSectionScore, PlanScore, PlanQuestionScore
 from caps.import_utils import get_google_sheet_as_csv, replace_csv_headers
 
@@ -180,3 +180,4 @@ class Command(BaseCommand):
         replace_headers()
         create_tags()
         create_council_tags()
+        CouncilProfileSnapshot.mark_stale()
@@ -6,7 +6,12 @@ from django.core.management.base import BaseCommand
 from django.conf import settings
 from django.db import transaction
 
-from caps.models import Council, EmergencyDeclaration
+from caps.models import (
+    Council,
+    CouncilProfileSnapshot,
+    EmergencyDeclaration,
+    RelatedCouncilGroups,
+)
 from caps.utils import char_from_text, date_from_text
 from caps.import_utils import (
     add_authority_codes,
@@ -15,7 +20,6 @@ from caps.import_utils import (
     replace_csv_headers,
 )
 
-
 good_data = False
 
 
@@ -150,3 +154,5 @@ class Command(BaseCommand):
         add_gss_codes(settings.DECLARATIONS_CSV)
         print("importing the declarations")
         import_declarations()
+        RelatedCouncilGroups.build()
+        CouncilProfileSnapshot.mark_stale()
@@ -3,7 +3,14 @@ Import local authority_emissions
 """
 
 import pandas as pd
-from caps.models import Council, DataPoint, DataType
+from caps.models import (
+    Council,
+    CouncilProfileSnapshot,
+    DataPoint,
+    DataType,
+    DataVersion,
+    EmissionsSeries,
+)
 from django.core.management.base import BaseCommand
 from django.db.models import Count
 from mysoc_dataset import get_dataset_url
@@ -75,15 +82,18 @@ def check_completeness():
         print(f"No data for {council.name} {council.gss_code}")
 
 
-def import_emissions_data() -> None:
+def import_emissions_data() -> bool:
     """
-    Load information from BEIS data into DataPoints in the database
+    Load information from BEIS data into DataPoints in the database. Returns
+    whether anything changed.
     """
 
-    councils = {x.authority_code: x for x in Council.objects.all()}
-    data_types = {
-        x.name: x for x in DataType.objects.filter(source_url=get_emissions_url())
-    }
+    council_ids = dict(Council.objects.values_list("authority_code", "id"))
+    data_type_ids = dict(
+        DataType.objects.filter(source_url=get_emissions_url()).values_list(
+            "name", "id"
+        )
+    )
 
     df = (
         get_emissions_data()
@@ -93,36 +103,24 @@ def import_emissions_data() -> None:
             var_name="name_and_unit",
             value_name="value",
         )
+        .rename(columns={"Year": "year"})
     )
 
-    # create column with the council objects and remove any rows without a council in the database
-    df["council_obj"] = df["local-authority-code"].apply(
-        lambda x: councils.get(x, None)
-    )
-    df = df[~df["council_obj"].isna()]
-
-    # get the DataType object
-    df["data_type_obj"] = df["name_and_unit"].apply(
-        lambda x: data_types[x.split(":")[0]]
-    )
+    # remove any rows without a council in the database
+    df["council_id"] = df["local-authority-code"].map(council_ids)
+    df = df[~df["council_id"].isna()]
 
-    # get series with data points
-    def create_data_point(row: pd.Series) -> DataPoint:
-        return DataPoint(
-            year=row["Year"],
-            value=row["value"],
-            council=row["council_obj"],
-            data_type=row["data_type_obj"],
-        )
+    names = df["name_and_unit"].str.split(":").str[0]
+    df["data_type_id"] = names.map(data_type_ids)
+    missing = names[df["data_type_id"].isna()].unique()
+    if len(missing) > 0:
+        raise KeyError(f"No data types for {', '.join(missing)}")
 
-    data_points = df.apply(create_data_point, axis="columns")
+    print("Updating DataPoints")
+    created, updated, deleted = DataPoint.load(df, DataType.DataCollection.EMISSIONS)
+    print(f"{created} created, {updated} updated, {deleted} deleted")
 
-    # delete and create data points in bulk
-    print("Deleting and creating DataPoints")
-    DataPoint.objects.filter(
-        data_type__collection=DataType.DataCollection.EMISSIONS
-    ).delete()
-    DataPoint.objects.bulk_create(data_points.tolist(), batch_size=1000)
+    return created + updated + deleted > 0
 
 
 class Command(BaseCommand):
@@ -157,6 +155,11 @@ class Command(BaseCommand):
             print("Creating data types")
             create_data_types()
             print("Importing emissions data")
-            import_emissions_data()
+            changed = import_emissions_data()
             print("Checking completeness")
             check_completeness()
+            if changed:
+                print("Building emissions series")
+                EmissionsSeries.build()
+                DataVersion.bump(DataVersion.EMISSIONS)
+                CouncilProfileSnapshot.mark_stale()
@@ -5,7 +5,7 @@ import pandas as pd
 from django.conf import settings
 
 from caps.import_utils import BaseImportCommand
-from caps.models import PlanDocument
+from caps.models import CouncilProfileSnapshot, PlanDocument
 from scoring.models import PlanScore
 
 FILTER_JSON = join(settings.DATA_DIR, "league_filters.json")
@@ -86,3 +86,4 @@ class Command(BaseImportCommand):
 
         with self.get_atomic_context(commit):
             self.import_filters()
+            CouncilProfileSnapshot.mark_stale()
@@ -9,8 +9,14 @@ from django.core.files import File
 from django.core.management.base import BaseCommand, CommandError
 from django.db.models import Count, Q
 from django.template.defaultfilters import pluralize
+from simple_history.utils import bulk_create_with_history, bulk_update_with_history
 
-from caps.models import Council, PlanDocument
+from caps.models import (
+    Council,
+    CouncilProfileSnapshot,
+    PlanDocument,
+    RelatedCouncilGroups,
+)
 from caps.utils import (
     boolean_from_text,
     char_from_text,
@@ -31,11 +37,47 @@ class Command(BaseCommand):
         set()
     )  # set of gss codes of councils with at least one plan
     plans_to_process = {}
+    plan_ids_to_update = {}  # plan document ids for rows that change a plan
+    plan_ids_to_delete = []
     start_council_plan_count = 0
     end_council_plan_count = 0
     start_plan_count = 0
     end_plan_count = 0
 
+    # fields set from the sheet by get_plan_defaults_from_row
+    PLAN_FIELDS = [
+        "document_type",
+        "scope",
+        "status",
+        "well_presented",
+        "baseline_analysis",
+        "notes",
+        "file_type",
+        "charset",
+        "etag",
+        "last_modified",
+        "start_year",
+        "end_year",
+        "date_last_found",
+        "title",
+    ]
+    # fields that can change on existing councils
+    COUNCIL_FIELDS = [
+        "authority_type",
+        "replaced_by",
+        "start_date",
+        "end_date",
+        "name",
+        "slug",
+        "gss_code",
+        "website_url",
+        "twitter_url",
+        "twitter_name",
+        "region",
+        "county",
+        "population",
+    ]
+
     def add_arguments(self, parser):
         parser.add_argument(
             "--confirm_changes", action="store_true", help="make updates to database"
@@ -51,8 +93,31 @@ class Command(BaseCommand):
         elif self.changes == True:
             self.print_change("call with --confirm_changes to update database")
 
+    def get_existing_plans(self):
+        """
+        All the plan documents in the database, one row per (gss_code, url)
+        """
+        fields = [
+            "id",
+            "council__gss_code",
+            "council__name",
+            "url",
+            *self.PLAN_FIELDS,
+        ]
+        # keep as objects so nulls stay None to compare with the sheet
+        plans = pd.DataFrame(
+            list(PlanDocument.objects.values_list(*fields).order_by("id")),
+            columns=fields,
+            dtype=object,
+        )
+
+        return plans.rename(
+            columns={"council__gss_code": "gss_code", "council__name": "council"}
+        )
+
     def get_changes(self):
         self.plans_to_process = {}
+        self.plan_ids_to_update = {}
         df = pd.read_csv(settings.PROCESSED_CSV)
         council_add_count = 0
         plan_add_count = 0
@@ -76,49 +141,64 @@ class Command(BaseCommand):
             | Q(document_type=PlanDocument.CLIMATE_STRATEGY)
         ).count()
 
+        councils = dict(
+            Council.objects.exclude(gss_code=None)
+            .order_by("name")
+            .values_list("gss_code", "name")
+        )
+        existing = self.get_existing_plans()
+
+        df["gss_code"] = df["gss_code"].map(char_from_text)
+        council_exists = df["gss_code"].isin(councils.keys())
+        has_plan = df["url"].notna()
+
+        # line up the existing plan, if any, with each row in the sheet that
+        # should have one in the database
+        sheet_plans = df.loc[council_exists & has_plan]
+        matched = (
+            existing.drop_duplicates(["gss_code", "url"])
+            .set_index(["gss_code", "url"])
+            .reindex(pd.MultiIndex.from_frame(sheet_plans[["gss_code", "url"]]))
+            .set_axis(sheet_plans.index)
+        )
+
         for index, row in df.iterrows():
-            gss_code = char_from_text(row["gss_code"])
+            gss_code = row["gss_code"]
             councils_in_sheet.update([gss_code])
 
-            council_exists = Council.objects.filter(gss_code=gss_code).exists()
-
-            if not council_exists:
+            if not council_exists[index]:
                 council_add_count += 1
                 self.print_change("adding new council: %s", row["council"], verbosity=2)
-                if not pd.isnull(row["url"]):
+                if has_plan[index]:
                     self.plans_to_process[index] = "new_council"
                     councils_with_plan_in_sheet.update([gss_code])
                     plan_add_count += 1
                     self.print_change(
                         "adding new plan for %s", row["council"], verbosity=2
                     )
-            elif not pd.isnull(row["url"]):
+            elif has_plan[index]:
                 councils_with_plan_in_sheet.update([gss_code])
-                council = Council.objects.get(gss_code=gss_code)
-                plan_exists = PlanDocument.objects.filter(
-                    council=council, url=row["url"]
-                ).exists()
 
                 council_plans = plans_to_import.get(gss_code, set())
                 council_plans.update([row["url"]])
                 plans_to_import[gss_code] = council_plans
-                if not plan_exists:
+                plan = matched.loc[index]
+                if pd.isna(plan["id"]):
                     self.plans_to_process[index] = "add"
                     plan_add_count += 1
                     self.print_change(
                         "adding new plan for %s", row["council"], verbosity=2
                     )
                 else:
-                    plan = PlanDocument.objects.get(council=council, url=row["url"])
-                    diffs = 0
-                    diff_keys = []
-                    for key, value in self.get_plan_defaults_from_row(row).items():
-                        if getattr(plan, key) != value:
-                            diffs = 1
-                            diff_keys.append(key)
-
-                    if diffs != 0:
+                    diff_keys = [
+                        key
+                        for key, value in self.get_plan_defaults_from_row(row).items()
+                        if plan[key] != value
+                    ]
+
+                    if diff_keys:
                         self.plans_to_process[index] = "update"
+                        self.plan_ids_to_update[index] = plan["id"]
                         plan_update_count += 1
                         self.print_change(
                             "updating plan for %s (%s changed)",
@@ -127,63 +207,65 @@ class Command(BaseCommand):
                             verbosity=2,
                         )
 
+        # plans for councils in the sheet that are no longer listed, apart from
+        # citizens assemblies which are imported separately
         plans_to_delete = {}
-        plans_to_delete_count = 0
+        self.plan_ids_to_delete = []
+        removed = existing.loc[
+            existing["gss_code"].isin(plans_to_import.keys())
+            & (existing["document_type"] != PlanDocument.CITIZENS_ASSEMBLY)
+        ]
+        removed = removed.loc[
+            [
+                url not in plans_to_import[gss_code]
+                for gss_code, url in zip(removed["gss_code"], removed["url"])
+            ]
+        ]
         for council_code in plans_to_import.keys():
-            council = Council.objects.get(gss_code=council_code)
-            plans = (
-                PlanDocument.objects.filter(
-                    council=council,
-                )
-                .exclude(
-                    url__in=plans_to_import[council_code],
-                )
-                .exclude(
-                    document_type=PlanDocument.CITIZENS_ASSEMBLY,
-                )
-            )
-            for plan in plans:
-                plans_to_delete_count += 1
+            for plan in removed.loc[removed["gss_code"] == council_code].itertuples():
                 council_plans = plans_to_delete.get(council_code, set())
                 council_plans.update([plan.url])
                 self.print_change(
                     "deleting plan for %s - %s (%s)",
-                    council.name,
+                    plan.council,
                     plan.title,
                     plan.document_type,
                     verbosity=2,
                 )
                 plans_to_delete[council_code] = council_plans
+                self.plan_ids_to_delete.append(plan.id)
+        plans_to_delete_count = len(self.plan_ids_to_delete)
 
         # if a council isn't in the sheet we should remove it entirely from the database
-        councils_to_remove = Council.objects.exclude(gss_code__in=councils_in_sheet)
-        councils_to_remove_count = councils_to_remove.count()
+        councils_to_remove = [
+            name
+            for gss_code, name in councils.items()
+            if gss_code not in councils_in_sheet
+        ]
 
         # if a council is going to be removed completely then exclude it from the
         # list of councils where we're going to remove the plans
-        councils_with_plans_to_remove = set(
-            [council.gss_code for council in councils_to_remove]
-        )
+        councils_with_plans_to_remove = set(councils.keys()) - councils_in_sheet
         if councils_with_plans_to_remove:
             councils_with_plan_in_sheet.update(councils_with_plans_to_remove)
 
         # if a council is in the sheet but no longer has a plan we should remove all
         # their plans
-        plans_from_removed_councils = PlanDocument.objects.exclude(
-            council__gss_code__in=councils_with_plan_in_sheet
-        )
-        plans_from_removed_councils_count = plans_from_removed_councils.count()
+        plans_from_removed_councils = existing.loc[
+            existing["gss_code"].notna()
+            & ~existing["gss_code"].isin(councils_with_plan_in_sheet)
+        ]
+        plans_from_removed_councils_count = len(plans_from_removed_councils)
 
         if self.verbosity >= 2:
-            councils = councils_to_remove.all()
-            for council in councils:
-                self.print_change("%s will be completely removed" % council.name)
+            for name in councils_to_remove:
+                self.print_change("%s will be completely removed" % name)
 
-            councils = plans_from_removed_councils.distinct("council__gss_code")
-            for council in councils:
-                self.print_change(
-                    "%s will have all plans removed" % council.council.name
-                )
+            councils = plans_from_removed_councils.sort_values(
+                "gss_code"
+            ).drop_duplicates("gss_code")
+            for name in councils["council"]:
+                self.print_change("%s will have all plans removed" % name)
 
         self.plans_to_delete = plans_to_delete
         self.councils_in_sheet = councils_in_sheet
@@ -218,6 +300,126 @@ class Command(BaseCommand):
                 pluralize(plans_from_removed_councils_count),
             )
 
+    def update_council(self, council, row):
+        """
+        Update the council from the sheet, returning True if anything changed
+        """
+        changed = False
+
+        council_url = char_from_text(row["website_url"])
+        twitter_url = char_from_text(row["twitter_url"])
+        twitter_name = char_from_text(row["twitter_name"])
+        region = char_from_text(row["region"])
+        county = char_from_text(row["county"])
+        population = integer_from_text(row["population"]) or 0
+
+        if char_from_text(row["authority_type"]) != council.authority_type:
+            council.authority_type = char_from_text(row["authority_type"])
+            changed = True
+
+        if char_from_text(row["replaced-by"]) != council.replaced_by:
+            council.replaced_by = char_from_text(row["replaced-by"])
+            changed = True
+
+        if row["start-date"] != council.start_date:
+            council.start_date = row["start-date"]
+            changed = True
+
+        if row["end-date"] != council.end_date:
+            council.end_date = row["end-date"]
+            changed = True
+
+        if row["council"] != council.name:
+            council.name = row["council"]
+            council.slug = PlanDocument.council_slug(row["council"])
+            changed = True
+
+        if char_from_text(row["gss_code"]) != council.gss_code:
+            council.gss_code = char_from_text(row["gss_code"])
+            changed = True
+
+        if council_url != "" and council.website_url != council_url:
+            council.website_url = council_url
+            changed = True
+
+        if (
+            council.twitter_name != ""
+            or council.twitter_name != twitter_name
+            or council.twitter_url != twitter_url
+        ):
+            council.twitter_url = twitter_url
+            council.twitter_name = twitter_name
+            changed = True
+
+        if council.region != region:
+            council.region = region
+            changed = True
+
+        if council.county != county:
+            council.county = county
+            changed = True
+
+        if council.population != population:
+            council.population = population
+            changed = True
+
+        return changed
+
+    def new_council(self, row):
+        return Council(
+            authority_code=char_from_text(row["authority_code"]),
+            country=Council.country_code(row["country"]),
+            authority_type=char_from_text(row["authority_type"]),
+            name=row["council"],
+            slug=PlanDocument.council_slug(row["council"]),
+            gss_code=char_from_text(row["gss_code"]),
+            whatdotheyknow_id=integer_from_text(row["wdtk_id"]),
+            mapit_area_code=char_from_text(row["mapit_area_code"]),
+            website_url=char_from_text(row["website_url"]),
+            twitter_url=char_from_text(row["twitter_url"]),
+            twitter_name=char_from_text(row["twitter_name"]),
+            county=char_from_text(row["county"]),
+            region=char_from_text(row["region"]),
+            population=integer_from_text(row["population"]) or 0,
+            start_date=row["start-date"],
+            end_date=row["end-date"],
+            replaced_by=char_from_text(row["replaced-by"]),
+        )
+
+    def update_councils(self, df):
+        """
+        Create or update a council for every row in the sheet, returning the
+        council for each row
+        """
+        councils = {
+            (council.authority_code, council.country): council
+            for council in Council.objects.all()
+        }
+        to_create = {}
+        to_update = {}
+        row_councils = {}
+
+        for index, row in df.iterrows():
+            key = (
+                char_from_text(row["authority_code"]),
+                Council.country_code(row["country"]),
+            )
+            council = councils.get(key)
+            if council is None:
+                council = to_create.get(key)
+            if council is None:
+                council = self.new_council(row)
+                to_create[key] = council
+            elif self.update_council(council, row) and council.pk is not None:
+                to_update[key] = council
+
+            row_councils[index] = council
+
+        Council.objects.bulk_create(to_create.values())
+        Council.objects.bulk_update(to_update.values(), self.COUNCIL_FIELDS)
+
+        return row_councils
+
     def update_database(self):
         df = pd.read_csv(settings.PROCESSED_CSV)
 
@@ -234,124 +436,74 @@ class Command(BaseCommand):
 
         # where gss-code is blank, use the authority code
         df["gss_code"] = df["gss_code"].fillna("temp" + df["authority_code"])
-        for index, row in df.iterrows():
-            council_url = char_from_text(row["website_url"])
-            twitter_url = char_from_text(row["twitter_url"])
-            twitter_name = char_from_text(row["twitter_name"])
-            region = char_from_text(row["region"])
-            county = char_from_text(row["county"])
-            population = integer_from_text(row["population"]) or 0
-            council, created = Council.objects.get_or_create(
-                authority_code=char_from_text(row["authority_code"]),
-                country=Council.country_code(row["country"]),
-                defaults={
-                    "authority_type": char_from_text(row["authority_type"]),
-                    "name": row["council"],
-                    "slug": PlanDocument.council_slug(row["council"]),
-                    "gss_code": char_from_text(row["gss_code"]),
-                    "whatdotheyknow_id": integer_from_text(row["wdtk_id"]),
-                    "mapit_area_code": char_from_text(row["mapit_area_code"]),
-                    "website_url": council_url,
-                    "twitter_url": twitter_url,
-                    "twitter_name": twitter_name,
-                    "county": county,
-                    "region": region,
-                    "population": population,
-                    "start_date": row["start-date"],
-                    "end_date": row["end-date"],
-                    "replaced_by": char_from_text(row["replaced-by"]),
-                },
-            )
+        councils = self.update_councils(df)
 
-            # check the council things that might change
-            changed = False
-
-            if char_from_text(row["authority_type"]) != council.authority_type:
-                council.authority_type = char_from_text(row["authority_type"])
-                changed = True
-
-            if char_from_text(row["replaced-by"]) != council.replaced_by:
-                council.replaced_by = char_from_text(row["replaced-by"])
-                changed = True
-
-            if row["start-date"] != council.start_date:
-                council.start_date = row["start-date"]
-                changed = True
-
-            if row["end-date"] != council.start_date:
-                council.end_date = row["end-date"]
-                changed = True
-
-            if row["council"] != council.name:
-                council.name = row["council"]
-                council.slug = PlanDocument.council_slug(row["council"])
-                changed = True
-
-            if char_from_text(row["gss_code"]) != council.gss_code:
-                council.gss_code = char_from_text(row["gss_code"])
-                changed = True
-
-            if council_url != "" and council.website_url != council_url:
-                council.website_url = council_url
-                changed = True
-
-            if (
-                council.twitter_name != ""
-                or council.twitter_name != twitter_name
-                or council.twitter_url != twitter_url
-            ):
-                council.twitter_url = twitter_url
-                council.twitter_name = twitter_name
-                changed = True
-
-            if council.region != region:
-                council.region = region
-                changed = True
-
-            if council.county != county:
-                council.county = county
-                changed = True
-
-            if council.population != population:
-                council.population = population
-                changed = True
-
-            if changed is True:
-                council.save()
-
-            if not pd.isnull(row["url"]) and index in self.plans_to_process:
-                document_file = open(row["plan_path"], "rb")
-                file_object = File(document_file)
-                defaults = {"file": file_object}
-                defaults.update(self.get_plan_defaults_from_row(row))
-
-                plan_document, created = PlanDocument.objects.update_or_create(
+        # the text is stored separately by update_text so isn't needed here
+        plans_to_update = PlanDocument.objects.defer("text").in_bulk(
+            self.plan_ids_to_update.values()
+        )
+        # rows for a council whose gss_code has changed look like new councils
+        # to get_changes, but update_councils has matched them to the existing
+        # council so any plan it already has should be updated
+        existing_plans = {
+            (plan.council_id, plan.url): plan
+            for plan in PlanDocument.objects.filter(
+                council__in={council.pk for council in councils.values()}
+            )
+            .defer("text")
+            .order_by("-id")
+        }
+        to_create = {}
+        to_update = {}
+        for index, row in df.loc[df["url"].notna()].iterrows():
+            if index not in self.plans_to_process:
+                continue
+
+            council = councils[index]
+            key = (council.pk, row["url"])
+            plan = to_create.get(key) or to_update.get(key)
+            if plan is None and index in self.plan_ids_to_update:
+                plan = plans_to_update[self.plan_ids_to_update[index]]
+                to_update[key] = plan
+            elif plan is None and key in existing_plans:
+                plan = existing_plans[key]
+                to_update[key] = plan
+            elif plan is None:
+                plan = PlanDocument(
                     url=row["url"],
                     url_hash=PlanDocument.make_url_hash(row["url"]),
                     council=council,
-                    defaults=defaults,
+                    date_first_found=date_from_text(row["date_retrieved"]),
                 )
-                if created:
-                    plan_document.date_first_found = date_from_text(
-                        row["date_retrieved"]
-                    )
-                    plan_document.save()
+                to_create[key] = plan
+
+            for key, value in self.get_plan_defaults_from_row(row).items():
+                setattr(plan, key, value)
+            plan.updated_at = date.today()
+            with open(row["plan_path"], "rb") as document_file:
+                plan.file.save(document_file.name, File(document_file), save=False)
+
+        bulk_create_with_history(to_create.values(), PlanDocument)
+        bulk_update_with_history(
+            to_update.values(),
+            PlanDocument,
+            [*self.PLAN_FIELDS, "file", "updated_at"],
+        )
+        PlanDocument.update_text([*to_create.values(), *to_update.values()])
 
         PlanDocument.objects.exclude(
             council__gss_code__in=self.councils_with_plan_in_sheet
         ).delete()
 
-        for council_code in self.plans_to_delete.keys():
-            council = Council.objects.get(gss_code=council_code)
-            plans = PlanDocument.objects.filter(
-                council=council, url__in=self.plans_to_delete[council_code]
-            ).delete()
+        PlanDocument.objects.filter(id__in=self.plan_ids_to_delete).delete()
 
         # Delete all plans if the council has been removed from the sheet
         # But do not delete the council itself (councils without plans are fine)
         PlanDocument.objects.exclude(
             council__gss_code__in=self.councils_in_sheet
         ).delete()
+        RelatedCouncilGroups.build()
+        CouncilProfileSnapshot.mark_stale()
 
         self.end_council_plan_count = (
             Council.objects.annotate(num_plans=Count("plandocument"))
@@ -369,7 +521,7 @@ class Command(BaseCommand):
         ).count()
 
     def get_plan_defaults_from_row(self, row):
-        (start_year, end_year) = PlanDocument.start_and_end_year_from_time_period(
+        start_year, end_year = PlanDocument.start_and_end_year_from_time_period(
             row["time_period"]
         )
         defaults = {
@@ -381,6 +533,9 @@ class Command(BaseCommand):
             "notes": char_from_text(row["notes"]),
             "file_type": char_from_text(row["file_type"]),
             "charset": char_from_text(row["charset"]),
+            # only in sheets from preprocess
+            "etag": char_from_text(row.get("etag")),
+            "last_modified": char_from_text(row.get("last_modified")),
             "start_year": start_year,
             "end_year": end_year,
             "date_last_found": date_from_text(row["date_retrieved"]),
@@ -3,15 +3,16 @@ Import local authority_emissions
 """
 
 import pandas as pd
-from caps.models import Council, DataPoint, DataType
+from caps.models import Council, CouncilProfileSnapshot, DataPoint, DataType
 from django.core.management.base import BaseCommand
 from django.db.models import Count
 from mysoc_dataset import get_dataset_url, get_dataset_df
 
 
-def create_data_types():
+def create_data_types() -> bool:
     """
-    Create data types to capture the local authority polling
+    Create data types to capture the local authority polling. Returns whether
+    any were added or removed.
     """
     url = get_dataset_url(
         repo_name="climate_mrp_polling",
@@ -23,26 +24,42 @@ def create_data_types():
 
     df = pd.read_csv(url)
 
-    data_types = []
+    existing = {
+        (x.name_in_source, x.name): x
+        for x in DataType.objects.filter(collection=DataType.DataCollection.POLLING)
+    }
+
+    # keep the existing data types so their data points can be updated in place
+    new_types = []
+    updated_types = []
     print("Creating data types")
     for index, row in df.iterrows():
-        d = DataType(
-            name=row["short"],
-            source_url=url,
-            name_in_source=row["source"],
-            unit="percentage",
-            collection=DataType.DataCollection.POLLING,
-        )
-        data_types.append(d)
+        d = existing.pop((row["source"], row["short"]), None)
+        if d is None:
+            new_types.append(
+                DataType(
+                    name=row["short"],
+                    source_url=url,
+                    name_in_source=row["source"],
+                    unit="percentage",
+                    collection=DataType.DataCollection.POLLING,
+                )
+            )
+        elif d.source_url != url:
+            d.source_url = url
+            updated_types.append(d)
 
     print("Loading to database")
-    DataType.objects.filter(collection=DataType.DataCollection.POLLING).delete()
-    DataType.objects.bulk_create(data_types)
+    DataType.objects.filter(pk__in=[x.pk for x in existing.values()]).delete()
+    DataType.objects.bulk_update(updated_types, ["source_url"])
+    DataType.objects.bulk_create(new_types)
+
+    return bool(existing or new_types)
 
 
-def import_polling_data():
+def import_polling_data() -> bool:
     """
-    Load polling data for local authorities
+    Load polling data for local authorities. Returns whether anything changed.
     """
 
     df = get_dataset_df(
@@ -53,28 +70,34 @@ def import_polling_data():
         done_survey=True,
     )
 
-    councils = {x.authority_code: x for x in Council.objects.all()}
-    types = {f"{x.name_in_source}-{x.name}": x for x in DataType.objects.all()}
+    council_ids = dict(Council.objects.values_list("authority_code", "id"))
+    data_type_ids = {
+        f"{name_in_source}-{name}": id
+        for id, name_in_source, name in DataType.objects.filter(
+            collection=DataType.DataCollection.POLLING
+        ).values_list("id", "name_in_source", "name")
+    }
 
-    new_points = []
     print("Creating data points")
-    for index, row in df.iterrows():
-        lookup_id = f"{row['source']}-{row['question']}"
-        council = councils.get(row["local-authority-code"], None)
-        if council is None:
-            print(f"Skipping {row['local-authority-code']}")
-            continue
-        data_type = types[lookup_id]
-        d = DataPoint(
-            year=2022, council=council, data_type=data_type, value=row["percentage"]
-        )
-        new_points.append(d)
+    df["council_id"] = df["local-authority-code"].map(council_ids)
+    for code in df.loc[df["council_id"].isna(), "local-authority-code"]:
+        print(f"Skipping {code}")
+    df = df[~df["council_id"].isna()]
+
+    lookup_ids = df["source"] + "-" + df["question"]
+    df["data_type_id"] = lookup_ids.map(data_type_ids)
+    missing = lookup_ids[df["data_type_id"].isna()].unique()
+    if len(missing) > 0:
+        raise KeyError(f"No data types for {', '.join(missing)}")
+
+    df["year"] = 2022
+    df["value"] = df["percentage"]
+
     print("Loading to database")
+    created, updated, deleted = DataPoint.load(df, DataType.DataCollection.POLLING)
+    print(f"{created} created, {updated} updated, {deleted} deleted")
 
-    polling_types = DataType.objects.filter(collection=DataType.DataCollection.POLLING)
-    polling_points = DataPoint.objects.filter(data_type__in=polling_types)
-    polling_points.delete()
-    DataPoint.objects.bulk_create(new_points)
+    return created + updated + deleted > 0
 
 
 class Command(BaseCommand):
@@ -109,6 +132,8 @@ class Command(BaseCommand):
             print("Polling data exists, skipping")
         else:
             print("Creating data types")
-            create_data_types()
+            types_changed = create_data_types()
             print("Importing polling data")
-            import_polling_data()
+            points_changed = import_polling_data()
+            if types_changed or points_changed:
+                CouncilProfileSnapshot.mark_stale()
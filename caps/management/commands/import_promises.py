@@ -6,7 +6,13 @@ from django.core.management.base import BaseCommand, CommandError
 from django.conf import settings
 from django.db import transaction
 
-from caps.models import Council, PlanDocument, Promise
+from caps.models import (
+    Council,
+    CouncilProfileSnapshot,
+    PlanDocument,
+    Promise,
+    RelatedCouncilGroups,
+)
 from caps.import_utils import add_authority_codes, add_gss_codes
 from caps.utils import char_from_text
 
@@ -76,3 +82,5 @@ class Command(BaseCommand):
 
     def handle(self, *args, **options):
         import_promises()
+        RelatedCouncilGroups.build()
+        CouncilProfileSnapshot.mark_stale()
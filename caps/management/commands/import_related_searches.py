@@ -2,16 +2,27 @@
 Importer for related search terms
 """
 
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
 from pathlib import Path
 from typing import Optional
 
 import requests
 from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
 from tqdm import tqdm
 
-from caps.models import CachedSearch, KeyPhrase, KeyPhrasePairWise, PlanDocument
+from caps.models import (
+    CachedSearch,
+    DataVersion,
+    KeyPhrase,
+    KeyPhrasePairWise,
+    PlanDocument,
+)
 from caps.search_funcs import (
+    KeyPhraseMatcher,
     condense_highlights,
     fuller_highlighter_config,
     get_semantic_query,
@@ -35,57 +46,107 @@ def fetch_data():
     Path("data", "ml_keyphrases_pairwise.csv").write_bytes(pairwise_file.content)
 
 
-def run_recent_searches(verbose: bool = False):
+def run_changed_searches(verbose: bool = False, workers: int = 1):
+    """
+    Run searches just for documents that have changed since the searches were
+    last run, or were first found in the last two weeks if that's not known.
+    """
+    last_run = DataVersion.get_updated(DataVersion.CACHED_SEARCHES)
+    if last_run is None:
+        week_ago = datetime.now() - timedelta(days=14)
+        docs = PlanDocument.objects.filter(date_first_found__gte=week_ago)
+    else:
+        # updated_at is only a date so this includes anything from that day
+        docs = PlanDocument.objects.filter(
+            Q(updated_at__gte=last_run.date()) | Q(text_updated__gte=last_run)
+        )
+    ids = list(docs.values_list("id", flat=True))
+    print(f"Found {len(ids)} changed documents to update search results")
+    if ids:
+        run_searches(verbose=verbose, limit_to_ids=ids, workers=workers)
+
+
+def search_keyphrase(
+    keyphrase: KeyPhrase,
+    matcher: KeyPhraseMatcher,
+    limit_to_ids: Optional[list[int]] = None,
+) -> list[tuple[int, int]]:
     """
-    Run searches just for documents that were first found in the two weeks
+    Run the search for a keyphrase in haystack and return the id of each
+    document it was found in with the number of times it was found. This only
+    talks to solr so can run in a thread.
     """
-    week_ago = datetime.now() - timedelta(days=14)
-    docs = PlanDocument.objects.filter(date_first_found__gte=week_ago)
-    ids = [d.id for d in docs]
-    print(f"Found {len(ids)} recent documents to update search results")
-    run_searches(verbose=verbose, limit_to_ids=ids)
+    sqs, _ = get_semantic_query(
+        keyphrase.keyphrase, limit_to_ids=limit_to_ids, matcher=matcher
+    )
+    results = sqs.highlight(**fuller_highlighter_config)
+    results, _ = condense_highlights(results, [])
+
+    counts = []
+    for r in results:
+        # get number of times phrases were found in document
+        if "text" in r.highlighted:
+            highlighted = " ".join(r.highlighted["text"])
+            # count the number of marks
+            count = highlighted.count("<mark>")
+        else:
+            count = 0
+        counts.append((int(r.pk), count))
+
+    return counts
 
 
-def run_searches(verbose: bool = False, limit_to_ids: Optional[list[int]] = None):
+def run_searches(
+    verbose: bool = False,
+    limit_to_ids: Optional[list[int]] = None,
+    workers: int = 1,
+):
     """
     For each primary related search term, run the search in haystack and save the results
+
+    Searches run across a pool of worker threads, each of which keeps its own
+    connection to solr. The saved results are only replaced once every search
+    has finished.
     """
+    # documents changed while the searches run are picked up next time
+    started = timezone.now()
     new_searches = []
     allowed_keyphrases = list(KeyPhrase.valid_keyphrases())
+    matcher = KeyPhraseMatcher.get()
     if verbose:
         print(f"Checking {len(allowed_keyphrases)} keyphrases")
-    for keyphrase in tqdm(allowed_keyphrases, disable=not verbose):
-        if verbose:
-            tqdm.write(f"Running search for {keyphrase.keyphrase}")
-        sqs, _ = get_semantic_query(keyphrase.keyphrase, limit_to_ids=limit_to_ids)
-        results = sqs.highlight(**fuller_highlighter_config)
-        if verbose:
-            tqdm.write(f"Found {len(results)} matched documents")
-
-        results, _ = condense_highlights(results, [])
-
-        for r in results:
-            doc_id = r.object.id
-
-            # get number of times phrases were found in document
-            if "text" in r.highlighted:
-                highlighted = " ".join(r.highlighted["text"])
-                # count the number of marks
-                count = highlighted.count("<mark>")
-            else:
-                count = 0
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+        for keyphrase in allowed_keyphrases:
+            future = executor.submit(search_keyphrase, keyphrase, matcher, limit_to_ids)
+            futures[future] = keyphrase
+
+        for future in tqdm(
+            as_completed(futures), total=len(futures), disable=not verbose
+        ):
+            keyphrase = futures[future]
+            counts = future.result()
             if verbose:
-                tqdm.write(f"{doc_id} {count} {keyphrase.keyphrase}")
-            if count > 0:
-                new_searches.append(
-                    CachedSearch(search_term=keyphrase, document_id=doc_id, count=count)
+                tqdm.write(
+                    f"Found {len(counts)} matched documents for {keyphrase.keyphrase}"
                 )
 
-    if limit_to_ids:
-        CachedSearch.objects.filter(document_id__in=limit_to_ids).delete()
-    else:
-        CachedSearch.objects.all().delete()
-    CachedSearch.objects.bulk_create(new_searches)
+            for doc_id, count in counts:
+                if count > 0:
+                    new_searches.append(
+                        CachedSearch(
+                            search_term=keyphrase, document_id=doc_id, count=count
+                        )
+                    )
+
+    with transaction.atomic():
+        if limit_to_ids:
+            CachedSearch.objects.filter(document_id__in=limit_to_ids).delete()
+        else:
+            CachedSearch.objects.all().delete()
+        CachedSearch.objects.bulk_create(new_searches, batch_size=1000)
+        DataVersion.bump(DataVersion.CACHED_SEARCHES, updated=started)
 
 
 class Command(BaseCommand):
@@ -102,6 +163,12 @@ class Command(BaseCommand):
             action="store_true",
             help="Runs the search against all documents",
         )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=4,
+            help="Number of searches to run against solr at once",
+        )
         parser.add_argument(
             "--quiet",
             action="store_true",
@@ -112,6 +179,7 @@ class Command(BaseCommand):
         get_all = options["all"]
         verbose = not options["quiet"]
         reload_searches = options["reload_searches"]
+        workers = options["workers"]
         if get_all or not KeyPhrase.objects.count():
             if verbose:
                 print("Downloading data")
@@ -122,9 +190,10 @@ class Command(BaseCommand):
             if verbose:
                 print("Importing Keyphrase Pairwise")
             KeyPhrasePairWise.populate(quiet=not verbose)
+            DataVersion.bump(DataVersion.KEYPHRASES)
         if reload_searches or get_all or not CachedSearch.objects.count():
             if verbose:
                 print("Running searches")
-            run_searches(verbose=verbose)
+            run_searches(verbose=verbose, workers=workers)
         else:
-            run_recent_searches(verbose=verbose)
+            run_changed_searches(verbose=verbose, workers=workers)
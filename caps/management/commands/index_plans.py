@@ -0,0 +1,106 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from haystack import connections
+from haystack.constants import DEFAULT_ALIAS
+from tqdm import tqdm
+
+from caps.models import DataVersion, PlanDocument
+
+
+class Command(BaseCommand):
+    help = "Adds plan documents to the search index, extracting any changed text first"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--changed",
+            action="store_true",
+            help="Only update documents changed since the index was last updated, "
+            "and remove deleted ones",
+        )
+        parser.add_argument(
+            "--clear",
+            action="store_true",
+            help="Remove every plan document from the index first",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=None,
+            help="Number of processes to extract text with (default: one per CPU)",
+        )
+        parser.add_argument(
+            "--batch_size",
+            type=int,
+            default=100,
+            help="Number of documents to send to solr in each commit",
+        )
+        parser.add_argument(
+            "--reextract",
+            action="store_true",
+            help="Extract the text of every document, even if it's not changed",
+        )
+
+    def index_batch(self, backend, index, batch):
+        backend.update(index, batch, commit=True)
+        return len(batch)
+
+    def remove_documents(self, backend, document_ids, batch_size):
+        label = PlanDocument._meta.label_lower
+        for start in range(0, len(document_ids), batch_size):
+            ids = [
+                f"{label}.{document_id}"
+                for document_id in document_ids[start : start + batch_size]
+            ]
+            backend.conn.delete(id=ids, commit=True)
+
+    def handle(self, *args, **options):
+        if options["changed"] and options["clear"]:
+            # clearing the index then only adding changed documents would leave
+            # out everything else
+            raise CommandError("--changed and --clear can't be used together")
+
+        started = timezone.now()
+        batch_size = options["batch_size"]
+
+        connection = connections[DEFAULT_ALIAS]
+        index = connection.get_unified_index().get_index(PlanDocument)
+        backend = connection.get_backend()
+        documents = index.index_queryset()
+
+        last_updated = DataVersion.get_updated(DataVersion.SEARCH_INDEX)
+        if options["changed"] and last_updated is not None:
+            changed, deleted = PlanDocument.changed_since(last_updated)
+            documents = documents.filter(id__in=changed)
+            self.remove_documents(backend, deleted, batch_size)
+            self.stdout.write(f"Removed {len(deleted)} plan documents")
+        elif options["changed"]:
+            self.stdout.write("The index has not been updated before, indexing all")
+
+        extracted = PlanDocument.update_text(
+            documents.select_related(None).only("id", "file", "text_hash"),
+            workers=options["workers"],
+            rebuild=options["reextract"],
+        )
+        self.stdout.write(f"Extracted text for {extracted} plan documents")
+
+        if options["clear"]:
+            backend.clear(models=[PlanDocument])
+
+        count = 0
+        batch = []
+        for document in tqdm(
+            documents.iterator(chunk_size=batch_size),
+            total=documents.count(),
+            disable=options["verbosity"] < 2,
+        ):
+            batch.append(document)
+            if len(batch) >= batch_size:
+                count += self.index_batch(backend, index, batch)
+                batch = []
+
+        if batch:
+            count += self.index_batch(backend, index, batch)
+
+        # anything changed while indexing is picked up next time
+        DataVersion.bump(DataVersion.SEARCH_INDEX, updated=started)
+        self.stdout.write(f"Indexed {count} plan documents")
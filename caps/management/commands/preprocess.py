@@ -1,7 +1,8 @@
 import os
 import ssl
 import sys
-from functools import lru_cache
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from os.path import basename, isfile, join, splitext
 from urllib.parse import urlparse
 
@@ -21,112 +22,224 @@ ssl._create_default_https_context = ssl._create_unverified_context
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 
-def set_file_attributes(df, index, content_type, extension):
+def get_file_attributes(content_type, extension):
+    """
+    Work out the file type and charset of a document from the content type
+    header and the extension in the url
+    """
+    attributes = {}
     content_type = content_type.lower()
     extension = extension.lower()
     content_type_info = content_type.split(";", 2)
     file_type = content_type_info[0].strip()
     if len(content_type_info) > 1:
         charset = content_type_info[1].replace("charset=", "").strip()
-        df.at[index, "charset"] = charset
+        attributes["charset"] = charset
 
     if file_type == "application/pdf" or extension == ".pdf":
-        df.at[index, "file_type"] = "pdf"
+        attributes["file_type"] = "pdf"
     elif file_type == "text/html":
-        df.at[index, "file_type"] = "html"
+        attributes["file_type"] = "html"
     elif extension == ".docx":
-        df.at[index, "file_type"] = "docx"
+        attributes["file_type"] = "docx"
     elif (
         content_type
         == "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
     ):
-        df.at[index, "file_type"] = "xlsx"
+        attributes["file_type"] = "xlsx"
     elif content_type == "application/vnd.ms-excel.sheet.macroenabled.12":
-        df.at[index, "file_type"] = "xlsm"
+        attributes["file_type"] = "xlsm"
     elif content_type == "application/msword":
-        df.at[index, "file_type"] = "doc"
+        attributes["file_type"] = "doc"
     else:
         print("Unknown content type: " + content_type)
 
+    return attributes
+
+
+# requests sessions aren't thread safe, so each download thread has its own
+sessions = threading.local()
 
-@lru_cache
-def get_retry_requester():
+
+def get_retry_requester(pool_size=10):
     """
-    Get requests session that will retry on failure
+    Get this thread's requests session that will retry on failure, keeping up
+    to pool_size connections open to each host
     """
+    if hasattr(sessions, "session"):
+        return sessions.session
+
     retry_strategy = Retry(
         total=3,
         backoff_factor=1,
         status_forcelist=[429, 500, 502, 503, 504],
         allowed_methods=["HEAD", "GET", "OPTIONS"],
     )
-    adapter = HTTPAdapter(max_retries=retry_strategy)
+    adapter = HTTPAdapter(
+        max_retries=retry_strategy, pool_connections=100, pool_maxsize=pool_size
+    )
     http = requests.Session()
     http.mount("https://", adapter)
     http.mount("http://", adapter)
+    sessions.session = http
     return http
 
 
-def get_plan(row, index, df):
-    url = row["url"]
-    council = row["council"]
+class HostLimiter:
+    """
+    Limit how many requests are made to each host at the same time
+    """
+
+    def __init__(self, per_host):
+        self.per_host = per_host
+        self.lock = threading.Lock()
+        self.semaphores = {}
+
+    def for_url(self, url):
+        host = urlparse(url).netloc.lower()
+        with self.lock:
+            if host not in self.semaphores:
+                self.semaphores[host] = threading.BoundedSemaphore(self.per_host)
+            return self.semaphores[host]
+
+
+def get_plan(plan, limiter):
+    """
+    Download a plan, returning the columns to update in the sheet or None if it
+    couldn't be fetched.
+
+    If we have the plan from a previous run then only fetch it if it's changed
+    since then.
+    """
+    url = plan["url"]
+    council = plan["council"]
+    previous = plan.get("previous")
     new_filename = PlanDocument.plan_filename(council, url)
     url_parts = urlparse(url)
     filepath, extension = splitext(url_parts.path)
     headers = {
         "User-Agent": "mySociety Council climate action plans search",
     }
+    if previous is not None:
+        if previous["etag"]:
+            headers["If-None-Match"] = previous["etag"]
+        if previous["last_modified"]:
+            headers["If-Modified-Since"] = previous["last_modified"]
+
     try:
-        r = get_retry_requester().get(url, headers=headers, verify=False, timeout=10)
-        r.raise_for_status()
-        set_file_attributes(df, index, r.headers.get("content-type"), extension)
-        new_filename = new_filename + "." + df.at[index, "file_type"]
-        local_path = join(settings.PLANS_DIR, new_filename)
-        df.at[index, "plan_path"] = local_path
-        with open(local_path, "wb") as outfile:
-            outfile.write(r.content)
+        with limiter.for_url(url):
+            r = get_retry_requester(limiter.per_host).get(
+                url, headers=headers, verify=False, timeout=10
+            )
+            r.raise_for_status()
+            if r.status_code == 304:
+                return previous
+
+            attributes = get_file_attributes(
+                r.headers.get("content-type", ""), extension
+            )
+            if "file_type" not in attributes:
+                return None
+
+            local_path = join(
+                settings.PLANS_DIR, new_filename + "." + attributes["file_type"]
+            )
+            with open(local_path, "wb") as outfile:
+                outfile.write(r.content)
     except requests.exceptions.RequestException as err:
         print(f"Error {council} {url}: {err}")
-        df.at[index, "url"] = numpy.nan
+        return None
 
+    return {
+        "charset": None,
+        **attributes,
+        "plan_path": local_path,
+        "etag": get_cache_header(r, "etag"),
+        "last_modified": get_cache_header(r, "last-modified"),
+    }
 
-def update_plan(row, index, df, get_all):
-    url = row["url"]
-    council = row["council"]
-    url_hash = PlanDocument.make_url_hash(url)
-    new_filename = PlanDocument.plan_filename(council, url)
-    if get_all:
-        get_plan(row, index, df)
-    else:
-        # If we've already loaded a document from this URL, don't get the file again
-        try:
-            plan_document = PlanDocument.objects.get(
-                url_hash=url_hash, council__name=council
-            )
-            df.at[index, "charset"] = plan_document.charset
-            df.at[index, "file_type"] = plan_document.file_type
-            new_filename = new_filename + "." + plan_document.file_type
-            local_path = join(settings.PLANS_DIR, new_filename)
-            df.at[index, "plan_path"] = local_path
-        except PlanDocument.DoesNotExist:
-            print(f"fetching: {url} ({url_hash}) ")
-            get_plan(row, index, df)
 
+def get_cache_header(response, header):
+    """
+    The value of a caching header to store on the PlanDocument, or "" if it's
+    too long for the field. A truncated value can't be sent back to the
+    server, so it's not worth keeping.
+    """
+    value = response.headers.get(header, "")
+    field = PlanDocument._meta.get_field(header.replace("-", "_"))
+    if len(value) > field.max_length:
+        return ""
+    return value
 
-def get_individual_plans(get_all):
+
+def get_previous_plans():
+    """
+    Details of the documents we've already got, keyed by url hash and council
+    """
+    documents = PlanDocument.objects.values(
+        "url_hash", "council__name", "file_type", "charset", "etag", "last_modified"
+    )
+    return {
+        (document.pop("url_hash"), document.pop("council__name")): document
+        for document in documents
+    }
+
+
+def get_individual_plans(get_all, workers=1, per_host=1):
     df = pd.read_csv(settings.PROCESSED_CSV)
     rows = len(df["council"])
 
     # add a file column to the CSV
     df["plan_path"] = pd.Series([None] * rows, index=df.index)
 
-    # add a file type and charset column to the CSV
-    df["file_type"] = pd.Series([None] * rows, index=df.index)
-    df["charset"] = pd.Series([None] * rows, index=df.index)
+    # add a file type, charset and caching header columns to the CSV
+    for column in ["file_type", "charset", "etag", "last_modified"]:
+        df[column] = pd.Series([None] * rows, index=df.index)
+
+    previous_plans = get_previous_plans()
+    results = {}
+    to_fetch = []
 
     rows_with_urls = df["url"].notnull()
-    for index, row in df[rows_with_urls].iterrows():
-        update_plan(row, index, df, get_all)
+    for index, row in df.loc[rows_with_urls, ["url", "council"]].iterrows():
+        url = row["url"]
+        council = row["council"]
+        url_hash = PlanDocument.make_url_hash(url)
+        plan = {"index": index, "url": url, "council": council}
+
+        previous = previous_plans.get((url_hash, council))
+        if previous is not None:
+            new_filename = PlanDocument.plan_filename(council, url)
+            local_path = join(
+                settings.PLANS_DIR, new_filename + "." + previous["file_type"]
+            )
+            previous = {**previous, "plan_path": local_path}
+
+            # If we've already loaded a document from this URL, don't get the file again
+            if not get_all:
+                results[index] = previous
+                continue
+
+            if isfile(local_path):
+                plan["previous"] = previous
+        elif not get_all:
+            print(f"fetching: {url} ({url_hash}) ")
+
+        to_fetch.append(plan)
+
+    limiter = HostLimiter(per_host)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(get_plan, plan, limiter): plan["index"] for plan in to_fetch
+        }
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+
+    failed = [index for index, result in results.items() if result is None]
+    df.loc[failed, "url"] = numpy.nan
+
+    fetched = {index: result for index, result in results.items() if result}
+    df.update(pd.DataFrame.from_dict(fetched, orient="index"))
 
     df.to_csv(open(settings.PROCESSED_CSV, "w"), index=False, header=True)
 
@@ -201,6 +314,18 @@ class Command(BaseCommand):
             action="store_true",
             help="Update all data (slower but more thorough)",
         )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=8,
+            help="Number of plans to download at once",
+        )
+        parser.add_argument(
+            "--per_host",
+            type=int,
+            default=2,
+            help="Number of plans to download at once from the same website",
+        )
 
     def handle(self, *args, **options):
         get_all = options["all"]
@@ -213,4 +338,4 @@ class Command(BaseCommand):
             print("Fetching all files")
         else:
             print("Fetching only new files")
-        get_individual_plans(get_all)
+        get_individual_plans(get_all, options["workers"], options["per_host"])
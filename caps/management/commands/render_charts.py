@@ -0,0 +1,69 @@
+from django.core.management.base import BaseCommand, CommandError
+from tqdm import tqdm
+
+import caps.charts as charts
+from caps.models import CouncilProfileSnapshot, DataVersion
+from charting import ChartCache
+from charting.render import FORMATS, remove_unused_images, render_images
+
+
+class Command(BaseCommand):
+    help = "Renders the charts shown on council pages to image files"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Render every chart, not just ones that have changed",
+        )
+        parser.add_argument(
+            "--format",
+            action="append",
+            choices=FORMATS,
+            help="Image format to render, can be given more than once (default: all)",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=None,
+            help="Number of processes to render with (default: one per CPU)",
+        )
+        parser.add_argument(
+            "--remove_unused",
+            action="store_true",
+            help="Delete images for charts that are no longer shown",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            import vl_convert  # noqa: F401
+        except ImportError:
+            raise CommandError(
+                "Rendering charts needs vl-convert-python, please install it"
+            )
+
+        version = DataVersion.get_version(DataVersion.EMISSIONS)
+        arg_list = list(charts.multi_emissions_chart_args())
+        bundles = [
+            ChartCache.get(charts.multi_emissions_chart, version, *args)
+            for args in tqdm(arg_list, disable=options["verbosity"] < 2)
+        ]
+
+        count, image_formats = render_images(
+            bundles,
+            formats=options["format"] or FORMATS,
+            workers=options["workers"],
+            rebuild=options["all"],
+        )
+        self.stdout.write(f"Rendered {count} chart images")
+
+        changed = ChartCache.record_images(
+            charts.multi_emissions_chart, version, arg_list, image_formats
+        )
+        if changed:
+            # council pages keep their charts in the profile snapshot
+            CouncilProfileSnapshot.mark_stale()
+
+        if options["remove_unused"]:
+            removed = remove_unused_images(image_formats)
+            self.stdout.write(f"Removed {removed} unused chart images")
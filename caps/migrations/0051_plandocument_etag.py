@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-18 21:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("caps", "0050_dataversion"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="historicalplandocument",
+            name="etag",
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name="historicalplandocument",
+            name="last_modified",
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name="plandocument",
+            name="etag",
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name="plandocument",
+            name="last_modified",
+            field=models.CharField(blank=True, max_length=100),
+        ),
+    ]
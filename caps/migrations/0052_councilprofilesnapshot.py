@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-18 21:31
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("caps", "0051_plandocument_etag"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CouncilProfileSnapshot",
+            fields=[
+                (
+                    "council",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="profile_snapshot",
+                        serialize=False,
+                        to="caps.council",
+                    ),
+                ),
+                ("format_version", models.PositiveSmallIntegerField()),
+                ("stale", models.BooleanField(default=False)),
+                ("data", models.BinaryField()),
+                ("updated", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-18 21:38
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("caps", "0052_councilprofilesnapshot"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="EmissionsSeries",
+            fields=[
+                (
+                    "council",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="emissions_series",
+                        serialize=False,
+                        to="caps.council",
+                    ),
+                ),
+                ("years", models.JSONField()),
+                ("data_types", models.JSONField()),
+                ("values", models.JSONField()),
+                ("updated", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
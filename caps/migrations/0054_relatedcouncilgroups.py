@@ -0,0 +1,31 @@
+# Generated by Django 4.2.30 on 2026-10-18 21:52
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("caps", "0053_emissionsseries"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RelatedCouncilGroups",
+            fields=[
+                (
+                    "council",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="related_council_groups",
+                        serialize=False,
+                        to="caps.council",
+                    ),
+                ),
+                ("groups", models.JSONField()),
+                ("updated", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
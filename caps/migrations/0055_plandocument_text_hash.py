@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-18 21:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("caps", "0054_relatedcouncilgroups"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="historicalplandocument",
+            name="text_hash",
+            field=models.CharField(blank=True, max_length=32),
+        ),
+        migrations.AddField(
+            model_name="plandocument",
+            name="text_hash",
+            field=models.CharField(blank=True, max_length=32),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.30 on 2026-10-18 22:05
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("caps", "0055_plandocument_text_hash"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="savedsearch",
+            name="created",
+            field=models.DateTimeField(blank=True, default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-18 22:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("caps", "0056_savedsearch_created_default"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="historicalplandocument",
+            name="text_updated",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="plandocument",
+            name="text_updated",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.30 on 2026-10-18 22:36
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("caps", "0057_plandocument_text_updated"),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name="historicalplandocument",
+            name="text",
+        ),
+        migrations.RemoveField(
+            model_name="historicalplandocument",
+            name="text_hash",
+        ),
+        migrations.RemoveField(
+            model_name="historicalplandocument",
+            name="text_updated",
+        ),
+    ]
@@ -4,13 +4,25 @@ import hashlib
 import json
 import math
 import os
+import pickle
 import re
 from collections import defaultdict
-from copy import deepcopy
-from datetime import date
+from dataclasses import dataclass
+from datetime import date, datetime
+from io import StringIO
 from itertools import chain, groupby
 from pathlib import Path
-from typing import Callable, List, NamedTuple, Optional, Tuple, Type, TypeVar, Union
+from typing import (
+    Any,
+    Callable,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Type,
+    TypeVar,
+    Union,
+)
 
 import dateutil.parser
 import django_filters
@@ -18,27 +30,28 @@ import markdown
 import pandas as pd
 from django.conf import settings
 from django.core.files.storage import FileSystemStorage
-from django.db import models
+from django.db import connection, models, transaction
 from django.db.models import (
     Count,
+    F,
     Max,
     Min,
-    OuterRef,
     Prefetch,
     Q,
     QuerySet,
-    Subquery,
     Sum,
 )
 from django.db.models.expressions import RawSQL
 from django.db.models.functions import Length
 from django.forms import Select, TextInput
+from django.utils import timezone
 from django.utils.http import urlencode
 from django.utils.text import slugify
 from simple_history.models import HistoricalRecords
 from tqdm import tqdm
 
 from caps.filters import DefaultSecondarySortFilter
+from caps.text_extraction import extract_texts
 
 # Allow length looking for CharFields
 models.CharField.register_lookup(Length)
@@ -54,6 +67,15 @@ def query_lookup(
     return lambda x: di.get(x, default)
 
 
+def get_df_columns(model: Type[models.Model], df: pd.DataFrame) -> List[str]:
+    """
+    The columns of the df that match field names of the model
+    """
+    ff = filter(lambda x: hasattr(x, "db_column"), model._meta.get_fields())
+    field_names = [x.get_attname_column()[0] for x in ff]
+    return [x for x in df.columns if x in field_names]
+
+
 def save_df_to_model(
     model: Type[models.Model],
     df: pd.DataFrame,
@@ -64,9 +86,22 @@ def save_df_to_model(
     Given a df with column names that match field names,
     create entries in database
     """
-    ff = filter(lambda x: hasattr(x, "db_column"), model._meta.get_fields())
-    field_names = [x.get_attname_column()[0] for x in ff]
-    good_cols = [x for x in df.columns if x in field_names]
+    if connection.vendor == "postgresql":
+        copy_df_to_model(model, df, batch_size=batch_size, quiet=quiet)
+    else:
+        bulk_create_df_to_model(model, df, batch_size=batch_size, quiet=quiet)
+
+
+def bulk_create_df_to_model(
+    model: Type[models.Model],
+    df: pd.DataFrame,
+    batch_size: int = 1000,
+    quiet: bool = False,
+):
+    """
+    Create entries from a df by creating a model instance for each row
+    """
+    good_cols = get_df_columns(model, df)
 
     # iterate through subsets of df of batch_size
     max_sets = math.ceil(len(df) / batch_size)
@@ -78,6 +113,86 @@ def save_df_to_model(
         model.objects.bulk_create(items)
 
 
+def is_null(value: Any) -> bool:
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+
+def get_copy_value(field: models.Field, value: Any) -> Any:
+    """
+    A value for the field as it should be written in COPY input. JSON is
+    written as text, other values that aren't a single value, such as an
+    ArrayField's list, can't be.
+    """
+    value = field.get_prep_value(value)
+    if isinstance(field, models.JSONField):
+        return None if value is None else json.dumps(value, cls=field.encoder)
+    if isinstance(value, (list, tuple, dict)):
+        raise ValueError(f"{field.name} can't be written with COPY")
+    return value
+
+
+def get_copy_df(model: Type[models.Model], df: pd.DataFrame) -> pd.DataFrame:
+    """
+    The df as it should be written to the model's table, with any fields
+    missing from the df set to the value a new instance would be saved with.
+    """
+    fields = {x.attname: x for x in model._meta.concrete_fields}
+    df = df[get_df_columns(model, df)].copy()
+
+    # only object columns can hold values, like dicts for a JSONField, that
+    # need converting
+    for name in df.columns:
+        field = fields[name]
+        if df[name].dtype == object:
+            df[name] = df[name].map(
+                lambda value: value if is_null(value) else get_copy_value(field, value)
+            )
+
+    instance = model()
+    for name, field in fields.items():
+        if name in df.columns or field == model._meta.auto_field:
+            continue
+        df[name] = get_copy_value(field, field.pre_save(instance, True))
+
+    for name in df.columns:
+        field = getattr(fields[name], "target_field", fields[name])
+        # ids from a column with missing values will be floats
+        if isinstance(field, models.IntegerField) and df[name].dtype.kind == "f":
+            df[name] = df[name].astype("Int64")
+
+    return df
+
+
+def copy_df_to_model(
+    model: Type[models.Model],
+    df: pd.DataFrame,
+    batch_size: int = 1000,
+    quiet: bool = False,
+):
+    """
+    Create entries from a df by streaming it into the table with COPY, which
+    avoids a model instance per row. PostgreSQL only.
+    """
+    df = get_copy_df(model, df)
+    quote = connection.ops.quote_name
+    sql = "COPY {} ({}) FROM STDIN WITH (FORMAT csv, NULL '\\N')".format(
+        quote(model._meta.db_table), ", ".join(quote(x) for x in df.columns)
+    )
+
+    max_sets = math.ceil(len(df) / batch_size)
+    with transaction.atomic(), connection.cursor() as cursor:
+        for i in tqdm(range(max_sets), disable=quiet):
+            data = df.iloc[i * batch_size : (i + 1) * batch_size].to_csv(
+                index=False, header=False, na_rep="\\N"
+            )
+            if hasattr(cursor.cursor, "copy_expert"):
+                # psycopg2
+                cursor.cursor.copy_expert(sql, StringIO(data))
+            else:
+                with cursor.cursor.copy(sql) as copy:
+                    copy.write(data)
+
+
 class CustomQuerySet(models.QuerySet):
     """
     Include some extra functions on querysets avaliable to models
@@ -341,6 +456,13 @@ class Council(models.Model):
         between two councils
         """
 
+        # import here as the matrix uses the models
+        from caps.keyphrase_matrix import KeyPhraseMatrix
+
+        matrix = KeyPhraseMatrix.get()
+        if matrix is not None:
+            return matrix.keyphrase_overlap(self, [other])
+
         joined_docs = PlanDocument.objects.filter(
             council_id__in=[self.id, other.id]
         )  # in principle, add any limiters on document type here
@@ -359,6 +481,13 @@ class Council(models.Model):
         """
         councils = self.related_authorities.filter(distances__position__lte=cut_off + 2)
 
+        # import here as the matrix uses the models
+        from caps.keyphrase_matrix import KeyPhraseMatrix
+
+        matrix = KeyPhraseMatrix.get()
+        if matrix is not None:
+            return matrix.keyphrase_overlap(self, councils)
+
         joined_docs = PlanDocument.objects.filter(
             Q(council__in=councils) | Q(council=self)
         ).prefetch_related("council")
@@ -383,79 +512,10 @@ class Council(models.Model):
         """
         get all related councils
         """
-        councils = self.related_authorities.filter(
-            distances__position__lte=cut_off + 2
-        ).annotate(
-            num_plans=Subquery(
-                PlanDocument.objects.filter(
-                    council_id=OuterRef("id"), document_type=PlanDocument.ACTION_PLAN
-                )
-                .values("council_id")
-                .annotate(num_plans=Count("id"))
-                .values("num_plans")
-            ),
-            has_promise=Count("promise"),
-            earliest_promise=Min("promise__target_year"),
-            declared_emergency=Min("emergencydeclaration__date_declared"),
-        )
-
-        if scoring_group is not None:
-            group = self.SCORING_GROUPS[scoring_group]
-            councils = councils.filter(
-                authority_type__in=group["types"],
-                country__in=group["countries"],
-            )
-
-        council_lookup = {council.id: council for council in councils}
-        council_ids = list(council_lookup.keys()) + [self.id]
-
-        # get label assignments in a seperate query ready to assign
-        comparison_qs = (
-            ComparisonLabelAssignment.objects.filter(council_id__in=council_ids)
-            .prefetch_related("label")
-            .order_by("label__type_id")
-        )
-
-        # change list of labels to tiered lookup (type_id, council_id)
-        labels = defaultdict(dict)
-        for comparison in comparison_qs.all():
-            labels[comparison.label.type_id][comparison.council_id] = comparison
-
-        processed_councils = []
-        distances = self.distances.all().order_by("type_id", "-match_score")
-        if scoring_group is not None:
-            group = self.SCORING_GROUPS[scoring_group]
-            distances = distances.filter(
-                council_b__authority_type__in=group["types"],
-                council_b__country__in=group["countries"],
-            )
-        for d in distances:
-            # deepcopy to make sure the same council in multiple comparison types
-            # are seperate objects with seperate links to Distance objects
-            nc = deepcopy(council_lookup[d.council_b_id])
-            nc.distance = d
-            nc.label = labels[d.type_id][nc.id]
-            processed_councils.append(nc)
-
-        types = ComparisonType.objects.all()
-        types = {comparison_type.id: comparison_type for comparison_type in types}
-
-        grouped_results = groupby(
-            processed_councils, key=lambda council: council.distance.type_id
-        )
-
-        results = []
-        # add details for the home council
-        for type_id, g in grouped_results:
-            results.append(
-                {
-                    "type": types[type_id],
-                    "label": labels[type_id][self.id].label,
-                    "councils": list(g)[:cut_off],
-                }
-            )
-
-        return results
+        groups = RelatedCouncilGroups.for_council(self)
+        if groups is None:
+            return []
+        return groups.get_groups(cut_off, scoring_group)
 
     def data_points(self, data_group: str):
         """
@@ -470,22 +530,9 @@ class Council(models.Model):
         """
         Get emissions breakdown for current year by Emissions profile
         """
-
-        totals = [
-            "Industry Total",
-            "Commercial Total",
-            "Public Sector Total",
-            "Transport Total",
-            "Domestic Total",
-            "Agriculture Total",
-        ]
-
+        df = EmissionsSeries.for_council(self).sector_totals()
         df = (
-            DataPoint.objects.filter(
-                council=self, data_type__name_in_source__in=totals, year=year
-            )
-            .prefetch_related("data_type")
-            .to_dataframe(("data_type__name_in_source", "emissions_type"), "value")
+            df[df["year"] == year][["emissions_type", "value"]]
             .assign(percentage=lambda df: df["value"] / df["value"].sum())
             .sort_values("percentage", ascending=False)
         )
@@ -813,11 +860,27 @@ class PlanDocument(models.Model):
     notes = models.CharField(max_length=800, blank=True)
     file_type = models.CharField(max_length=200)
     charset = models.CharField(max_length=50, blank=True)
+    # from the response headers so the document is only fetched again if changed
+    etag = models.CharField(max_length=255, blank=True)
+    last_modified = models.CharField(max_length=100, blank=True)
     text = models.TextField(blank=True)
+    # md5 of the file the text was extracted from
+    text_hash = models.CharField(max_length=32, blank=True)
+    # when the text was last extracted, kept apart from updated_at which is
+    # shown as when the plan last changed
+    text_updated = models.DateTimeField(null=True, blank=True)
     file = models.FileField("plans", storage=overwrite_storage)
-    history = HistoricalRecords(bases=[PlanDocumentHistoricalModel])
+    # the extracted text is large and stored without a history record by
+    # update_text, so isn't copied into the history
+    history = HistoricalRecords(
+        bases=[PlanDocumentHistoricalModel],
+        excluded_fields=["text", "text_hash", "text_updated"],
+    )
     title = models.CharField(max_length=800, blank=True)
 
+    # set by update_text, which doesn't make a history record
+    TEXT_FIELDS = ["text", "text_hash", "text_updated"]
+
     # This just means the same type is expected wherever this is used
     SortKeyType = TypeVar("SortKeyType")
 
@@ -940,6 +1003,59 @@ class PlanDocument(models.Model):
         else:
             return self.url
 
+    @classmethod
+    def update_text(
+        cls, documents=None, workers: int = None, rebuild: bool = False
+    ) -> int:
+        """
+        Store the text of the documents, or every document if not given,
+        extracting it from any files that have changed since their text was
+        stored. Returns the number of documents updated.
+        """
+        if documents is None:
+            documents = cls.objects.exclude(file="").only("id", "file", "text_hash")
+
+        to_update = []
+        count = 0
+        for document_id, content_hash, text in extract_texts(
+            documents, workers=workers, rebuild=rebuild
+        ):
+            to_update.append(
+                cls(
+                    id=document_id,
+                    text=text,
+                    text_hash=content_hash,
+                    text_updated=timezone.now(),
+                )
+            )
+            # the text of a batch can be large so don't keep them all around
+            if len(to_update) >= 100:
+                count += cls.objects.bulk_update(to_update, cls.TEXT_FIELDS)
+                to_update = []
+
+        count += cls.objects.bulk_update(to_update, cls.TEXT_FIELDS)
+        return count
+
+    @classmethod
+    def changed_since(cls, since: datetime) -> Tuple[List[int], List[int]]:
+        """
+        The ids of documents created, changed or deleted since a time, from
+        the history along with text_updated for text stored by update_text,
+        which doesn't make a history record. Returns the changed and the
+        deleted ids.
+        """
+        in_history = set(
+            cls.history.filter(history_date__gte=since)
+            .values_list("id", flat=True)
+            .distinct()
+        )
+        changed = set(
+            cls.objects.filter(
+                Q(id__in=in_history) | Q(text_updated__gte=since)
+            ).values_list("id", flat=True)
+        )
+        return sorted(changed), sorted(in_history - changed)
+
     @classmethod
     def make_url_hash(cls, url):
         """
@@ -1049,6 +1165,199 @@ class DataPoint(CapsModel):
     class Meta:
         ordering = ["data_type", "year"]
 
+    @classmethod
+    def load(cls, df: pd.DataFrame, collection: str) -> Tuple[int, int, int]:
+        """
+        Make the data points for a collection match a dataframe of council_id,
+        data_type_id, year and value columns. Only new, changed and removed
+        points are written. Returns the number created, updated and deleted.
+        """
+        keys = ["council_id", "data_type_id", "year"]
+        df = df[keys + ["value"]].dropna().astype({key: int for key in keys})
+
+        existing = pd.DataFrame(
+            cls.objects.filter(data_type__collection=collection)
+            .values_list("id", *keys, "value")
+            .order_by(),
+            columns=["id", *keys, "value"],
+        ).astype({key: int for key in keys})
+        df = df.merge(
+            existing,
+            on=keys,
+            how="outer",
+            suffixes=("", "_existing"),
+            indicator=True,
+        )
+
+        new = df[df["_merge"] == "left_only"]
+        changed = df[(df["_merge"] == "both") & (df["value"] != df["value_existing"])]
+        removed = df[df["_merge"] == "right_only"]
+
+        today = date.today()
+        with transaction.atomic():
+            cls.objects.bulk_create(
+                [
+                    cls(
+                        council_id=council_id,
+                        data_type_id=data_type_id,
+                        year=year,
+                        value=value,
+                    )
+                    for council_id, data_type_id, year, value in new[
+                        keys + ["value"]
+                    ].itertuples(index=False)
+                ],
+                batch_size=1000,
+            )
+            cls.objects.bulk_update(
+                [
+                    cls(id=int(id), value=value, updated_at=today)
+                    for id, value in changed[["id", "value"]].itertuples(index=False)
+                ],
+                ["value", "updated_at"],
+                batch_size=1000,
+            )
+            removed_ids = [int(id) for id in removed["id"]]
+            for start in range(0, len(removed_ids), 1000):
+                cls.objects.filter(id__in=removed_ids[start : start + 1000]).delete()
+
+        return len(new), len(changed), len(removed)
+
+
+class EmissionsSeries(models.Model):
+    """
+    All of a council's emissions data points as a table of values by year and
+    data type, so everything shown about a council's emissions comes from one
+    row. import_emissions_data rebuilds these after loading the data points.
+    """
+
+    # the sector totals that make up a council's emissions
+    SECTOR_TOTALS = [
+        "Industry Total",
+        "Commercial Total",
+        "Public Sector Total",
+        "Transport Total",
+        "Domestic Total",
+        "Agriculture Total",
+    ]
+
+    council = models.OneToOneField(
+        Council,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="emissions_series",
+    )
+    years = models.JSONField()
+    data_types = models.JSONField()
+    # a row for each year with a value, or null, for each data type
+    values = models.JSONField()
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.council} emissions"
+
+    @classmethod
+    def from_dataframe(cls, council_id: int, df: pd.DataFrame) -> EmissionsSeries:
+        df = df.astype(object).where(df.notna(), None)
+        return cls(
+            council_id=council_id,
+            years=[int(year) for year in df.index],
+            data_types=list(df.columns),
+            values=df.values.tolist(),
+        )
+
+    @classmethod
+    def build(cls, councils=None) -> int:
+        """
+        Replace the series for the councils, or every council if not given,
+        with the current emissions data points. Councils with no data get an
+        empty series so they aren't built again on every read. Returns the
+        number stored.
+        """
+        points = DataPoint.objects.filter(
+            data_type__collection=DataType.DataCollection.EMISSIONS
+        )
+        if councils is None:
+            council_ids = list(Council.objects.values_list("id", flat=True))
+        else:
+            council_ids = [council.pk for council in councils]
+            points = points.filter(council_id__in=council_ids)
+
+        df = pd.DataFrame(
+            points.values_list(
+                "council_id", "year", "data_type__name", "value"
+            ).order_by("data_type", "year"),
+            columns=["council_id", "year", "data_type", "value"],
+        )
+        # keep the data types in the same order as the data points
+        data_types = list(df["data_type"].unique())
+
+        series = {
+            council_id: cls(council_id=council_id, years=[], data_types=[], values=[])
+            for council_id in council_ids
+        }
+        for council_id, council_df in df.groupby("council_id"):
+            wide = council_df.pivot_table(
+                "value", index="year", columns="data_type", aggfunc="sum"
+            )
+            wide = wide[[t for t in data_types if t in wide.columns]]
+            series[council_id] = cls.from_dataframe(council_id, wide)
+
+        with transaction.atomic():
+            cls.objects.filter(council_id__in=council_ids).delete()
+            cls.objects.bulk_create(series.values(), batch_size=100)
+
+        return len(series)
+
+    @classmethod
+    def for_council(cls, council: Council) -> Optional[EmissionsSeries]:
+        """
+        The council's series, built from its data points if it's not been
+        stored yet. None if the council has no emissions data.
+        """
+        try:
+            series = council.emissions_series
+        except cls.DoesNotExist:
+            cls.build([council])
+            series = cls.objects.get(council=council)
+
+        if not series.years:
+            return None
+        return series
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """
+        Values with a row for each year and a column for each data type
+        """
+        return pd.DataFrame(
+            self.values, index=self.years, columns=self.data_types, dtype=float
+        ).rename_axis("year")
+
+    @property
+    def latest_year(self) -> Optional[int]:
+        return max(self.years, default=None)
+
+    def get_value(self, year: int, data_type: str) -> Optional[float]:
+        try:
+            return self.values[self.years.index(year)][self.data_types.index(data_type)]
+        except ValueError:
+            return None
+
+    def sector_totals(self) -> pd.DataFrame:
+        """
+        The sector totals with a row for each year and sector, in the same
+        order as the data points.
+        """
+        df = self.to_dataframe()
+        sectors = [t for t in self.data_types if t in self.SECTOR_TOTALS]
+        return (
+            df[sectors]
+            .reset_index()
+            .melt(id_vars="year", var_name="emissions_type")
+            .dropna(subset=["value"])
+            .reset_index(drop=True)
+        )
+
 
 """
 Following adapted from https://github.com/django-haystack/saved_searches/
@@ -1109,7 +1418,8 @@ class SavedSearch(models.Model):
     )
     result_count = models.PositiveIntegerField(default=0, blank=True)
     inorganic = models.BooleanField(default=False)
-    created = models.DateTimeField(blank=True, auto_now_add=True)
+    # set when the search is queued, not when it is saved
+    created = models.DateTimeField(blank=True, default=timezone.now)
     council_restriction = models.CharField(
         max_length=1000, help_text="The text used to restrict by council", default=""
     )
@@ -1583,6 +1893,254 @@ class Distance(models.Model):
         save_df_to_model(cls, df)
 
 
+@dataclass
+class RelatedCouncil:
+    """
+    One of the councils most similar to another. Anything that's not part of
+    the comparison comes from the council itself, so these can be used in
+    templates in place of the council.
+    """
+
+    council: Council
+    match_score: float
+    position: int
+    label: Optional[ComparisonLabel]
+    num_plans: int
+    has_promise: int
+    earliest_promise: Optional[int]
+    declared_emergency: Optional[date]
+    plan_overlap: Optional[KeyPhraseOverlap] = None
+
+    def __getattr__(self, name):
+        # only called for attributes that aren't set above
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.council, name)
+
+
+class RelatedCouncilGroups(models.Model):
+    """
+    A council's related councils for each comparison type, along with the plan,
+    promise and declaration details shown for them, so the lists come from one
+    row. add_related_councils builds these after the distances are loaded, and
+    the plan, promise and declaration imports rebuild them.
+    """
+
+    council = models.OneToOneField(
+        Council,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="related_council_groups",
+    )
+    # a dict for each comparison type with the type and label ids, and the
+    # related councils in order of similarity
+    groups = models.JSONField()
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.council} related councils"
+
+    @classmethod
+    def council_details(cls, council_ids) -> dict:
+        """
+        Details shown alongside each related council, by council id
+        """
+        details = defaultdict(
+            lambda: {
+                "num_plans": 0,
+                "has_promise": 0,
+                "earliest_promise": None,
+                "declared_emergency": None,
+            }
+        )
+
+        plans = (
+            PlanDocument.objects.filter(
+                council_id__in=council_ids, document_type=PlanDocument.ACTION_PLAN
+            )
+            .values("council_id")
+            .annotate(num_plans=Count("id"))
+            .order_by()
+        )
+        for row in plans:
+            details[row["council_id"]]["num_plans"] = row["num_plans"]
+
+        promises = (
+            Promise.objects.filter(council_id__in=council_ids)
+            .values("council_id")
+            .annotate(has_promise=Count("id"), earliest_promise=Min("target_year"))
+            .order_by()
+        )
+        for row in promises:
+            details[row["council_id"]]["has_promise"] = row["has_promise"]
+            details[row["council_id"]]["earliest_promise"] = row["earliest_promise"]
+
+        declarations = (
+            EmergencyDeclaration.objects.filter(council_id__in=council_ids)
+            .values("council_id")
+            .annotate(declared_emergency=Min("date_declared"))
+            .order_by()
+        )
+        for row in declarations:
+            if row["declared_emergency"] is not None:
+                details[row["council_id"]]["declared_emergency"] = row[
+                    "declared_emergency"
+                ].isoformat()
+
+        return details
+
+    @classmethod
+    def build(cls, councils=None) -> int:
+        """
+        Replace the related councils for the councils, or every council if not
+        given, with the current distances. Councils with no related councils
+        get an empty list so they aren't built again on every read. Returns
+        the number stored.
+        """
+        distances = Distance.objects.order_by(
+            "council_a_id", "type_id", "-match_score", "position"
+        )
+        assignments = ComparisonLabelAssignment.objects.all()
+        if councils is None:
+            council_ids = list(Council.objects.values_list("id", flat=True))
+        else:
+            council_ids = [council.pk for council in councils]
+            distances = distances.filter(council_a_id__in=council_ids)
+        distances = list(
+            distances.values_list(
+                "council_a_id", "type_id", "council_b_id", "match_score", "position"
+            )
+        )
+
+        related_ids = {d[2] for d in distances}
+        if councils is not None:
+            assignments = assignments.filter(
+                council_id__in=related_ids.union(council_ids)
+            )
+
+        labels = defaultdict(dict)
+        for council_id, type_id, label_id in assignments.values_list(
+            "council_id", "label__type_id", "label_id"
+        ):
+            labels[type_id][council_id] = label_id
+
+        details = cls.council_details(related_ids)
+
+        groups = {council_id: [] for council_id in council_ids}
+        for (council_id, type_id), rows in groupby(distances, key=lambda d: d[:2]):
+            groups[council_id].append(
+                {
+                    "type": type_id,
+                    "label": labels[type_id].get(council_id),
+                    "councils": [
+                        {
+                            "id": related_id,
+                            "match_score": match_score,
+                            "position": position,
+                            "label": labels[type_id].get(related_id),
+                            **details[related_id],
+                        }
+                        for _, _, related_id, match_score, position in rows
+                    ],
+                }
+            )
+
+        with transaction.atomic():
+            cls.objects.filter(council_id__in=council_ids).delete()
+            cls.objects.bulk_create(
+                [
+                    cls(council_id=council_id, groups=council_groups)
+                    for council_id, council_groups in groups.items()
+                ],
+                batch_size=100,
+            )
+
+        return len(groups)
+
+    @classmethod
+    def for_council(cls, council: Council) -> Optional[RelatedCouncilGroups]:
+        """
+        The council's related councils, built from the distances if they've
+        not been stored yet. None if the council has no related councils.
+        """
+        try:
+            groups = council.related_council_groups
+        except cls.DoesNotExist:
+            cls.build([council])
+            groups = cls.objects.get(council=council)
+
+        if not groups.groups:
+            return None
+        return groups
+
+    def get_groups(
+        self, cut_off: int = 10, scoring_group: Optional[str] = None
+    ) -> List[dict]:
+        """
+        A dict for each comparison type with the type, the council's label and
+        up to cut_off RelatedCouncils, optionally only those in a scoring group.
+        """
+        group = None
+        if scoring_group is not None:
+            group = Council.SCORING_GROUPS[scoring_group]
+
+        candidates = []
+        for comparison in self.groups:
+            entries = comparison["councils"]
+            if group is None:
+                entries = entries[:cut_off]
+            candidates.append((comparison, entries))
+
+        councils = Council.objects.in_bulk(
+            {entry["id"] for _, entries in candidates for entry in entries}
+        )
+        types = ComparisonType.objects.in_bulk()
+        labels = ComparisonLabel.objects.in_bulk(
+            {comparison["label"] for comparison in self.groups}
+            | {entry["label"] for _, entries in candidates for entry in entries}
+        )
+
+        results = []
+        for comparison, entries in candidates:
+            related = []
+            for entry in entries:
+                council = councils.get(entry["id"])
+                if council is None:
+                    continue
+                if group is not None and (
+                    council.authority_type not in group["types"]
+                    or council.country not in group["countries"]
+                ):
+                    continue
+
+                declared = entry["declared_emergency"]
+                related.append(
+                    RelatedCouncil(
+                        council=council,
+                        match_score=entry["match_score"],
+                        position=entry["position"],
+                        label=labels.get(entry["label"]),
+                        num_plans=entry["num_plans"],
+                        has_promise=entry["has_promise"],
+                        earliest_promise=entry["earliest_promise"],
+                        declared_emergency=(
+                            date.fromisoformat(declared) if declared else None
+                        ),
+                    )
+                )
+
+            if related:
+                results.append(
+                    {
+                        "type": types[comparison["type"]],
+                        "label": labels.get(comparison["label"]),
+                        "councils": related[:cut_off],
+                    }
+                )
+
+        return results
+
+
 class Tag(models.Model):
     name = models.CharField(max_length=200)
     slug = models.CharField(max_length=200, unique=True)
@@ -1747,6 +2305,15 @@ class KeyPhrasePairWise(models.Model):
         """
         Populate the lookup table from the source file
         """
+        df = cls.get_source_df()
+        cls.objects.all().delete()
+        save_df_to_model(cls, df, batch_size=10000, quiet=quiet)
+
+    @classmethod
+    def get_source_df(cls) -> pd.DataFrame:
+        """
+        The pairs from the source file with ids for the keyphrases
+        """
         df = pd.read_csv(Path("data", "ml_keyphrases_pairwise.csv"))
         word_id_dict = {x.keyphrase: x.id for x in KeyPhrase.objects.all()}
         # get ids to bulk populate
@@ -1764,10 +2331,7 @@ class KeyPhrasePairWise(models.Model):
         )
 
         # do not store any with a cosine_similarity below 0.5
-        df = df[df["cosine_similarity"] > 0.5]
-        cls.objects.all().delete()
-        word_id_dict = None
-        save_df_to_model(cls, df, batch_size=10000, quiet=quiet)
+        return df[df["cosine_similarity"] > 0.5]
 
 
 class CachedSearch(models.Model):
@@ -1779,3 +2343,126 @@ class CachedSearch(models.Model):
 
     class Meta:
         unique_together = ("search_term", "document")
+
+
+class DataVersion(models.Model):
+    """
+    A counter that import commands increase when they change a set of data, so
+    anything cached from that data can include the version in its key and be
+    rebuilt after the next import.
+    """
+
+    SCORING = "scoring"
+    EMISSIONS = "emissions"
+    KEYPHRASES = "keyphrases"
+    CACHED_SEARCHES = "cached_searches"
+    SEARCH_INDEX = "search_index"
+
+    name = models.CharField(max_length=100, unique=True)
+    version = models.PositiveIntegerField(default=0)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} v{self.version}"
+
+    @classmethod
+    def get_version(cls, name: str) -> Optional[int]:
+        """
+        Returns None if nothing has been imported since versions were added, in
+        which case callers should not cache.
+        """
+        return cls.objects.filter(name=name).values_list("version", flat=True).first()
+
+    @classmethod
+    def get_updated(cls, name: str) -> Optional[datetime]:
+        """
+        When the version was last increased, or None if it never has been.
+        """
+        return cls.objects.filter(name=name).values_list("updated", flat=True).first()
+
+    @classmethod
+    def bump(cls, name: str, updated: Optional[datetime] = None) -> int:
+        """
+        Increase the version. Call this inside the import's transaction so the
+        new version is only visible once the import is committed.
+
+        updated is when the import started, if anything that changed since
+        then should still count as new.
+        """
+        version, _ = cls.objects.get_or_create(name=name)
+        # update doesn't set auto_now fields
+        cls.objects.filter(pk=version.pk).update(
+            version=F("version") + 1, updated=updated or timezone.now()
+        )
+        version.refresh_from_db()
+        return version.version
+
+
+class CouncilProfileSnapshot(models.Model):
+    """
+    The parts of a council's page that come from the database, pickled so the
+    page can be shown without assembling them on every view.
+
+    Importers mark snapshots as stale once they've changed anything, after
+    which the page assembles the profile again and stores a new snapshot.
+    build_council_profiles rebuilds them all ahead of time.
+    """
+
+    # increase this when the contents of a profile change
+    FORMAT_VERSION = 2
+
+    council = models.OneToOneField(
+        Council,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="profile_snapshot",
+    )
+    format_version = models.PositiveSmallIntegerField()
+    stale = models.BooleanField(default=False)
+    data = models.BinaryField()
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.council} profile"
+
+    @classmethod
+    def get_profile(cls, council: Council) -> Optional[dict]:
+        """
+        Returns None if there's no usable snapshot, in which case the profile
+        should be assembled from the database.
+        """
+        try:
+            snapshot = council.profile_snapshot
+        except cls.DoesNotExist:
+            return None
+
+        if snapshot.stale or snapshot.format_version != cls.FORMAT_VERSION:
+            return None
+
+        try:
+            return pickle.loads(snapshot.data)
+        except (pickle.UnpicklingError, AttributeError, ImportError, EOFError):
+            return None
+
+    @classmethod
+    def store(cls, council: Council, profile: dict) -> CouncilProfileSnapshot:
+        snapshot, _ = cls.objects.update_or_create(
+            council=council,
+            defaults={
+                "format_version": cls.FORMAT_VERSION,
+                "stale": False,
+                "data": pickle.dumps(profile),
+            },
+        )
+        return snapshot
+
+    @classmethod
+    def mark_stale(cls, councils=None) -> int:
+        """
+        Call this after importing anything shown on the council pages. If
+        councils isn't given then all the snapshots are marked.
+        """
+        snapshots = cls.objects.all()
+        if councils is not None:
+            snapshots = snapshots.filter(council__in=councils)
+        return snapshots.update(stale=True)
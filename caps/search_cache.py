@@ -0,0 +1,113 @@
+"""
+Search results kept in the shared cache, so repeating a popular search or
+moving between pages of results doesn't query Solr again.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Tuple
+
+from django.core.cache import cache
+from haystack.query import SearchQuerySet
+
+from caps.models import PlanDocument
+from caps.search_funcs import KeyPhraseSearch
+
+Search = Callable[[], Tuple[SearchQuerySet, List[KeyPhraseSearch]]]
+
+
+@dataclass
+class CachedResult:
+    """
+    Stands in for a haystack SearchResult kept in the cache
+    """
+
+    pk: str
+    highlighted: dict
+    object: Optional[PlanDocument] = None
+
+
+class CachedSearchResults:
+    """
+    The results of a search as a sequence the paginator can count and slice.
+    The count, the related terms and each page of results are cached
+    separately, and the search is only sent to Solr for the parts that
+    aren't in the cache.
+
+    Searches are keyed by their options and the versions of the search index
+    and keyphrases, so they're dropped once either is updated.
+    """
+
+    timeout = 60 * 60 * 24
+
+    def __init__(self, key: str, search: Search):
+        self.key = key
+        self.search = search
+        self._query = None
+        self._related_terms = None
+
+    @classmethod
+    def get_key(cls, options: dict, *versions: int) -> str:
+        options_hash = hashlib.md5(
+            json.dumps(options, sort_keys=True).encode("utf-8")
+        ).hexdigest()
+        return f"search:{':'.join(str(v) for v in versions)}:{options_hash}"
+
+    def run_search(self):
+        if self._query is None:
+            self._query, self._related_terms = self.search()
+
+    @property
+    def related_terms(self) -> List[KeyPhraseSearch]:
+        key = f"{self.key}:related"
+        related_terms = cache.get(key)
+        if related_terms is None:
+            self.run_search()
+            related_terms = self._related_terms
+            cache.set(key, related_terms, self.timeout)
+
+        return related_terms
+
+    def count(self) -> int:
+        key = f"{self.key}:count"
+        count = cache.get(key)
+        if count is None:
+            self.run_search()
+            count = len(self._query)
+            cache.set(key, count, self.timeout)
+
+        return count
+
+    def __len__(self) -> int:
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index : index + 1][0]
+
+        start = index.start or 0
+        stop = index.stop if index.stop is not None else self.count()
+        key = f"{self.key}:{start}:{stop}"
+        page = cache.get(key)
+        if page is None:
+            self.run_search()
+            page = [
+                (result.pk, result.highlighted)
+                for result in self._query[start:stop]
+                if result is not None
+            ]
+            cache.set(key, page, self.timeout)
+
+        documents = (
+            PlanDocument.objects.select_related("council")
+            .defer("text")
+            .in_bulk([int(pk) for pk, _ in page])
+        )
+        return [
+            CachedResult(pk, highlighted, documents[int(pk)])
+            for pk, highlighted in page
+            if int(pk) in documents
+        ]
@@ -2,9 +2,11 @@
 Functions for use by the semantic search features
 """
 
+from __future__ import annotations
+
 import re
-from collections import namedtuple
-from itertools import groupby
+import time
+from collections import defaultdict, deque, namedtuple
 from typing import Optional, NamedTuple
 
 from django.conf import settings
@@ -12,8 +14,7 @@ from django.db.models import Q
 from haystack.inputs import Exact
 from haystack.query import SearchQuerySet
 
-from caps.models import KeyPhrase, KeyPhrasePairWise
-
+from caps.models import DataVersion, KeyPhrase, KeyPhrasePairWise
 
 highlighter_config = {
     "hl.simple.pre": "<mark>",
@@ -46,6 +47,133 @@ class KeyPhraseSearch(NamedTuple):
     has_common_word: bool
 
 
+class KeyPhraseMatcher:
+    """
+    The keyphrases held in an Aho-Corasick automaton, so all the keyphrases in
+    a search can be found in one pass over it, along with each keyphrase's
+    similar phrases.
+
+    There is one matcher per process, rebuilt once the keyphrases DataVersion
+    changes. If no import has recorded a version yet the matcher is kept under
+    NO_VERSION until one does.
+    """
+
+    # how long to trust the matcher's version before checking the database
+    VERSION_CHECK_AFTER = 60
+    # versions start at 1 once bumped
+    NO_VERSION = 0
+
+    _matcher = None
+    _checked = None
+
+    def __init__(self, version: Optional[int] = None):
+        self.version = version
+
+        phrases = KeyPhrase.objects.filter(keyphrase__length__gt=4).order_by("id")
+        self.ids = []
+        self.keyphrases = {}
+        for id, keyphrase in phrases.values_list("id", "keyphrase"):
+            self.ids.append(id)
+            self.keyphrases[id] = keyphrase
+
+        # the trie, with a dict of transitions, a failure link and the indexes
+        # of the phrases that end at each node
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+        for index, id in enumerate(self.ids):
+            node = 0
+            for char in self.keyphrases[id].lower():
+                next_node = self.goto[node].get(char)
+                if next_node is None:
+                    next_node = len(self.goto)
+                    self.goto[node][char] = next_node
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                node = next_node
+            self.output[node].append(index)
+
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, next_node in self.goto[node].items():
+                queue.append(next_node)
+                fail = self.fail[node]
+                while fail and char not in self.goto[fail]:
+                    fail = self.fail[fail]
+                self.fail[next_node] = self.goto[fail].get(char, 0)
+                self.output[next_node] += self.output[self.fail[next_node]]
+
+        # similar phrases for each phrase, most similar first
+        self.similar = defaultdict(list)
+        pairs = KeyPhrasePairWise.objects.order_by("-cosine_similarity", "id")
+        for (
+            word_a_id,
+            word_b_id,
+            cosine_similarity,
+            has_common_word,
+        ) in pairs.values_list(
+            "word_a_id", "word_b_id", "cosine_similarity", "has_common_word"
+        ):
+            if word_b_id in self.keyphrases:
+                self.similar[word_a_id].append(
+                    (word_b_id, cosine_similarity, has_common_word)
+                )
+
+    @classmethod
+    def get(cls) -> KeyPhraseMatcher:
+        now = time.monotonic()
+        if cls._checked is not None and now - cls._checked < cls.VERSION_CHECK_AFTER:
+            return cls._matcher
+
+        version = DataVersion.get_version(DataVersion.KEYPHRASES)
+        if version is None:
+            version = cls.NO_VERSION
+
+        matcher = cls._matcher
+        if matcher is None or matcher.version != version:
+            matcher = cls(version)
+
+        cls._matcher = matcher
+        cls._checked = now
+
+        return matcher
+
+    @classmethod
+    def clear(cls):
+        cls._matcher = None
+        cls._checked = None
+
+    def find(self, text: str) -> list[int]:
+        """
+        Ids of the keyphrases that appear anywhere in the text, ignoring case
+        """
+        found = set()
+        node = 0
+        for char in text.lower():
+            while node and char not in self.goto[node]:
+                node = self.fail[node]
+            node = self.goto[node].get(char, 0)
+            found.update(self.output[node])
+
+        return [self.ids[index] for index in sorted(found)]
+
+    def related(self, id: int, threshold: float) -> list[KeyPhraseSearch]:
+        """
+        Keyphrases similar to the keyphrase, most similar first
+        """
+        return [
+            KeyPhraseSearch(
+                keyphrase=self.keyphrases[word_b_id],
+                cosine_similarity=cosine_similarity,
+                has_common_word=has_common_word,
+            )
+            for word_b_id, cosine_similarity, has_common_word in self.similar[id]
+            if cosine_similarity >= threshold
+        ]
+
+
 def phrase_is_somewhere_in_list(phrase: str, list_of_phrases: list[str]) -> bool:
     """
     Check if a phrase is anywhere in a list of phrases
@@ -99,6 +227,7 @@ def get_semantic_query(
     q: str,
     threshold: float = settings.RELATED_SEARCH_THRESHOLD,
     limit_to_ids: Optional[list[int]] = None,
+    matcher: Optional[KeyPhraseMatcher] = None,
 ) -> tuple[Optional[SearchQuerySet], list[KeyPhraseSearch]]:
     """
     Run a semantic search query against the contents of the plan documents
@@ -108,74 +237,31 @@ def get_semantic_query(
     q_lower = q.lower()
 
     # get all the related terms
-    all_related = list(KeyPhrase.objects.filter(keyphrase__length__gt=4))
-    triggered_keywords = []
-    for related in all_related:
-        if related.keyphrase.lower() in q.lower():
-            triggered_keywords.append(related)
+    if matcher is None:
+        matcher = KeyPhraseMatcher.get()
+    triggered_keywords = matcher.find(q)
 
     if not triggered_keywords:
         return None, []
 
-    all_related_lookup = {x.id: x for x in all_related}
-
-    # for each term, we want to get all the related terms (same set_id)
+    # for each term, we want to get all the related terms
     # and then construct a complex query where the original term is replaced by the new term
     # e.g. if the original query is "housing" and the related term is "housing association"
     # we want to search for "housing association" OR "housing"
-    all_alternative_terms = KeyPhrasePairWise.objects.filter(
-        word_a_id__in=[x.id for x in triggered_keywords],
-        cosine_similarity__gte=threshold,
-    )
-
-    # group by word_a_id into a dict
-    grouped_related_terms = {
-        k: list(v) for k, v in groupby(all_alternative_terms, lambda x: x.word_a_id)
-    }
-
-    query_parts = []
     all_related_terms = []
-
-    def get_word_with_cosine(x: KeyPhrasePairWise) -> Optional[KeyPhrase]:
-        """
-        Get back to the phrase object we already have, but keep the cosine
-        from the comparison
-        """
-        obj = all_related_lookup.get(x.word_b_id, None)
-        if obj:
-            obj.cosine_similarity = x.cosine_similarity
-            obj.has_common_word = x.has_common_word
-            return obj
-
     query_parts = Q(text__iexact=Exact(q_lower))
-    for keyword in triggered_keywords:
-        # get grouped terms
-        keyword_terms = grouped_related_terms.get(keyword.id, [])
-        # sort by cosine similarity
-        keyword_terms = sorted(
-            keyword_terms, key=lambda x: x.cosine_similarity, reverse=True
-        )
-
-        # get back to a list of keyphases that we fetched earlier
-        related_terms = [get_word_with_cosine(x) for x in keyword_terms]
-        related_terms = [x for x in related_terms if x]
-        all_related_terms.extend(
-            [
-                KeyPhraseSearch(
-                    keyphrase=x.keyphrase,
-                    cosine_similarity=x.cosine_similarity,
-                    has_common_word=x.has_common_word,
-                )
-                for x in related_terms
-            ]
-        )
+    for keyword_id in triggered_keywords:
+        keyword = matcher.keyphrases[keyword_id]
+        related_terms = matcher.related(keyword_id, threshold)
+        all_related_terms.extend(related_terms)
 
         # construct the query
         for term in related_terms:
-            alt_text = q_lower.replace(keyword.keyphrase, term.keyphrase)
+            alt_text = q_lower.replace(keyword, term.keyphrase)
             query_parts |= Q(text__iexact=Exact(alt_text))
-        # run the query
-        sqs = SearchQuerySet().filter(query_parts)
+
+    # run the query
+    sqs = SearchQuerySet().filter(query_parts)
     # if given a specific set of documents limit to that
     if limit_to_ids:
         sqs = sqs.filter_and(django_id__in=limit_to_ids)
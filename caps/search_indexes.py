@@ -1,6 +1,5 @@
 from haystack import indexes
 from caps.models import PlanDocument
-from django.utils.html import strip_tags
 
 
 class PlanDocumentIndex(indexes.SearchIndex, indexes.Indexable):
@@ -14,18 +13,16 @@ class PlanDocumentIndex(indexes.SearchIndex, indexes.Indexable):
 
     def index_queryset(self, using=None):
         """Used when the entire index for model is updated."""
-        return self.get_model().objects.all()
+        return self.get_model().objects.select_related("council")
+
+    def read_queryset(self, using=None):
+        """Used to load the documents for search results."""
+        # the text is only needed for indexing
+        return self.index_queryset(using=using).defer("text")
 
     def prepare_council_name(self, document):
         return document.council.name
 
     def prepare_text(self, document):
-        try:
-            file = document.file.open()
-            extracted_data = self.get_backend().extract_file_contents(file)
-
-            # data is converted to html as part of the extraction
-            return strip_tags(extracted_data["contents"])
-        except:
-            print("problem preparing file: ", document.file.url)
-            return ""
+        # stored by PlanDocument.update_text
+        return document.text
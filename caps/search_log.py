@@ -0,0 +1,98 @@
+"""
+Searches made on the site, kept in memory and written to SavedSearch in bulk
+by a background thread, so logging a search doesn't add a database write to
+the search results page.
+
+Each process has its own queue and thread. Anything still queued is written
+when the process exits normally, but searches queued when a process is
+killed are lost, which is fine for a log that's only used for counting.
+"""
+
+import atexit
+import logging
+import queue
+import threading
+from typing import Optional
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from caps.models import SavedSearch
+
+logger = logging.getLogger(__name__)
+
+
+class SearchLog:
+    batch_size = 100
+
+    def __init__(self):
+        self.queue = queue.SimpleQueue()
+        self.wake = threading.Event()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    @property
+    def flush_interval(self) -> Optional[int]:
+        """
+        Seconds between writes from the background thread. If this is None
+        the thread isn't started and searches are only written by calling
+        flush.
+        """
+        return getattr(settings, "SEARCH_LOG_FLUSH_INTERVAL", 30)
+
+    def log(self, **fields):
+        """
+        Queue a search with the fields of a SavedSearch
+        """
+        fields.setdefault("created", timezone.now())
+        self.queue.put(fields)
+
+        if self.flush_interval is not None:
+            self.start()
+            if self.queue.qsize() >= self.batch_size:
+                self.wake.set()
+
+    def flush(self) -> int:
+        """
+        Write everything in the queue, returning the number of searches
+        written.
+        """
+        searches = []
+        while True:
+            try:
+                searches.append(SavedSearch(**self.queue.get_nowait()))
+            except queue.Empty:
+                break
+
+        if searches:
+            SavedSearch.objects.bulk_create(searches, batch_size=self.batch_size)
+
+        return len(searches)
+
+    def start(self):
+        with self.lock:
+            if self.thread is not None and self.thread.is_alive():
+                return
+
+            self.thread = threading.Thread(
+                target=self.run, name="search-log", daemon=True
+            )
+            self.thread.start()
+            atexit.register(self.flush)
+
+    def run(self):
+        while True:
+            self.wake.wait(self.flush_interval)
+            self.wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("problem saving searches")
+            finally:
+                # the thread holds its own connection, don't leave it open
+                # between flushes
+                connection.close()
+
+
+search_log = SearchLog()
@@ -1,10 +1,29 @@
+from datetime import date, timedelta
 from io import StringIO
+from unittest.mock import patch
 
 from django.test import TestCase
+from django.utils import timezone
+from haystack.backends.solr_backend import SolrSearchBackend
+from pysolr import Solr
 
 import unittest
 from django.core.management import call_command
-from caps.models import Council, PlanDocument, Promise, Tag, CouncilTag
+from django.core.management.base import CommandError
+from caps.models import (
+    CachedSearch,
+    Council,
+    CouncilTag,
+    DataVersion,
+    KeyPhrase,
+    PlanDocument,
+    Promise,
+    Tag,
+)
+from caps.management.commands.import_related_searches import (
+    run_changed_searches,
+    run_searches,
+)
 
 from caps.management.commands.import_council_tags import (
     create_tags,
@@ -230,6 +249,37 @@ class ImportPlansTestCase(ImportTestCase):
                 plan.url, "https://borsetshire.gov.uk/climate_plan_updated.pdf"
             )
 
+    def test_history_without_text(self):
+        with self.settings(PROCESSED_CSV="caps/tests/test_processed.csv"):
+            self.call_command(confirm_changes=1)
+
+        PlanDocument.objects.update(text="climate plan")
+        with self.settings(PROCESSED_CSV="caps/tests/test_processed_update.csv"):
+            self.call_command(confirm_changes=1)
+
+        fields = [field.name for field in PlanDocument.history.model._meta.fields]
+        self.assertNotIn("text", fields)
+        self.assertEqual(PlanDocument.history.filter(history_type="~").count(), 1)
+        # the text isn't lost when the plan is updated without it loaded
+        council = Council.objects.get(authority_code="BORS")
+        self.assertEqual(PlanDocument.objects.get(council=council).text, "climate plan")
+
+    def test_change_gss_code(self):
+        council = Council.objects.get(authority_code="BORS")
+        with self.settings(PROCESSED_CSV="caps/tests/test_processed.csv"):
+            self.call_command(confirm_changes=1)
+            plan = PlanDocument.objects.get(council=council)
+
+        with self.settings(PROCESSED_CSV="caps/tests/test_processed_gss_change.csv"):
+            self.call_command(confirm_changes=1)
+
+            council.refresh_from_db()
+            self.assertEqual(council.gss_code, "E00000009")
+            plans = PlanDocument.objects.filter(council=council)
+            self.assertEqual(plans.count(), 1)
+            self.assertEqual(plans[0].id, plan.id)
+            self.assertEqual(PlanDocument.objects.count(), 2)
+
     def test_delete_plan(self):
         bors = Council.objects.get(authority_code="BORS")
         # Import the data from test_processed_pre_delete
@@ -356,3 +406,172 @@ class ImportTagsTestCase(TestCase):
             tag = Tag.objects.get(slug="question")
             count = CouncilTag.objects.filter(tag=tag).count()
             self.assertEqual(count, 2)
+
+
+class ImportRelatedSearchesTestCase(ImportTestCase):
+    def setUp(self):
+        super().setUp()
+        council = Council.objects.get(authority_code="BORS")
+        self.plans = [
+            PlanDocument.objects.create(
+                council=council,
+                url=f"http://example.com/{n}",
+                url_hash=f"xxxxxx{n}",
+                file_type="PDF",
+                document_type=PlanDocument.ACTION_PLAN,
+            )
+            for n in range(2)
+        ]
+        self.heat_pumps = KeyPhrase.objects.create(
+            keyphrase="heat pumps", highlight=True
+        )
+        self.solar = KeyPhrase.objects.create(keyphrase="solar panels", highlight=True)
+
+    def fake_search(self, counts):
+        def search_keyphrase(keyphrase, matcher, limit_to_ids=None):
+            return [
+                (plan.id, counts[keyphrase.keyphrase])
+                for plan in self.plans
+                if limit_to_ids is None or plan.id in limit_to_ids
+            ]
+
+        return patch(
+            "caps.management.commands.import_related_searches.search_keyphrase",
+            search_keyphrase,
+        )
+
+    def get_counts(self):
+        return set(
+            CachedSearch.objects.values_list(
+                "search_term__keyphrase", "document_id", "count"
+            )
+        )
+
+    def test_run_searches(self):
+        with self.fake_search({"heat pumps": 2, "solar panels": 0}):
+            run_searches(workers=2)
+
+        self.assertEqual(
+            self.get_counts(),
+            {("heat pumps", self.plans[0].id, 2), ("heat pumps", self.plans[1].id, 2)},
+        )
+        self.assertIsNotNone(DataVersion.get_version(DataVersion.CACHED_SEARCHES))
+
+    def test_only_changed_documents_searched(self):
+        with self.fake_search({"heat pumps": 2, "solar panels": 0}):
+            run_searches()
+
+        PlanDocument.objects.filter(pk=self.plans[0].pk).update(
+            updated_at=date.today() - timedelta(days=7)
+        )
+        with self.fake_search({"heat pumps": 1, "solar panels": 3}):
+            run_changed_searches(workers=2)
+
+        self.assertEqual(
+            self.get_counts(),
+            {
+                ("heat pumps", self.plans[0].id, 2),
+                ("heat pumps", self.plans[1].id, 1),
+                ("solar panels", self.plans[1].id, 3),
+            },
+        )
+
+    def test_changed_during_searches(self):
+        searched = []
+
+        def search_keyphrase(keyphrase, matcher, limit_to_ids=None):
+            searched.append(timezone.now())
+            return [(plan.id, 2) for plan in self.plans]
+
+        with patch(
+            "caps.management.commands.import_related_searches.search_keyphrase",
+            search_keyphrase,
+        ):
+            run_searches()
+
+        # text extracted while the searches ran, after the document was searched
+        PlanDocument.objects.filter(pk=self.plans[0].pk).update(
+            text_updated=max(searched)
+        )
+        PlanDocument.objects.update(updated_at=date.today() - timedelta(days=7))
+        with self.fake_search({"heat pumps": 1, "solar panels": 3}):
+            run_changed_searches()
+
+        self.assertEqual(
+            self.get_counts(),
+            {
+                ("heat pumps", self.plans[0].id, 1),
+                ("solar panels", self.plans[0].id, 3),
+                ("heat pumps", self.plans[1].id, 2),
+                ("solar panels", self.plans[1].id, 2),
+            },
+        )
+
+
+class IndexPlansTestCase(ImportTestCase):
+    def setUp(self):
+        super().setUp()
+        council = Council.objects.get(authority_code="BORS")
+        self.plans = [
+            PlanDocument.objects.create(
+                council=council,
+                url=f"http://example.com/{n}",
+                url_hash=f"xxxxxx{n}",
+                file_type="PDF",
+                text=f"plan {n}",
+            )
+            for n in range(3)
+        ]
+
+    def index_plans(self, **kwargs):
+        indexed = []
+        removed = []
+
+        def update(backend, index, iterable, commit=True):
+            indexed.extend(index.full_prepare(obj)["text"] for obj in iterable)
+
+        def delete(solr, id=None, **kwargs):
+            removed.extend(id)
+
+        with patch.object(SolrSearchBackend, "update", update), patch.object(
+            Solr, "delete", delete
+        ):
+            call_command("index_plans", stdout=StringIO(), **kwargs)
+
+        return indexed, removed
+
+    def test_index_all(self):
+        indexed, removed = self.index_plans(changed=True)
+        self.assertEqual(sorted(indexed), ["plan 0", "plan 1", "plan 2"])
+        self.assertEqual(removed, [])
+        self.assertIsNotNone(DataVersion.get_version(DataVersion.SEARCH_INDEX))
+
+    def test_index_changed(self):
+        self.index_plans()
+
+        # as if the plans were added before the last index update
+        PlanDocument.history.update(history_date=timezone.now() - timedelta(days=7))
+
+        self.plans[0].text = "new plan 0"
+        self.plans[0].save()
+        deleted_id = self.plans[1].id
+        self.plans[1].delete()
+
+        indexed, removed = self.index_plans(changed=True)
+        self.assertEqual(indexed, ["new plan 0"])
+        self.assertEqual(removed, [f"caps.plandocument.{deleted_id}"])
+
+        indexed, removed = self.index_plans(changed=True)
+        self.assertEqual(indexed, [])
+        self.assertEqual(removed, [])
+
+        # text stored by update_text doesn't make a history record
+        PlanDocument.objects.filter(id=self.plans[2].id).update(
+            text_updated=timezone.now()
+        )
+        indexed, removed = self.index_plans(changed=True)
+        self.assertEqual(indexed, ["plan 2"])
+
+    def test_changed_and_clear(self):
+        with self.assertRaises(CommandError):
+            self.index_plans(changed=True, clear=True)
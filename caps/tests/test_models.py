@@ -1,6 +1,35 @@
+import pickle
+from datetime import date
+from unittest import skipUnless
+
+import pandas as pd
+from django.db import connection, models
 from django.test import TestCase
 
-from caps.models import Council, PlanDocument, SavedSearch
+from caps.keyphrase_matrix import KeyPhraseMatrix
+from caps.models import (
+    CachedSearch,
+    ComparisonLabel,
+    ComparisonLabelAssignment,
+    ComparisonType,
+    Council,
+    DataPoint,
+    DataType,
+    DataVersion,
+    Distance,
+    EmergencyDeclaration,
+    EmissionsSeries,
+    KeyPhrase,
+    KeyPhrasePairWise,
+    PlanDocument,
+    Promise,
+    RelatedCouncilGroups,
+    SavedSearch,
+    copy_df_to_model,
+    get_copy_df,
+    get_copy_value,
+    save_df_to_model,
+)
 from caps.utils import boolean_from_text
 
 
@@ -309,3 +338,430 @@ class CouncilFoeSlugTestCase(TestCase):
         )
 
         self.assertEqual(council.foe_slug, "somewheres-there-under-that")
+
+
+class EmissionsSeriesTestCase(TestCase):
+    def setUp(self):
+        self.council = Council.objects.create(
+            name="Borsetshire",
+            slug="borsetshire",
+            country=Council.ENGLAND,
+            gss_code="E00000001",
+            authority_code="BOR",
+        )
+        for name, values in (
+            ("Industry Total", {2019: 10, 2020: 30}),
+            ("Domestic Total", {2019: 20, 2020: 10}),
+            ("Total Emissions", {2020: 40}),
+        ):
+            data_type = DataType.objects.create(
+                name=name,
+                name_in_source=name,
+                collection=DataType.DataCollection.EMISSIONS,
+            )
+            for year, value in values.items():
+                DataPoint.objects.create(
+                    council=self.council, data_type=data_type, year=year, value=value
+                )
+
+    def test_build(self):
+        self.assertEqual(EmissionsSeries.build(), 1)
+
+        council = Council.objects.get(pk=self.council.pk)
+        with self.assertNumQueries(1):
+            series = EmissionsSeries.for_council(council)
+            self.assertEqual(series.latest_year, 2020)
+            self.assertEqual(series.get_value(2020, "Total Emissions"), 40)
+            self.assertIsNone(series.get_value(2019, "Total Emissions"))
+            self.assertIsNone(series.get_value(2018, "Total Emissions"))
+            self.assertEqual(
+                series.sector_totals().values.tolist(),
+                [
+                    [2019, "Industry Total", 10],
+                    [2020, "Industry Total", 30],
+                    [2019, "Domestic Total", 20],
+                    [2020, "Domestic Total", 10],
+                ],
+            )
+
+    def test_built_when_missing(self):
+        series = EmissionsSeries.for_council(self.council)
+        self.assertEqual(series.years, [2019, 2020])
+        self.assertTrue(EmissionsSeries.objects.filter(council=self.council).exists())
+
+        other = Council.objects.create(
+            name="Setborshire",
+            slug="setborshire",
+            country=Council.ENGLAND,
+            gss_code="E00000002",
+            authority_code="SET",
+        )
+        self.assertIsNone(EmissionsSeries.for_council(other))
+
+        # stored empty so it's not built again
+        other = Council.objects.get(pk=other.pk)
+        with self.assertNumQueries(1):
+            self.assertIsNone(EmissionsSeries.for_council(other))
+
+    def test_current_emissions_breakdown(self):
+        df = self.council.current_emissions_breakdown(2020)
+        self.assertEqual(
+            df[["emissions_type", "percentage"]].values.tolist(),
+            [["Industry", "75%"], ["Domestic", "25%"]],
+        )
+
+
+class DataPointLoadTestCase(TestCase):
+    def setUp(self):
+        self.council = Council.objects.create(
+            name="Borsetshire",
+            slug="borsetshire",
+            country=Council.ENGLAND,
+            gss_code="E00000001",
+            authority_code="BOR",
+        )
+        self.data_type = DataType.objects.create(
+            name="Total Emissions",
+            name_in_source="Total Emissions",
+            collection=DataType.DataCollection.EMISSIONS,
+        )
+        self.polling_type = DataType.objects.create(
+            name="Q1", name_in_source="Q1", collection=DataType.DataCollection.POLLING
+        )
+        DataPoint.objects.create(
+            council=self.council, data_type=self.polling_type, year=2022, value=50
+        )
+
+    def load(self, values):
+        df = pd.DataFrame(
+            [
+                {
+                    "council_id": self.council.id,
+                    "data_type_id": self.data_type.id,
+                    "year": year,
+                    "value": value,
+                }
+                for year, value in values.items()
+            ]
+        )
+        return DataPoint.load(df, DataType.DataCollection.EMISSIONS)
+
+    def get_values(self):
+        return dict(
+            DataPoint.objects.filter(data_type=self.data_type).values_list(
+                "year", "value"
+            )
+        )
+
+    def test_load(self):
+        self.assertEqual(self.load({2019: 10, 2020: 20}), (2, 0, 0))
+        self.assertEqual(self.get_values(), {2019: 10, 2020: 20})
+
+        unchanged = DataPoint.objects.get(data_type=self.data_type, year=2020)
+        self.assertEqual(self.load({2020: 20, 2021: 30, 2022: None}), (1, 0, 1))
+        self.assertEqual(self.get_values(), {2020: 20, 2021: 30})
+        self.assertEqual(
+            DataPoint.objects.get(data_type=self.data_type, year=2020).pk,
+            unchanged.pk,
+        )
+
+        self.assertEqual(self.load({2020: 25, 2021: 30}), (0, 1, 0))
+        self.assertEqual(self.get_values(), {2020: 25, 2021: 30})
+
+        self.assertEqual(self.load({2020: 25, 2021: 30}), (0, 0, 0))
+
+        # other collections are left alone
+        self.assertEqual(
+            DataPoint.objects.filter(data_type=self.polling_type).count(), 1
+        )
+
+
+class SaveDfToModelTestCase(TestCase):
+    def setUp(self):
+        self.phrases = pd.DataFrame({"keyphrase": ["heat pumps", "solar panels"]})
+
+    def test_save(self):
+        save_df_to_model(KeyPhrase, self.phrases.assign(ignored=1), quiet=True)
+        ids = dict(KeyPhrase.objects.values_list("keyphrase", "id"))
+
+        pairs = pd.DataFrame(
+            {
+                "word_a_id": [ids["heat pumps"], None],
+                "word_b_id": [ids["solar panels"], ids["heat pumps"]],
+                "nth_similar": [1, 2],
+                "cosine_similarity": [0.8, 0.7],
+                "has_common_word": [False, False],
+            }
+        ).dropna()
+        save_df_to_model(KeyPhrasePairWise, pairs, quiet=True)
+
+        pair = KeyPhrasePairWise.objects.get()
+        self.assertEqual(pair.word_a.keyphrase, "heat pumps")
+        self.assertEqual(pair.word_b.keyphrase, "solar panels")
+
+    def test_copy_df(self):
+        df = get_copy_df(KeyPhrase, self.phrases.assign(ignored=1))
+        self.assertEqual(
+            df.to_dict("records"),
+            [
+                {
+                    "keyphrase": "heat pumps",
+                    "nice_phrase": "",
+                    "plan_count": 0,
+                    "average_frequency": 0,
+                    "highlight": False,
+                },
+                {
+                    "keyphrase": "solar panels",
+                    "nice_phrase": "",
+                    "plan_count": 0,
+                    "average_frequency": 0,
+                    "highlight": False,
+                },
+            ],
+        )
+
+        pairs = pd.DataFrame(
+            {"word_a_id": [1.0, None], "cosine_similarity": [0.8, 0.7]}
+        )
+        df = get_copy_df(KeyPhrasePairWise, pairs)
+        self.assertEqual(str(df["word_a_id"].dtype), "Int64")
+        self.assertEqual(
+            df[["word_a_id", "cosine_similarity"]].to_csv(
+                index=False, header=False, na_rep="\\N"
+            ),
+            "1,0.8\n\\N,0.7\n",
+        )
+
+    def test_copy_df_json(self):
+        groups = pd.DataFrame({"council_id": [1], "groups": [{"composite": [1, 2]}]})
+        df = get_copy_df(RelatedCouncilGroups, groups)
+        self.assertEqual(
+            df[["council_id", "groups"]].to_csv(index=False, header=False),
+            '1,"{""composite"": [1, 2]}"\n',
+        )
+
+        field = models.JSONField(default=dict)
+        self.assertEqual(get_copy_value(field, field.get_default()), "{}")
+        self.assertIsNone(get_copy_value(field, None))
+
+
+@skipUnless(connection.vendor == "postgresql", "COPY needs PostgreSQL")
+class CopyDfToModelTestCase(TestCase):
+    def test_copy(self):
+        phrases = pd.DataFrame({"keyphrase": ["heat pumps", "solar panels"]})
+        copy_df_to_model(KeyPhrase, phrases, quiet=True)
+        self.assertEqual(
+            list(
+                KeyPhrase.objects.order_by("keyphrase").values_list(
+                    "keyphrase", "nice_phrase", "highlight"
+                )
+            ),
+            [("heat pumps", "", False), ("solar panels", "", False)],
+        )
+
+        council = Council.objects.create(
+            name="Borsetshire",
+            slug="borsetshire",
+            country=Council.ENGLAND,
+            authority_code="BORS",
+        )
+        groups = pd.DataFrame(
+            {"council_id": [council.id], "groups": [{"composite": [1, 2]}]}
+        )
+        copy_df_to_model(RelatedCouncilGroups, groups, quiet=True)
+        self.assertEqual(
+            RelatedCouncilGroups.objects.get(council=council).groups,
+            {"composite": [1, 2]},
+        )
+
+
+class KeyPhraseMatrixTestCase(TestCase):
+    def setUp(self):
+        KeyPhraseMatrix.clear()
+        self.councils = [
+            Council.objects.create(
+                name=name,
+                slug=name.lower(),
+                country=Council.ENGLAND,
+                gss_code=f"E0000000{n}",
+                authority_code=name[:4].upper(),
+            )
+            for n, name in enumerate(["Borsetshire", "Setborshire", "Wessex"])
+        ]
+        self.heat_pumps, self.solar, self.buses = [
+            KeyPhrase.objects.create(keyphrase=keyphrase)
+            for keyphrase in ("heat pumps", "solar panels", "buses")
+        ]
+        for council, keyphrases in (
+            (self.councils[0], [self.heat_pumps, self.solar]),
+            (self.councils[1], [self.solar, self.buses]),
+        ):
+            document = PlanDocument.objects.create(
+                council=council,
+                url=f"http://example.com/{council.slug}",
+                url_hash=council.authority_code,
+                file_type="PDF",
+            )
+            for keyphrase in keyphrases:
+                CachedSearch.objects.create(
+                    search_term=keyphrase, document=document, count=1
+                )
+
+    def tearDown(self):
+        KeyPhraseMatrix.clear()
+
+    def test_no_matrix_without_version(self):
+        self.assertIsNone(KeyPhraseMatrix.get())
+
+    def test_keyphrase_intersection(self):
+        borsetshire, setborshire, wessex = self.councils
+        DataVersion.bump(DataVersion.CACHED_SEARCHES)
+        KeyPhraseMatrix.get()
+
+        # which councils have documents, and the keyphrases
+        with self.assertNumQueries(2):
+            overlap = borsetshire.keyphrase_intersection(setborshire)[setborshire]
+        self.assertEqual(overlap.overlap, [self.solar])
+        self.assertEqual(overlap.just_in_a, [self.heat_pumps])
+        self.assertEqual(overlap.just_in_b, [self.buses])
+
+        # the same as from the database
+        KeyPhraseMatrix.clear()
+        DataVersion.objects.all().delete()
+        from_database = borsetshire.keyphrase_intersection(setborshire)[setborshire]
+        self.assertEqual(
+            [sorted(x, key=lambda k: k.id) for x in from_database],
+            [sorted(x, key=lambda k: k.id) for x in overlap],
+        )
+
+    def test_council_without_documents(self):
+        borsetshire, setborshire, wessex = self.councils
+        DataVersion.bump(DataVersion.CACHED_SEARCHES)
+
+        overlap = borsetshire.keyphrase_intersection(wessex)[wessex]
+        self.assertEqual(overlap, ([], [], []))
+
+
+class RelatedCouncilGroupsTestCase(TestCase):
+    def setUp(self):
+        self.councils = [
+            Council.objects.create(
+                name=name,
+                slug=name.lower(),
+                country=Council.ENGLAND,
+                authority_type=authority_type,
+                gss_code=f"E0000000{i}",
+                authority_code=name[:3].upper(),
+            )
+            for i, (name, authority_type) in enumerate(
+                (
+                    ("Borsetshire", "CTY"),
+                    ("Setborshire", "CTY"),
+                    ("Felpersham", "UA"),
+                    ("Ambridge", "NMD"),
+                )
+            )
+        ]
+        self.composite = ComparisonType.objects.create(slug="composite", name="Overall")
+        self.label = ComparisonLabel.objects.create(
+            slug="rural", name="Rural", type=self.composite
+        )
+        for council in self.councils:
+            ComparisonLabelAssignment.objects.create(label=self.label, council=council)
+
+        main = self.councils[0]
+        for position, (council, match_score) in enumerate(
+            zip(self.councils[1:], (70, 90, 80)), start=1
+        ):
+            Distance.objects.create(
+                council_a=main,
+                council_b=council,
+                type=self.composite,
+                distance=100 - match_score,
+                match_score=match_score,
+                position=position,
+            )
+
+        PlanDocument.objects.create(
+            council=self.councils[2],
+            url="https://example.com/plan.pdf",
+            document_type=PlanDocument.ACTION_PLAN,
+        )
+        Promise.objects.create(
+            council=self.councils[2], target_year=2030, has_promise=True
+        )
+        EmergencyDeclaration.objects.create(
+            council=self.councils[1], date_declared=date(2019, 7, 1)
+        )
+
+    def test_build(self):
+        # an empty row for the councils with no related councils
+        self.assertEqual(RelatedCouncilGroups.build(), 4)
+
+        council = Council.objects.get(pk=self.councils[0].pk)
+        with self.assertNumQueries(4):
+            groups = council.get_related_councils()
+
+        self.assertEqual(len(groups), 1)
+        self.assertEqual(groups[0]["type"], self.composite)
+        self.assertEqual(groups[0]["label"], self.label)
+
+        related = groups[0]["councils"]
+        self.assertEqual(
+            [c.name for c in related], ["Felpersham", "Ambridge", "Setborshire"]
+        )
+        self.assertEqual(related[0].match_score, 90)
+        self.assertEqual(related[0].num_plans, 1)
+        self.assertEqual(related[0].earliest_promise, 2030)
+        self.assertIsNone(related[0].declared_emergency)
+        self.assertEqual(related[2].num_plans, 0)
+        self.assertEqual(related[2].declared_emergency, date(2019, 7, 1))
+        # everything else comes from the council
+        self.assertEqual(
+            related[0].get_absolute_url(), related[0].council.get_absolute_url()
+        )
+
+        self.assertEqual(
+            [c.name for c in council.get_related_councils(cut_off=1)[0]["councils"]],
+            ["Felpersham"],
+        )
+        self.assertEqual(
+            [c.name for c in council.get_related_councils(5, "county")[0]["councils"]],
+            ["Setborshire"],
+        )
+
+    def test_built_when_missing(self):
+        groups = self.councils[0].get_related_councils()
+        self.assertEqual(len(groups[0]["councils"]), 3)
+        self.assertTrue(
+            RelatedCouncilGroups.objects.filter(council=self.councils[0]).exists()
+        )
+
+        self.assertEqual(self.councils[1].get_related_councils(), [])
+
+        # stored empty so it's not built again
+        council = Council.objects.get(pk=self.councils[1].pk)
+        with self.assertNumQueries(1):
+            self.assertEqual(council.get_related_councils(), [])
+
+    def test_build_councils(self):
+        self.assertEqual(RelatedCouncilGroups.build(self.councils[:2]), 2)
+        self.assertEqual(
+            set(RelatedCouncilGroups.objects.values_list("council_id", flat=True)),
+            {self.councils[0].pk, self.councils[1].pk},
+        )
+        self.assertEqual(
+            RelatedCouncilGroups.objects.get(council=self.councils[1]).groups, []
+        )
+
+        groups = RelatedCouncilGroups.objects.get(council=self.councils[0]).groups
+        self.assertEqual(groups[0]["label"], self.label.pk)
+        self.assertEqual(
+            [c["label"] for c in groups[0]["councils"]], [self.label.pk] * 3
+        )
+
+    def test_pickle(self):
+        related = self.councils[0].get_related_councils()[0]["councils"]
+        unpickled = pickle.loads(pickle.dumps(related))
+        self.assertEqual([c.slug for c in unpickled], [c.slug for c in related])
@@ -0,0 +1,121 @@
+import threading
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+
+import requests
+from django.test import TestCase
+
+from caps.management.commands.preprocess import (
+    HostLimiter,
+    get_cache_header,
+    get_plan,
+    get_retry_requester,
+)
+
+
+def make_response(status_code, content=b"", **headers):
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = content
+    response.headers.update(headers)
+    return response
+
+
+class GetPlanTestCase(TestCase):
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        self.settings_override = self.settings(PLANS_DIR=self.tmp.name)
+        self.settings_override.enable()
+        self.plan = {"council": "Borsetshire", "url": "https://example.com/plan.pdf"}
+        self.limiter = HostLimiter(1)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.tmp.cleanup()
+
+    def get_plan(self, plan, response):
+        with patch.object(requests.Session, "get", return_value=response) as get:
+            result = get_plan(plan, self.limiter)
+        return result, get.call_args.kwargs["headers"]
+
+    def test_downloaded(self):
+        result, headers = self.get_plan(
+            self.plan,
+            make_response(
+                200,
+                b"%PDF",
+                **{
+                    "Content-Type": "application/pdf",
+                    "ETag": '"abc"',
+                    "Last-Modified": "Mon, 01 Jan 2024 00:00:00 GMT",
+                },
+            ),
+        )
+
+        self.assertNotIn("If-None-Match", headers)
+        self.assertEqual(result["file_type"], "pdf")
+        self.assertEqual(result["etag"], '"abc"')
+        self.assertEqual(result["last_modified"], "Mon, 01 Jan 2024 00:00:00 GMT")
+        self.assertEqual(Path(result["plan_path"]).read_bytes(), b"%PDF")
+
+    def test_not_modified(self):
+        previous = {
+            "file_type": "pdf",
+            "charset": None,
+            "etag": '"abc"',
+            "last_modified": "Mon, 01 Jan 2024 00:00:00 GMT",
+            "plan_path": "borsetshire.pdf",
+        }
+        result, headers = self.get_plan(
+            {**self.plan, "previous": previous}, make_response(304)
+        )
+
+        self.assertEqual(headers["If-None-Match"], '"abc"')
+        self.assertEqual(headers["If-Modified-Since"], "Mon, 01 Jan 2024 00:00:00 GMT")
+        self.assertIs(result, previous)
+        self.assertEqual(list(Path(self.tmp.name).iterdir()), [])
+
+    def test_failed(self):
+        with patch.object(
+            requests.Session, "get", side_effect=requests.exceptions.ConnectionError
+        ), patch("builtins.print"):
+            self.assertIsNone(get_plan(self.plan, self.limiter))
+
+    def test_cache_header_too_long(self):
+        response = make_response(
+            200, **{"ETag": "x" * 256, "Last-Modified": "Mon, 01 Jan 2024"}
+        )
+        self.assertEqual(get_cache_header(response, "etag"), "")
+        self.assertEqual(
+            get_cache_header(response, "last-modified"), "Mon, 01 Jan 2024"
+        )
+        self.assertEqual(get_cache_header(make_response(200), "etag"), "")
+
+
+class HostLimiterTestCase(TestCase):
+    def test_per_host(self):
+        limiter = HostLimiter(2)
+        semaphore = limiter.for_url("https://example.com/plan.pdf")
+        self.assertIs(semaphore, limiter.for_url("https://EXAMPLE.com/other.pdf"))
+
+        self.assertTrue(semaphore.acquire(blocking=False))
+        self.assertTrue(semaphore.acquire(blocking=False))
+        self.assertFalse(semaphore.acquire(blocking=False))
+
+        # other hosts aren't held up
+        self.assertTrue(
+            limiter.for_url("https://example.org/plan.pdf").acquire(blocking=False)
+        )
+
+
+class RetryRequesterTestCase(TestCase):
+    def test_session_per_thread(self):
+        session = get_retry_requester()
+        self.assertIs(get_retry_requester(), session)
+
+        other = []
+        thread = threading.Thread(target=lambda: other.append(get_retry_requester()))
+        thread.start()
+        thread.join()
+        self.assertIsNot(other[0], session)
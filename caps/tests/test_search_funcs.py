@@ -0,0 +1,181 @@
+from types import SimpleNamespace
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from caps.forms import HighlightedSearchForm
+from caps.models import Council, DataVersion, KeyPhrase, KeyPhrasePairWise, PlanDocument
+from caps.search_cache import CachedSearchResults
+from caps.search_funcs import KeyPhraseMatcher, KeyPhraseSearch, get_semantic_query
+
+
+class KeyPhraseMatcherTestCase(TestCase):
+    def setUp(self):
+        KeyPhraseMatcher.clear()
+        self.heat_pumps = KeyPhrase.objects.create(keyphrase="heat pumps")
+        self.pumps = KeyPhrase.objects.create(keyphrase="pumps")
+        self.air_source = KeyPhrase.objects.create(keyphrase="air source heat pumps")
+        self.solar = KeyPhrase.objects.create(keyphrase="solar panels")
+        # too short to be matched
+        self.bus = KeyPhrase.objects.create(keyphrase="bus")
+
+        for word_b, cosine_similarity in (
+            (self.air_source, 0.9),
+            (self.solar, 0.6),
+            (self.bus, 0.8),
+        ):
+            KeyPhrasePairWise.objects.create(
+                word_a=self.heat_pumps,
+                word_b=word_b,
+                nth_similar=1,
+                cosine_similarity=cosine_similarity,
+                has_common_word=False,
+            )
+
+    def tearDown(self):
+        KeyPhraseMatcher.clear()
+
+    def test_find(self):
+        matcher = KeyPhraseMatcher()
+        self.assertEqual(
+            matcher.find("Air Source Heat Pumps and a bus"),
+            [self.heat_pumps.id, self.pumps.id, self.air_source.id],
+        )
+        self.assertEqual(matcher.find("solar"), [])
+
+    def test_related(self):
+        matcher = KeyPhraseMatcher()
+        self.assertEqual(
+            matcher.related(self.heat_pumps.id, 0.5),
+            [
+                KeyPhraseSearch("air source heat pumps", 0.9, False),
+                KeyPhraseSearch("solar panels", 0.6, False),
+            ],
+        )
+        self.assertEqual(
+            matcher.related(self.heat_pumps.id, 0.7),
+            [KeyPhraseSearch("air source heat pumps", 0.9, False)],
+        )
+        self.assertEqual(matcher.related(self.solar.id, 0.5), [])
+
+    def test_semantic_query(self):
+        sqs, related = get_semantic_query("heat pumps", threshold=0.5)
+        self.assertEqual(
+            sorted(x.keyphrase for x in related),
+            ["air source heat pumps", "solar panels"],
+        )
+
+        sqs, related = get_semantic_query("retrofit")
+        self.assertIsNone(sqs)
+        self.assertEqual(related, [])
+
+    def test_matcher_kept_until_new_version(self):
+        DataVersion.bump(DataVersion.KEYPHRASES)
+        matcher = KeyPhraseMatcher.get()
+
+        with self.assertNumQueries(0):
+            self.assertIs(KeyPhraseMatcher.get(), matcher)
+            get_semantic_query("heat pumps")
+
+        KeyPhrase.objects.create(keyphrase="retrofit")
+        DataVersion.bump(DataVersion.KEYPHRASES)
+        KeyPhraseMatcher._checked = None
+        self.assertEqual(len(KeyPhraseMatcher.get().find("retrofit")), 1)
+
+    def test_matcher_kept_without_version(self):
+        matcher = KeyPhraseMatcher.get()
+        self.assertEqual(matcher.version, KeyPhraseMatcher.NO_VERSION)
+
+        with self.assertNumQueries(0):
+            self.assertIs(KeyPhraseMatcher.get(), matcher)
+
+        # only the version is checked once it's due
+        KeyPhraseMatcher._checked = None
+        with self.assertNumQueries(1):
+            self.assertIs(KeyPhraseMatcher.get(), matcher)
+
+        DataVersion.bump(DataVersion.KEYPHRASES)
+        KeyPhraseMatcher._checked = None
+        self.assertEqual(KeyPhraseMatcher.get().version, 1)
+
+
+class CachedSearchResultsTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        council = Council.objects.create(
+            name="Borsetshire",
+            slug="borsetshire",
+            country=Council.ENGLAND,
+            gss_code="E00000001",
+            authority_code="BOR",
+        )
+        self.plans = [
+            PlanDocument.objects.create(
+                council=council, url=f"https://example.com/{n}.pdf"
+            )
+            for n in range(5)
+        ]
+        self.related = [KeyPhraseSearch("heat pumps", 0.9, False)]
+        self.searches = 0
+
+    def tearDown(self):
+        cache.clear()
+
+    def search(self):
+        self.searches += 1
+        results = [
+            SimpleNamespace(pk=str(plan.id), highlighted={"text": [f"plan {n}"]})
+            for n, plan in enumerate(self.plans)
+        ]
+        return results, self.related
+
+    def test_cached(self):
+        results = CachedSearchResults("search:test", self.search)
+        self.assertEqual(results.related_terms, self.related)
+        self.assertEqual(results.count(), 5)
+        page = results[2:4]
+        self.assertEqual([r.object for r in page], self.plans[2:4])
+        self.assertIn("text", page[0].object.get_deferred_fields())
+        self.assertEqual(page[0].highlighted, {"text": ["plan 2"]})
+        self.assertEqual(self.searches, 1)
+
+        results = CachedSearchResults("search:test", self.search)
+        # just loading the documents for each page
+        with self.assertNumQueries(2):
+            self.assertEqual(results.related_terms, self.related)
+            self.assertEqual(len(results), 5)
+            self.assertEqual([r.object for r in results[2:4]], self.plans[2:4])
+            self.assertEqual(results[2:4][0].pk, str(self.plans[2].id))
+        self.assertEqual(self.searches, 1)
+
+        # a page that's not been seen yet
+        self.assertEqual([r.object for r in results[4:6]], self.plans[4:])
+        self.assertEqual(self.searches, 2)
+
+    def test_deleted_documents_skipped(self):
+        results = CachedSearchResults("search:test", self.search)
+        results[0:5]
+        self.plans[1].delete()
+        self.assertEqual(
+            [r.object for r in results[0:5]], [self.plans[0], *self.plans[2:]]
+        )
+
+    def test_key(self):
+        form = HighlightedSearchForm(
+            {"q": "  Heat   PUMPS ", "match_method": HighlightedSearchForm.MATCH_NORMAL}
+        )
+        self.assertTrue(form.is_valid())
+        options = form.get_cache_options()
+        self.assertEqual(options["q"], "heat pumps")
+        self.assertEqual(options["document_type"], "-1")
+
+        form = HighlightedSearchForm(
+            {"q": "Heat Pumps", "match_method": HighlightedSearchForm.MATCH_EXACT}
+        )
+        self.assertTrue(form.is_valid())
+        self.assertEqual(form.get_cache_options()["q"], "Heat Pumps")
+
+        self.assertNotEqual(
+            CachedSearchResults.get_key(options, 1, 1),
+            CachedSearchResults.get_key(options, 2, 1),
+        )
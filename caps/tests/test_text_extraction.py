@@ -0,0 +1,103 @@
+import shutil
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+
+from django.test import TestCase
+
+from caps import text_extraction
+from caps.models import Council, PlanDocument
+from caps.search_indexes import PlanDocumentIndex
+
+PLAN = str(Path(__file__).parent / "borsetshire_plan.pdf")
+
+
+class TextExtractionTestCase(TestCase):
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        self.settings_override = self.settings(MEDIA_ROOT=self.tmp.name)
+        self.settings_override.enable()
+        Path(self.tmp.name, "plans").mkdir()
+        shutil.copy(PLAN, Path(self.tmp.name, "plans"))
+
+        council = Council.objects.create(
+            name="Borsetshire",
+            slug="borsetshire",
+            country=Council.ENGLAND,
+            gss_code="E00000001",
+            authority_code="BOR",
+        )
+        self.document = PlanDocument.objects.create(
+            council=council,
+            url="https://example.com/plan.pdf",
+            file="plans/borsetshire_plan.pdf",
+        )
+        self.no_file = PlanDocument.objects.create(
+            council=council, url="https://example.com/strategy.pdf"
+        )
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.tmp.cleanup()
+
+    @patch("caps.text_extraction.extract_file_text", return_value="climate plan")
+    def test_extract_job(self, extract):
+        content_hash = text_extraction.file_hash(PLAN)
+        self.assertEqual(
+            text_extraction.extract_job((1, PLAN, "", False)),
+            (1, content_hash, "climate plan"),
+        )
+        self.assertEqual(
+            text_extraction.extract_job((1, PLAN, content_hash, False)),
+            (1, content_hash, None),
+        )
+        self.assertEqual(
+            text_extraction.extract_job((1, PLAN, content_hash, True)),
+            (1, content_hash, "climate plan"),
+        )
+        self.assertEqual(extract.call_count, 2)
+
+        extract.return_value = None
+        self.assertEqual(
+            text_extraction.extract_job((1, PLAN, "", False)),
+            (1, content_hash, None),
+        )
+        self.assertEqual(
+            text_extraction.extract_job((1, PLAN + ".missing", "abc", False)),
+            (1, "abc", None),
+        )
+
+    def test_update_text(self):
+        PlanDocument.objects.filter(id=self.document.id).update(updated_at="2021-08-01")
+        # the workers are forked so see the patched function
+        with patch(
+            "caps.text_extraction.extract_file_text", return_value="climate plan"
+        ):
+            self.assertEqual(PlanDocument.update_text(workers=1), 1)
+
+        self.document.refresh_from_db()
+        self.assertEqual(self.document.text, "climate plan")
+        self.assertEqual(self.document.text_hash, text_extraction.file_hash(PLAN))
+        self.assertIsNotNone(self.document.text_updated)
+        # the date shown as when the plan last changed is left alone
+        self.assertEqual(self.document.updated_at.isoformat(), "2021-08-01")
+
+        with patch(
+            "caps.text_extraction.extract_file_text", return_value="new climate plan"
+        ):
+            self.assertEqual(PlanDocument.update_text(workers=1), 0)
+            self.assertEqual(PlanDocument.update_text(workers=1, rebuild=True), 1)
+
+        self.document.refresh_from_db()
+        self.assertEqual(self.document.text, "new climate plan")
+
+    def test_prepare_text(self):
+        self.document.text = "climate plan"
+        index = PlanDocumentIndex()
+        self.assertEqual(index.prepare_text(self.document), "climate plan")
+        self.assertEqual(index.prepare_text(self.no_file), "")
+
+    def test_read_queryset(self):
+        index = PlanDocumentIndex()
+        document = index.read_queryset().get(pk=self.document.pk)
+        self.assertEqual(document.get_deferred_fields(), {"text"})
@@ -1,9 +1,35 @@
+from io import StringIO
+from pathlib import Path
+from tempfile import TemporaryDirectory
 from unittest.mock import patch
 
-from django.test import Client, TestCase
+from django.core.cache import caches
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
 from django.urls import reverse
 
-from caps.models import Council, EmergencyDeclaration, PlanDocument, Promise
+import caps.charts as charts
+from caps.models import (
+    Council,
+    CouncilProfileSnapshot,
+    DataPoint,
+    DataType,
+    DataVersion,
+    EmergencyDeclaration,
+    EmissionsSeries,
+    PlanDocument,
+    Promise,
+    SavedSearch,
+)
+from caps.search_log import search_log
+from charting import ChartCache
+from charting.render import (
+    DEFAULT_WIDTH,
+    image_path,
+    remove_unused_images,
+    render_images,
+    static_spec,
+)
 from scoring.models import PlanYear
 
 
@@ -28,6 +54,7 @@ class TestPageRenders(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertTemplateUsed(response, "caps/council_detail.html")
 
+    @override_settings(SEARCH_LOG_FLUSH_INTERVAL=None)
     @patch("caps.forms.HighlightedSearchForm.search")
     def test_search_results(self, mock_search):
         mock_search.return_value = [], []
@@ -192,6 +219,181 @@ class TestCouncilDetailPage(TestCase):
         )
 
 
+class TestCouncilProfileSnapshot(TestCase):
+    def setUp(self):
+        self.council = Council.objects.create(
+            name="Borsetshire",
+            slug="borsetshire",
+            country=Council.ENGLAND,
+            authority_code="BOS",
+            gss_code="E14000111",
+        )
+        self.promise = Promise.objects.create(
+            council=self.council,
+            has_promise=True,
+            text="this is a promise",
+            target_year="2045",
+        )
+        PlanYear.objects.create(year=2023, is_current=True)
+        self.url = reverse("council", args=["borsetshire"])
+
+    def test_snapshot_stored(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+
+        snapshot = CouncilProfileSnapshot.objects.get(council=self.council)
+        self.assertFalse(snapshot.stale)
+
+        # just the council and its snapshot
+        with self.assertNumQueries(1):
+            cached = self.client.get(self.url)
+        self.assertRegex(cached.content, rb"this is a promise")
+
+    def test_stale_snapshot_rebuilt(self):
+        self.client.get(self.url)
+
+        Promise.objects.filter(pk=self.promise.pk).update(text="a new promise")
+        response = self.client.get(self.url)
+        self.assertNotRegex(response.content, rb"a new promise")
+
+        CouncilProfileSnapshot.mark_stale()
+        response = self.client.get(self.url)
+        self.assertRegex(response.content, rb"a new promise")
+        self.assertFalse(CouncilProfileSnapshot.objects.get(council=self.council).stale)
+
+    def test_old_format_ignored(self):
+        CouncilProfileSnapshot.objects.create(
+            council=self.council,
+            format_version=CouncilProfileSnapshot.FORMAT_VERSION - 1,
+            data=b"not a profile",
+        )
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertRegex(response.content, rb"this is a promise")
+
+
+class TestChartCache(TestCase):
+    def setUp(self):
+        ChartCache.get_cache().clear()
+        self.council = Council.objects.create(
+            name="Borsetshire",
+            slug="borsetshire",
+            country=Council.ENGLAND,
+            authority_code="BOS",
+            gss_code="E14000111",
+        )
+        for name, value in (
+            ("Industry Total", 10),
+            ("Domestic Total", 20),
+            ("Per Person Emissions", 5),
+            ("Emissions per km2", 2),
+            ("Total Emissions", 30),
+        ):
+            data_type = DataType.objects.create(
+                name=name,
+                name_in_source=name,
+                collection=DataType.DataCollection.EMISSIONS,
+            )
+            for year in (2019, 2020):
+                DataPoint.objects.create(
+                    council=self.council, data_type=data_type, year=year, value=value
+                )
+        EmissionsSeries.build()
+        PlanYear.objects.create(year=2023, is_current=True)
+        self.version = DataVersion.bump(DataVersion.EMISSIONS)
+
+    def tearDown(self):
+        ChartCache.get_cache().clear()
+
+    def test_chart_cached(self):
+        chart = charts.multi_emissions_chart(self.council, 2020)
+        ChartCache.get(charts.multi_emissions_chart, self.version, self.council, 2020)
+
+        # only the cache lookup
+        with self.assertNumQueries(1):
+            cached = ChartCache.get(
+                charts.multi_emissions_chart, self.version, self.council, 2020
+            )
+        self.assertEqual(cached.spec, chart.spec)
+        self.assertEqual(cached.ident, chart.ident)
+        self.assertIn("20.00", cached.df.to_html())
+
+    def test_new_version_rebuilt(self):
+        ChartCache.get(charts.multi_emissions_chart, self.version, self.council, 2020)
+        version = DataVersion.bump(DataVersion.EMISSIONS)
+
+        with patch("caps.charts.EmissionsSeries") as series:
+            series.for_council.side_effect = RuntimeError
+            with self.assertRaises(RuntimeError):
+                ChartCache.get(
+                    charts.multi_emissions_chart, version, self.council, 2020
+                )
+
+    def test_cache_warmed(self):
+        call_command("build_chart_cache", stdout=StringIO())
+
+        # seen by other processes, which have their own connection to the cache
+        key = ChartCache.get_key(
+            charts.multi_emissions_chart, self.version, self.council, 2020
+        )
+        other_process_cache = caches.create_connection(ChartCache.cache_alias)
+        self.assertIsNotNone(other_process_cache.get(key))
+
+        with self.assertNumQueries(1):
+            cached = ChartCache.get(
+                charts.multi_emissions_chart, self.version, self.council, 2020
+            )
+        self.assertEqual(
+            cached.spec, charts.multi_emissions_chart(self.council, 2020).spec
+        )
+
+        response = self.client.get(reverse("council", args=["borsetshire"]))
+        self.assertContains(response, f'id="{cached.ident}"')
+
+    def test_rendered_image_used(self):
+        args = (self.council, 2020)
+        chart = ChartCache.get(charts.multi_emissions_chart, self.version, *args)
+
+        with TemporaryDirectory() as media_root, self.settings(MEDIA_ROOT=media_root):
+            self.assertEqual(chart.image_url, "")
+
+            # rendering needs vl-convert so just fake an existing image
+            Path(media_root, "charts").mkdir()
+            image_path(chart.spec_hash, "png").write_bytes(b"png")
+            image_path(chart.spec_hash, "svg").write_bytes(b"svg")
+            # pages don't look for the files
+            self.assertEqual(chart.image_url, "")
+
+            # unchanged specs aren't rendered again
+            count, image_formats = render_images([chart])
+            self.assertEqual(count, 0)
+            self.assertEqual(image_formats, {chart.spec_hash: ("png", "svg")})
+
+            changed = ChartCache.record_images(
+                charts.multi_emissions_chart, self.version, [args], image_formats
+            )
+            self.assertEqual(changed, 1)
+            changed = ChartCache.record_images(
+                charts.multi_emissions_chart, self.version, [args], image_formats
+            )
+            self.assertEqual(changed, 0)
+
+            chart = ChartCache.get(charts.multi_emissions_chart, self.version, *args)
+            self.assertEqual(chart.image_url, f"/media/charts/{chart.spec_hash}.png")
+
+            response = self.client.get(reverse("council", args=["borsetshire"]))
+            self.assertContains(response, chart.image_url)
+
+            Path(media_root, "charts", "old.png").write_bytes(b"old")
+            self.assertEqual(remove_unused_images(image_formats), 1)
+            self.assertTrue(image_path(chart.spec_hash, "png").exists())
+
+    def test_static_spec(self):
+        spec = static_spec('{"width": "container", "height": 300}')
+        self.assertEqual(spec, {"width": DEFAULT_WIDTH, "height": 300})
+
+
 class TestCouncilListPage(TestCase):
     def setUp(self):
         plan_council = Council.objects.create(
@@ -283,7 +485,11 @@ class TestCouncilListPage(TestCase):
         )
 
 
+@override_settings(SEARCH_LOG_FLUSH_INTERVAL=None)
 class TestSearchPage(TestCase):
+    def tearDown(self):
+        search_log.flush()
+
     def test_search_results_detects_postcode(self):
         url = reverse("search_results")
         response = self.client.get(url, {"q": "EH99 1SP"})
@@ -291,6 +497,31 @@ class TestSearchPage(TestCase):
         self.assertTemplateUsed(response, "caps/search_results.html")
         self.assertRegex(response.content, rb"Looking for your local council")
 
+    @patch("caps.forms.HighlightedSearchForm.search")
+    def test_search_is_logged(self, mock_search):
+        mock_search.return_value = [], []
+        url = reverse("search_results")
+        search_log.flush()
+        SavedSearch.objects.all().delete()
+
+        with self.assertNumQueries(0):
+            self.client.get(url, {"q": "ev charging", "council_name": "Borsetshire"})
+            self.client.get(url, {"q": "heat pumps", "inorganic": "1"})
+        self.assertEqual(SavedSearch.objects.count(), 0)
+
+        self.assertEqual(search_log.flush(), 2)
+        searches = SavedSearch.objects.order_by("created")
+        self.assertEqual(
+            list(
+                searches.values_list(
+                    "user_query", "council_restriction", "inorganic", "result_count"
+                )
+            ),
+            [("ev charging", "Borsetshire", False, 0), ("heat pumps", "", True, 0)],
+        )
+        self.assertLess(searches[0].created, searches[1].created)
+        self.assertEqual(search_log.flush(), 0)
+
 
 class TestMarkDownView(TestCase):
     def test_page_works(self):
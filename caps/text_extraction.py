@@ -0,0 +1,101 @@
+"""
+Extract the text of plan documents with Solr's extracting request handler so
+it can be stored on the document. The hash of the file the text came from is
+stored alongside it, so a document is only sent for extraction again when its
+file changes.
+
+Extraction is done across a pool of processes as each document is a separate
+request to Solr and most of the time is spent waiting on Tika.
+"""
+
+import hashlib
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator, Optional, Tuple
+
+from django.utils.html import strip_tags
+from haystack import connections
+from haystack.constants import DEFAULT_ALIAS
+
+logger = logging.getLogger(__name__)
+
+
+def file_hash(path: str) -> str:
+    md5 = hashlib.md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+def extract_file_text(path: str, using: str = DEFAULT_ALIAS) -> Optional[str]:
+    """
+    Send a file to Solr for extraction. Returns None if it couldn't be
+    extracted.
+    """
+    backend = connections[using].get_backend()
+    with open(path, "rb") as f:
+        extracted_data = backend.extract_file_contents(f)
+
+    if extracted_data is None:
+        return None
+
+    # data is converted to html as part of the extraction
+    return strip_tags(extracted_data["contents"])
+
+
+def reset_connections():
+    # a forked worker mustn't share the parent's connection to Solr
+    connections.reload(DEFAULT_ALIAS)
+
+
+def extract_job(job: Tuple[int, str, str, bool]) -> Tuple[int, str, Optional[str]]:
+    """
+    Takes a single tuple of document id, path, the hash of the file the stored
+    text came from and whether to extract anyway, so it can be mapped across a
+    process pool.
+
+    Returns the id, the hash of the file and its text, or None for the text if
+    the file hasn't changed or couldn't be extracted.
+    """
+    document_id, path, text_hash, rebuild = job
+    try:
+        content_hash = file_hash(path)
+    except OSError:
+        logger.warning("problem reading file: %s", path)
+        return document_id, text_hash, None
+
+    if content_hash == text_hash and not rebuild:
+        return document_id, content_hash, None
+
+    text = extract_file_text(path)
+    if text is None:
+        logger.warning("problem extracting file: %s", path)
+
+    return document_id, content_hash, text
+
+
+def extract_texts(
+    documents: Iterable, workers: int = None, rebuild: bool = False
+) -> Iterator[Tuple[int, str, str]]:
+    """
+    Yield the id, file hash and text of each PlanDocument whose file has
+    changed since its text was stored, extracting them across a process pool.
+    Documents without a file are skipped.
+    """
+    jobs = [
+        (document.id, document.file.path, document.text_hash, rebuild)
+        for document in documents
+        if document.file
+    ]
+    if not jobs:
+        return
+
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=reset_connections
+    ) as executor:
+        for document_id, content_hash, text in executor.map(
+            extract_job, jobs, chunksize=4
+        ):
+            if text is not None:
+                yield document_id, content_hash, text
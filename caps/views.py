@@ -49,19 +49,27 @@ from caps.models import (
     ComparisonType,
     Council,
     CouncilFilter,
+    CouncilProfileSnapshot,
     CouncilProject,
     CouncilTag,
-    DataPoint,
     DataType,
+    DataVersion,
+    EmissionsSeries,
     PlanDocument,
     ProjectFilter,
     SavedSearch,
     Tag,
 )
 from caps.search_funcs import condense_highlights
+from caps.search_log import search_log
 from caps.utils import file_size, is_valid_postcode
-from charting import ChartCollection
-from scoring.models import PlanScore, PlanSection, PlanSectionScore, PlanYear
+from charting import ChartCache, ChartCollection
+from scoring.models import (
+    PlanScore,
+    PlanSection,
+    PlanSectionScore,
+    PlanYearRegistry,
+)
 
 
 def add_context_for_plans_download_and_search(context):
@@ -141,35 +149,43 @@ class CouncilDetailView(DetailView):
         """
         Get emissions information for this council
         """
-        council_emissions_data = council.data_points(DataType.DataCollection.EMISSIONS)
         context = {}
         context["emissions_data"] = False
-        try:
-            latest_year = council_emissions_data.aggregate(Max("year"))["year__max"]
+        series = EmissionsSeries.for_council(council)
+        if series is not None:
+            latest_year = series.latest_year
             context["latest_year"] = latest_year
-            latest_year_per_capita_emissions = council_emissions_data.get(
-                year=latest_year, data_type__name="Per Person Emissions"
-            ).value
-            latest_year_per_km2_emissions = council_emissions_data.get(
-                year=latest_year, data_type__name="Emissions per km2"
-            ).value
-            latest_year_total_emissions = council_emissions_data.get(
-                year=latest_year, data_type__name="Total Emissions"
-            ).value
-            context["latest_year_per_capita_emissions"] = (
-                latest_year_per_capita_emissions
+            latest_year_per_capita_emissions = series.get_value(
+                latest_year, "Per Person Emissions"
+            )
+            latest_year_per_km2_emissions = series.get_value(
+                latest_year, "Emissions per km2"
             )
-            context["latest_year_per_km2_emissions"] = latest_year_per_km2_emissions
-            context["latest_year_total_emissions"] = latest_year_total_emissions
-            context["emissions_data"] = True
-        except DataPoint.DoesNotExist as e:
-            pass
+            latest_year_total_emissions = series.get_value(
+                latest_year, "Total Emissions"
+            )
+            if None not in (
+                latest_year_per_capita_emissions,
+                latest_year_per_km2_emissions,
+                latest_year_total_emissions,
+            ):
+                context["latest_year_per_capita_emissions"] = (
+                    latest_year_per_capita_emissions
+                )
+                context["latest_year_per_km2_emissions"] = latest_year_per_km2_emissions
+                context["latest_year_total_emissions"] = latest_year_total_emissions
+                context["emissions_data"] = True
 
         if context["emissions_data"]:
             context["current_emissions_breakdown"] = (
                 council.current_emissions_breakdown(year=latest_year)
             )
-            multi_emission_chart = charts.multi_emissions_chart(council, latest_year)
+            multi_emission_chart = ChartCache.get(
+                charts.multi_emissions_chart,
+                DataVersion.get_version(DataVersion.EMISSIONS),
+                council,
+                latest_year,
+            )
             context["chart_collection"] = ChartCollection()
             context["chart_collection"].register(multi_emission_chart)
 
@@ -181,7 +197,7 @@ class CouncilDetailView(DetailView):
         """
         context = {}
         try:
-            plan_year = PlanYear.objects.get(is_current=True)
+            plan_year = PlanYearRegistry.get_current()
             plan_score = PlanScore.objects.get(council=council, year=plan_year.year)
 
             group = council.get_scoring_group()
@@ -202,7 +218,7 @@ class CouncilDetailView(DetailView):
                 council_group=group, plan_year=plan_year.year
             )
 
-            for section in section_avgs.all():
+            for section in section_avgs:
                 if section["plan_section__code"] not in sections:
                     sections[section["plan_section__code"]] = {
                         "code": section["plan_section__code"],
@@ -277,10 +293,12 @@ class CouncilDetailView(DetailView):
         Get information on the documents associated with this council
         """
         context = {}
-        documents = council.plandocument_set.order_by(
-            "-created_at", "-updated_at"
-        ).all()
-        context["document_count"] = documents.count()
+        documents = list(
+            council.plandocument_set.order_by("-created_at", "-updated_at").defer(
+                "text"
+            )
+        )
+        context["document_count"] = len(documents)
         grouped_documents = defaultdict(list)
         for document in documents:
             grouped_documents[document.get_document_type].append(document)
@@ -346,10 +364,12 @@ class CouncilDetailView(DetailView):
 
         return {"council_cards": menu, "summary_menu_cards": summary_menu}
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        council: Council = context.get("council")
-
+    def get_profile_context(self, council: Council) -> dict[str, Any]:
+        """
+        Get everything on the page that comes from the database. This is kept
+        in a CouncilProfileSnapshot so querysets are evaluated here.
+        """
+        context = {}
         additional_contexts = [
             self.get_emissions_context(council),
             self.get_polling_context(council),
@@ -360,6 +380,42 @@ class CouncilDetailView(DetailView):
         for additional_context in additional_contexts:
             context.update(additional_context)
 
+        context["related_councils"] = council.get_related_councils()
+        context["promises"] = list(
+            council.promise_set.filter(has_promise=True).order_by("target_year")
+        )
+        context["no_promise"] = list(council.promise_set.filter(has_promise=False))
+        context["last_updated"] = council.plandocument_set.aggregate(
+            last_update=Max("updated_at"), last_found=Max("date_first_found")
+        )
+        context["tags"] = list(
+            CouncilTag.objects.filter(council=council).select_related("tag")
+        )
+
+        declarations = list(council.emergencydeclaration_set.all()[:1])
+        if declarations:
+            context["declared_emergency"] = declarations[0]
+
+        return context
+
+    def get_queryset(self):
+        return super().get_queryset().select_related("profile_snapshot")
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        council: Council = context.get("council")
+
+        profile = CouncilProfileSnapshot.get_profile(council)
+        if profile is None:
+            # fetch the council again so the old snapshot isn't pickled with it
+            profile = self.get_profile_context(Council.objects.get(pk=council.pk))
+            CouncilProfileSnapshot.store(council, profile)
+        context.update(profile)
+
+        # this comes from the settings so can change without a new snapshot
+        if "scoring_score" in context:
+            context["scoring_hidden"] = getattr(settings, "SCORECARDS_PRIVATE", False)
+
         # run menu update last so it can have access to wider context
         context.update(self.get_council_card_context(context))
 
@@ -369,21 +425,6 @@ class CouncilDetailView(DetailView):
         context["page_title"] = council.name
         context["feedback_form_url"] = settings.FEEDBACK_FORM
 
-        context["related_councils"] = council.get_related_councils()
-        context["promises"] = council.promise_set.filter(has_promise=True).order_by(
-            "target_year"
-        )
-        context["no_promise"] = council.promise_set.filter(has_promise=False)
-        context["last_updated"] = council.plandocument_set.aggregate(
-            last_update=Max("updated_at"), last_found=Max("date_first_found")
-        )
-        context["tags"] = CouncilTag.objects.filter(council=council).select_related(
-            "tag"
-        )
-
-        if council.emergencydeclaration_set.count() > 0:
-            context["declared_emergency"] = council.emergencydeclaration_set.all()[0]
-
         return context
 
 
@@ -549,16 +590,16 @@ class SearchResultsView(HaystackSearchView):
         if len(context["query"]) > 1000:
             context["query"] = context["query"][:1000]
         if context["query"] and context["page_obj"].number == 1:
-            # Save the search.
-            saved_search = SavedSearch(
+            # Queue the search, it's saved by a background thread.
+            search = dict(
                 search_key=self.search_field,
                 user_query=context["query"],
                 result_count=context["paginator"].count,
                 inorganic=context["inorganic"],
             )
             if context.get("council_name", "") != "":
-                saved_search.council_restriction = context["council_name"]
-            saved_search.save()
+                search["council_restriction"] = context["council_name"]
+            search_log.log(**search)
 
     def form_valid(self, form):
         self.queryset, possible_related_terms = form.search()
@@ -699,7 +740,7 @@ class TwinsView(BaseLocationResultsView):
             )
             for group in related_councils:
                 for c in group["councils"]:
-                    c.plan_overlap = related_councils_intersection[c]
+                    c.plan_overlap = related_councils_intersection[c.council]
                 if group["type"].slug == "composite":
                     twin = group["councils"][0]
                     context["twin"] = twin
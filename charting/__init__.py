@@ -1,2 +1,3 @@
 from .control import ChartBundle, ChartCollection
+from .cache import ChartCache
 from . import theme
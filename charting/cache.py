@@ -0,0 +1,115 @@
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from django.core.cache import caches
+
+from .control import ChartBundle
+
+ChartFunction = Callable[..., ChartBundle]
+
+
+class ChartCache:
+    """
+    Finished chart specs kept in the "charts" cache, so pages can show a chart
+    without building it with pandas and altair on every request. That cache
+    is shared between processes so charts built ahead of time by
+    build_chart_cache are used by the site.
+
+    Charts are keyed by the function that makes them, its arguments and the
+    version of the data they're built from. Pass a version of None if there
+    isn't one, in which case the chart is built and not cached.
+    """
+
+    cache_alias = "charts"
+    timeout = None
+    # how many charts to store at once when warming the cache
+    batch_size = 100
+
+    @classmethod
+    def get_cache(cls):
+        return caches[cls.cache_alias]
+
+    @classmethod
+    def get_key(cls, chart_function: ChartFunction, version: int, *args) -> str:
+        name = f"{chart_function.__module__}.{chart_function.__qualname__}"
+        values = ":".join(str(getattr(arg, "pk", arg)) for arg in args)
+        return f"chart:{name}:{version}:{values}"
+
+    @classmethod
+    def get(
+        cls, chart_function: ChartFunction, version: Optional[int], *args
+    ) -> ChartBundle:
+        if version is None:
+            return chart_function(*args)
+
+        cache = cls.get_cache()
+        key = cls.get_key(chart_function, version, *args)
+        data = cache.get(key)
+        if data is None:
+            data = chart_function(*args).to_cache()
+            cache.set(key, data, cls.timeout)
+
+        return ChartBundle.from_cache(data)
+
+    @classmethod
+    def record_images(
+        cls,
+        chart_function: ChartFunction,
+        version: Optional[int],
+        arg_list: Iterable[Tuple],
+        image_formats: Dict[str, Tuple[str, ...]],
+    ) -> int:
+        """
+        Store the formats each chart has been rendered in, from render_images,
+        so pages can link to the images without checking for the files.
+        Returns the number of charts whose images changed.
+        """
+        if version is None:
+            return 0
+
+        cache = cls.get_cache()
+        changed = {}
+        for args in arg_list:
+            key = cls.get_key(chart_function, version, *args)
+            data = cache.get(key)
+            if data is None:
+                continue
+
+            formats = image_formats.get(ChartBundle.from_cache(data).spec_hash, ())
+            if tuple(data.get("image_formats", ())) != formats:
+                changed[key] = {**data, "image_formats": formats}
+
+        cache.set_many(changed, cls.timeout)
+        return len(changed)
+
+    @classmethod
+    def warm(
+        cls,
+        chart_function: ChartFunction,
+        version: int,
+        arg_list: Iterable[Tuple],
+        rebuild: bool = False,
+    ) -> int:
+        """
+        Build and store the chart for each set of arguments, skipping any
+        already in the cache unless rebuild is set. Returns the number of
+        charts built.
+        """
+        cache = cls.get_cache()
+        arg_list = list(arg_list)
+        built = 0
+        for start in range(0, len(arg_list), cls.batch_size):
+            keys = {
+                cls.get_key(chart_function, version, *args): args
+                for args in arg_list[start : start + cls.batch_size]
+            }
+            if not rebuild:
+                for key in cache.get_many(keys):
+                    del keys[key]
+
+            cache.set_many(
+                {key: chart_function(*args).to_cache() for key, args in keys.items()},
+                cls.timeout,
+            )
+            built += len(keys)
+
+        return built
@@ -3,15 +3,27 @@ from __future__ import annotations
 import string
 from dataclasses import dataclass, field
 from hashlib import md5
-from typing import Dict, Iterable, List, Union
-from urllib.parse import urlencode, urlparse, urlunparse
+from typing import Dict, Iterable, List, Optional, Tuple, Union
 
 import altair as alt
 import pandas as pd
-from cryptography.fernet import Fernet
-from django.conf import settings
 from pandas.io.formats.style import Styler
 
+from . import render
+
+
+@dataclass
+class RenderedTable:
+    """
+    Stands in for a styled table once it's been rendered, as a Styler can't be
+    pickled.
+    """
+
+    html: str
+
+    def to_html(self) -> str:
+        return self.html
+
 
 @dataclass
 class ChartBundle:
@@ -23,26 +35,63 @@ class ChartBundle:
 
     label: str
     alt_title: str
-    df: Union[pd.DataFrame, Styler]
-    chart: alt.Chart
+    df: Union[pd.DataFrame, Styler, RenderedTable]
+    chart: Optional[alt.Chart]
     logo_src: str = "/static/charting/img/mysociety-logo-white-background.jpg"
     data_source: str = ""
+    # formats render_charts has made images of this spec in
+    image_formats: Tuple[str, ...] = ()
     spec: str = field(init=False)
     ident: str = field(init=False)
-    image_url: str = field(init=False)
 
     def __post_init__(self):
         self.spec = self.chart.to_json()
         self.ident = self.get_ident()
-        self.image_url = ""
-        # Commented out until URI length issue resolved
-        # self.image_url = self.get_image_url()
+
+    @property
+    def spec_hash(self) -> str:
+        return md5(self.spec.encode("utf-8")).hexdigest()
+
+    @property
+    def image_url(self) -> str:
+        return self.get_image_url()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if isinstance(self.df, Styler):
+            state["df"] = RenderedTable(self.df.to_html())
+        return state
+
+    def to_cache(self) -> dict:
+        """
+        The finished parts of the bundle, for storing in a cache.
+        """
+        return {
+            "label": self.label,
+            "alt_title": self.alt_title,
+            "table": self.df.to_html(),
+            "logo_src": self.logo_src,
+            "data_source": self.data_source,
+            "image_formats": self.image_formats,
+            "spec": self.spec,
+            "ident": self.ident,
+        }
+
+    @classmethod
+    def from_cache(cls, data: dict) -> ChartBundle:
+        """
+        Rebuild a bundle stored with to_cache. This has no chart, only the
+        spec, so doesn't need pandas or altair.
+        """
+        bundle = cls.__new__(cls)
+        bundle.__dict__.update(data)
+        bundle.df = RenderedTable(bundle.__dict__.pop("table"))
+        bundle.chart = None
+        return bundle
 
     def get_ident(self) -> str:
-        encoded_spec = self.spec.encode("utf-8")
-        hash = md5(encoded_spec).hexdigest()
         ident = ""
-        for h in hash:
+        for h in self.spec_hash:
             if h in string.digits:
                 ident += chr(65 + 8 + int(h))
             else:
@@ -50,25 +99,13 @@ class ChartBundle:
 
         return ident[:6]
 
-    def get_image_url(self) -> str:
+    def get_image_url(self, format: str = "png") -> str:
         """
-        get url for server image
+        get url for the image made by render_charts, if there is one
         """
-
-        encrypt = False
-        spec = self.spec
-        if settings.VEGALITE_ENCRYPT_KEY:
-            key = settings.VEGALITE_ENCRYPT_KEY.encode()
-            spec = Fernet(key).encrypt(spec.encode())
-            encrypt = True
-
-        parameters = urlencode(
-            {"spec": spec, "format": "png", "encrypted": encrypt, "width": 700}
-        )
-        url_parts = list(urlparse(settings.VEGALITE_SERVER_URL))
-        url_parts[2] = "convert_spec"
-        url_parts[4] = parameters
-        return urlunparse(url_parts)
+        if format not in self.image_formats:
+            return ""
+        return render.image_url(self.spec_hash, format)
 
 
 @dataclass
@@ -0,0 +1,124 @@
+"""
+Render chart specs to image files in the media directory, so charts have a
+static fallback without a call to an external conversion service.
+
+Images are named by the hash of their spec, so a chart is only rendered again
+when its spec changes, and charts with identical specs share an image.
+"""
+
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Container, Dict, Iterable, Tuple
+
+from django.conf import settings
+
+CHART_IMAGE_DIR = "charts"
+FORMATS = ("png", "svg")
+
+# charts sized by the page need a fixed size to be drawn on their own
+DEFAULT_WIDTH = 700
+DEFAULT_HEIGHT = 300
+
+
+def image_name(spec_hash: str, format: str) -> str:
+    return f"{CHART_IMAGE_DIR}/{spec_hash}.{format}"
+
+
+def image_path(spec_hash: str, format: str) -> Path:
+    return Path(settings.MEDIA_ROOT, image_name(spec_hash, format))
+
+
+def image_url(spec_hash: str, format: str = "png") -> str:
+    return f"{settings.MEDIA_URL}{image_name(spec_hash, format)}"
+
+
+def static_spec(spec: str) -> dict:
+    """
+    Replace any sizes that depend on the page with fixed ones.
+    """
+    spec = json.loads(spec)
+    if spec.get("width", "container") == "container":
+        spec["width"] = DEFAULT_WIDTH
+    if spec.get("height", "container") == "container":
+        spec["height"] = DEFAULT_HEIGHT
+    return spec
+
+
+def render_image(job: Tuple[str, str, str]) -> str:
+    """
+    Write a spec to an image file. Takes a single tuple of the spec, format
+    and path so it can be mapped across a process pool.
+    """
+    # only needed when rendering, rather than for every page with a chart
+    import vl_convert as vlc
+
+    spec, format, path = job
+    if format == "png":
+        content = vlc.vegalite_to_png(static_spec(spec), scale=2)
+    elif format == "svg":
+        content = vlc.vegalite_to_svg(static_spec(spec)).encode("utf-8")
+    else:
+        raise ValueError(f"Can't render charts as {format}")
+
+    # write then move so a half written image is never served
+    partial = f"{path}.partial"
+    with open(partial, "wb") as f:
+        f.write(content)
+    os.replace(partial, path)
+
+    return path
+
+
+def render_images(
+    bundles: Iterable,
+    formats: Iterable[str] = FORMATS,
+    workers: int = None,
+    rebuild: bool = False,
+) -> Tuple[int, Dict[str, Tuple[str, ...]]]:
+    """
+    Render images for each ChartBundle across a process pool, skipping any
+    whose spec has already been rendered unless rebuild is set.
+
+    Returns the number of images written and the formats there are images in
+    for each spec hash.
+    """
+    Path(settings.MEDIA_ROOT, CHART_IMAGE_DIR).mkdir(parents=True, exist_ok=True)
+
+    specs = {}
+    for bundle in bundles:
+        specs[bundle.spec_hash] = bundle.spec
+
+    jobs = []
+    for spec_hash, spec in specs.items():
+        for format in formats:
+            path = image_path(spec_hash, format)
+            if rebuild or not path.exists():
+                jobs.append((spec, format, str(path)))
+
+    if jobs:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for _ in executor.map(render_image, jobs, chunksize=10):
+                pass
+
+    image_formats = {
+        spec_hash: tuple(
+            format for format in FORMATS if image_path(spec_hash, format).exists()
+        )
+        for spec_hash in specs
+    }
+    return len(jobs), image_formats
+
+
+def remove_unused_images(spec_hashes: Container[str]) -> int:
+    """
+    Delete rendered images for specs that are no longer in use.
+    """
+    removed = 0
+    for path in Path(settings.MEDIA_ROOT, CHART_IMAGE_DIR).glob("*"):
+        if path.name.split(".")[0] not in spec_hashes:
+            path.unlink()
+            removed += 1
+
+    return removed
@@ -250,6 +250,23 @@ HAYSTACK_CONNECTIONS = {
     },
 }
 
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    # shared by every process so charts built by build_chart_cache are seen by
+    # the site. The table is made by createcachetable in script/migrate
+    "charts": {
+        "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+        "LOCATION": "chart_cache",
+        "TIMEOUT": None,
+        "OPTIONS": {"MAX_ENTRIES": 10000},
+    },
+}
+
+# seconds between writing logged searches to the database, see caps.search_log
+SEARCH_LOG_FLUSH_INTERVAL = 30
+
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.postgresql_psycopg2",
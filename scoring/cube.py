@@ -0,0 +1,269 @@
+import time
+
+import numpy as np
+
+from caps.models import DataVersion
+
+
+def codes_for(values):
+    """
+    Convert a list of values into an array of integer codes along with the list
+    of values the codes refer to.
+    """
+    labels = {}
+    codes = np.array([labels.setdefault(v, len(labels)) for v in values], dtype=int)
+    return codes, list(labels)
+
+
+def as_float(values):
+    return np.array([np.nan if v is None else v for v in values], dtype=float)
+
+
+class ScoreCube:
+    """
+    Every section and question score held as columns of numpy arrays so the
+    counts and averages shown on the scorecards can be calculated in memory
+    rather than with a GROUP BY query per request.
+
+    There is one cube per process. It is loaded the first time it's needed and
+    rebuilt once the scoring DataVersion changes. If no import has recorded a
+    version there is no cube and callers should use the database instead.
+    """
+
+    # how long to trust the cube's version before checking the database again
+    VERSION_CHECK_AFTER = 60
+
+    _cube = None
+    _checked = None
+
+    def __init__(self, version):
+        # import here as the models use the cube
+        from scoring.models import PlanQuestionScore, PlanSectionScore
+
+        self.version = version
+
+        sections = list(
+            PlanSectionScore.objects.values_list(
+                "plan_section__year",
+                "plan_section__code",
+                "plan_score__council__authority_type",
+                "plan_score__council__country",
+                "plan_score__total",
+                "score",
+                "max_score",
+                "weighted_score",
+            ).order_by()
+        )
+        columns = list(zip(*sections)) or [[]] * 8
+        self.section_year = as_float(columns[0])
+        self.section_code, self.section_codes = codes_for(columns[1])
+        self.section_authority_type, self.section_authority_types = codes_for(
+            columns[2]
+        )
+        self.section_country = as_float(columns[3])
+        self.section_plan_total = as_float(columns[4])
+        self.section_score = as_float(columns[5])
+        self.section_max_score = as_float(columns[6])
+        self.section_weighted_score = as_float(columns[7])
+
+        questions = list(
+            PlanQuestionScore.objects.values_list(
+                "plan_score__year",
+                "plan_score__council_id",
+                "plan_score__council__authority_type",
+                "plan_score__council__country",
+                "plan_question_id",
+                "plan_question__code",
+                "plan_question__question_type",
+                "plan_question__max_score",
+                "score",
+                "max_score",
+            ).order_by()
+        )
+        columns = list(zip(*questions)) or [[]] * 10
+        self.question_year = as_float(columns[0])
+        self.question_council = np.array(columns[1], dtype=int)
+        self.question_authority_type, self.question_authority_types = codes_for(
+            columns[2]
+        )
+        self.question_country = as_float(columns[3])
+        self.question_id = np.array(columns[4], dtype=int)
+        self.question_code, self.question_codes = codes_for(columns[5])
+        self.question_is_header = np.array(columns[6], dtype=object) == "HEADER"
+        self.question_max = as_float(columns[7])
+        self.question_score = as_float(columns[8])
+        self.question_answer_max = as_float(columns[9])
+
+    @classmethod
+    def get(cls):
+        now = time.monotonic()
+        if cls._checked is not None and now - cls._checked < cls.VERSION_CHECK_AFTER:
+            return cls._cube
+
+        version = DataVersion.get_version(DataVersion.SCORING)
+        cube = cls._cube
+        if version is None:
+            cube = None
+        elif cube is None or cube.version != version:
+            cube = cls(version)
+
+        cls._cube = cube
+        cls._checked = now
+
+        return cube
+
+    @classmethod
+    def clear(cls):
+        cls._cube = None
+        cls._checked = None
+
+    def group_mask(self, types, type_labels, countries, group, year_column, year):
+        mask = np.ones(len(types), dtype=bool)
+        if group is not None:
+            type_codes = [
+                i for i, label in enumerate(type_labels) if label in group["types"]
+            ]
+            mask &= np.isin(types, type_codes)
+            if "countries" in group:
+                mask &= np.isin(countries, group["countries"])
+
+        if year is not None:
+            mask &= year_column == int(year)
+
+        return mask
+
+    def section_mask(self, council_group=None, plan_year=None):
+        return self.group_mask(
+            self.section_authority_type,
+            self.section_authority_types,
+            self.section_country,
+            council_group,
+            self.section_year,
+            plan_year,
+        )
+
+    def question_mask(self, council_group=None, plan_year=None):
+        return self.group_mask(
+            self.question_authority_type,
+            self.question_authority_types,
+            self.question_country,
+            council_group,
+            self.question_year,
+            plan_year,
+        )
+
+    def count_by(self, codes, labels, mask):
+        counts = np.bincount(codes[mask], minlength=len(labels))
+        return {labels[i]: int(counts[i]) for i in np.flatnonzero(counts)}
+
+    def section_averages(self, council_group=None, plan_year=None):
+        mask = self.section_mask(council_group, plan_year)
+        mask &= self.section_plan_total > 0
+        # matches Avg ignoring nulls
+        mask &= ~np.isnan(self.section_score)
+
+        codes = self.section_code[mask]
+        totals = np.bincount(
+            codes, weights=self.section_score[mask], minlength=len(self.section_codes)
+        )
+        counts = np.bincount(codes, minlength=len(self.section_codes))
+
+        return [
+            {
+                "plan_section__code": self.section_codes[i],
+                "avg_score": float(totals[i] / counts[i]),
+            }
+            for i in np.flatnonzero(counts)
+        ]
+
+    def section_top_mark_counts(self, council_group=None, plan_year=None):
+        mask = self.section_mask(council_group, plan_year)
+        mask &= self.section_score == self.section_max_score
+
+        counts = self.count_by(self.section_code, self.section_codes, mask)
+        return [
+            {"plan_section__code": code, "max_score_count": count}
+            for code, count in counts.items()
+        ]
+
+    def section_averages_by_group(self, section_code, plan_year, groups):
+        """
+        Average score, average weighted score and maximum score for a section for
+        each scoring group, ignoring plans with a zero total.
+        """
+        try:
+            code = self.section_codes.index(section_code)
+        except ValueError:
+            code = None
+
+        averages = {}
+        for slug, group in groups.items():
+            mask = self.section_mask(group, plan_year)
+            mask &= (self.section_code == code) & (self.section_plan_total > 0)
+
+            averages[slug] = {
+                "average": None,
+                "maximum": None,
+                "weighted_average": None,
+            }
+            if mask.any():
+                averages[slug] = {
+                    "average": float(np.nanmean(self.section_score[mask])),
+                    "maximum": int(np.nanmax(self.section_max_score[mask])),
+                    "weighted_average": float(
+                        np.nanmean(self.section_weighted_score[mask])
+                    ),
+                }
+
+        return averages
+
+    def question_max_score_counts(
+        self, council_group=None, plan_year=None, use_old_max_counts=False
+    ):
+        mask = self.question_mask(council_group, plan_year)
+
+        at_max = self.question_score == self.question_answer_max
+        if use_old_max_counts:
+            # header questions always use the max score from the answer
+            at_max = np.where(
+                self.question_is_header,
+                at_max,
+                self.question_score == self.question_max,
+            )
+
+        return self.count_by(self.question_code, self.question_codes, mask & at_max)
+
+    def score_counts(self, mask, count_nulls=True):
+        scores = self.question_score[mask]
+        is_null = np.isnan(scores)
+        values, counts = np.unique(scores[~is_null], return_counts=True)
+
+        breakdown = [
+            {"score": float(value), "score_count": int(count)}
+            for value, count in zip(values, counts)
+        ]
+        if is_null.any():
+            breakdown.append(
+                {
+                    "score": None,
+                    "score_count": int(is_null.sum()) if count_nulls else 0,
+                }
+            )
+
+        return breakdown
+
+    def scores_breakdown(self, question_id, year=None, scoring_group=None):
+        mask = self.question_id == question_id
+        if year is not None:
+            mask &= self.question_year == int(year)
+        if scoring_group is not None:
+            # only the authority types, as with get_scores_breakdown
+            mask &= self.question_mask({"types": scoring_group["types"]})
+
+        return self.score_counts(mask, count_nulls=False)
+
+    def score_breakdown_for_councils(self, question_id, council_ids, year):
+        mask = (self.question_id == question_id) & (self.question_year == int(year))
+        mask &= np.isin(self.question_council, list(council_ids))
+
+        return self.score_counts(mask)
@@ -1,4 +1,4 @@
-from scoring.models import PlanYearConfig
+from scoring.models import PlanYearConfig, PlanYearRegistry
 
 SECTION_WEIGHTINGS = {
     "Buildings & Heating": {
@@ -253,7 +253,7 @@ VALID = ["NATIONS", "ORGANISATIONS", "SECTION_WEIGHTINGS", "THEMES"]
 def get_config(key, year, default=None):
     conf = default
     try:
-        conf = PlanYearConfig.objects.get(name=key, year__year=year).value
+        conf = PlanYearRegistry.get_config(key, year)
     except PlanYearConfig.DoesNotExist:
         u_key = key.upper()
         if u_key in VALID:
@@ -15,17 +15,17 @@ import urllib3
 from django.conf import settings
 from django.core.files import File
 from django.core.management.base import BaseCommand, CommandError
-from django.db.models import F, OuterRef, Q, Subquery, Sum
+from django.db.models import Sum
 from django.template.defaultfilters import pluralize
 
 from caps.import_utils import BaseImportCommand
-from caps.models import Council
-from caps.utils import char_from_text, integer_from_text
+from caps.models import Council, CouncilProfileSnapshot, DataVersion
 from scoring.models import (
     PlanQuestion,
     PlanQuestionGroup,
     PlanQuestionScore,
     PlanScore,
+    PlanScoreAverage,
     PlanSection,
     PlanSectionScore,
 )
@@ -132,227 +132,372 @@ class Command(BaseImportCommand):
                 year=self.YEAR,
             )
 
-    def import_section_scores(self):
-        council_scores = {}
+    def get_section_ids(self, descriptions):
+        sections = dict(
+            PlanSection.objects.filter(year=self.YEAR).values_list("description", "id")
+        )
+        missing = set(descriptions) - set(sections)
+        if missing:
+            raise CommandError(
+                "Unknown sections for {}: {}".format(
+                    self.YEAR, ", ".join(sorted(missing))
+                )
+            )
 
-        df = pd.read_csv(self.SECTION_SCORES_CSV)
-        for index, row in df.iterrows():
-            if row["section"] == "overall":
-                continue
+        return sections
+
+    def add_council_ids(self, df, name_column):
+        """
+        Add a council_id column matched on the gss column, dropping rows for
+        councils that aren't in the database.
+        """
+        councils = dict(Council.objects.values_list("gss_code", "id"))
+        df = df.assign(council_id=df["gss"].map(councils))
+
+        missing = df["council_id"].isna()
+        for name in df.loc[missing, name_column].unique():
+            print("Did not find council in db: {}".format(name))
+
+        return df.loc[~missing].astype({"council_id": int})
+
+    def get_plan_scores(self, council_ids):
+        """
+        Return this year's plan score for each council, keyed by council id,
+        creating any that don't exist yet.
+        """
+        plan_scores = {
+            plan_score.council_id: plan_score
+            for plan_score in PlanScore.objects.filter(year=self.YEAR)
+        }
 
-            # update the section max_score as we go
-            section = PlanSection.objects.get(
-                description=row["section"],
-                year=self.YEAR,
-            )
+        council_ids = [int(council_id) for council_id in council_ids]
+        to_create = [
+            PlanScore(council_id=council_id, year=self.YEAR)
+            for council_id in set(council_ids) - set(plan_scores)
+        ]
+        for plan_score in PlanScore.objects.bulk_create(to_create):
+            plan_scores[plan_score.council_id] = plan_score
+
+        return {council_id: plan_scores[council_id] for council_id in council_ids}
+
+    def link_previous_year(self, plan_scores):
+        previous = dict(
+            PlanScore.objects.filter(
+                year=self.previous_year, council_id__in=plan_scores.keys()
+            ).values_list("council_id", "id")
+        )
 
-            try:
-                council = Council.objects.get(gss_code=row["gss"])
-            except Council.DoesNotExist:
-                print("Did not find council in db: {}".format(row["gss"]))
-                continue
+        to_update = []
+        for council_id, plan_score in plan_scores.items():
+            if council_id in previous:
+                plan_score.previous_year_id = previous[council_id]
+                to_update.append(plan_score)
+
+        PlanScore.objects.bulk_update(to_update, ["previous_year"], batch_size=1000)
+
+    def save_section_scores(self, df, fields):
+        """
+        Create or update the section score for each plan_score_id and
+        plan_section_id in df, setting fields from the matching columns.
+        """
+        existing = pd.DataFrame(
+            PlanSectionScore.objects.filter(plan_section__year=self.YEAR).values_list(
+                "id", "plan_score_id", "plan_section_id"
+            ),
+            columns=["id", "plan_score_id", "plan_section_id"],
+        )
+        df = df[["plan_score_id", "plan_section_id", *fields]].merge(
+            existing, on=["plan_score_id", "plan_section_id"], how="left"
+        )
 
-            plan_score, created = PlanScore.objects.get_or_create(
-                council=council, year=self.YEAR
-            )
+        is_new = df["id"].isna()
+        to_create = [
+            PlanSectionScore(**values)
+            for values in df.loc[is_new].drop(columns="id").to_dict("records")
+        ]
+        to_update = [
+            PlanSectionScore(**values)
+            for values in df.loc[~is_new].astype({"id": int}).to_dict("records")
+        ]
 
-            if self.previous_year:
-                try:
-                    prev = PlanScore.objects.get(
-                        council=council, year=self.previous_year
-                    )
-                    plan_score.previous_year = prev
-                    plan_score.save()
-                except PlanScore.DoesNotExist:
-                    pass
+        PlanSectionScore.objects.bulk_create(to_create, batch_size=1000)
+        PlanSectionScore.objects.bulk_update(to_update, fields, batch_size=1000)
+
+    def import_section_scores(self):
+        df = pd.read_csv(self.SECTION_SCORES_CSV)
+        df = df.loc[df["section"] != "overall"]
 
-            score = 0
-            if not pd.isnull(row["score"]):
-                score = integer_from_text(row["score"])
+        sections = self.get_section_ids(df["section"].unique())
+        df = self.add_council_ids(df, "gss")
 
-            max_score = integer_from_text(row["max_score"])
+        plan_scores = self.get_plan_scores(df["council_id"].unique())
+        if self.previous_year:
+            self.link_previous_year(plan_scores)
 
-            section_score, created = PlanSectionScore.objects.get_or_create(
-                plan_section=section,
-                plan_score=plan_score,
-            )
+        df = df.assign(
+            plan_score_id=df["council_id"].map(
+                {council_id: ps.id for council_id, ps in plan_scores.items()}
+            ),
+            plan_section_id=df["section"].map(sections),
+            score=df["score"].fillna(0),
+        ).drop_duplicates(["plan_score_id", "plan_section_id"], keep="last")
 
-            section_score.max_score = max_score
-            section_score.score = score
-            section_score.save()
+        self.save_section_scores(df, ["score", "max_score"])
 
     def import_overall_scores(self):
         df = pd.read_csv(self.OVERALL_SCORES_CSV)
-        for index, row in df.iterrows():
-            try:
-                council = Council.objects.get(gss_code=row["gss"])
-            except Council.DoesNotExist:
-                print("Did not find council in db: {}".format(row["council"]))
-                continue
-
-            plan_score, created = PlanScore.objects.get_or_create(
-                council=council, year=self.YEAR
-            )
-
-            plan_score.total = round(row["raw_total"] * 100, 3)
-            plan_score.weighted_total = round(row["weighted_total"] * 100, 3)
-            if self.update_control and not pd.isna(row["political_control"]):
-                plan_score.political_control = self.CONTROL_MAP.get(
-                    row["political_control"], row["political_control"]
-                )
-            plan_score.save()
+        df = self.add_council_ids(df, "council").drop_duplicates(
+            "council_id", keep="last"
+        )
 
-            for desc in self.SECTIONS.values():
-                if not pd.isnull(row[desc]):
-                    section = PlanSection.objects.get(year=self.YEAR, description=desc)
+        plan_scores = self.get_plan_scores(df["council_id"].unique())
+        df["plan_score_id"] = df["council_id"].map(
+            {council_id: ps.id for council_id, ps in plan_scores.items()}
+        )
 
-                    section_score, created = PlanSectionScore.objects.get_or_create(
-                        plan_section=section,
-                        plan_score=plan_score,
-                    )
+        totals = df.assign(
+            total=(df["raw_total"] * 100).round(3),
+            weighted_total=(df["weighted_total"] * 100).round(3),
+        )
+        fields = ["total", "weighted_total"]
+        if self.update_control:
+            fields.append("political_control")
+            totals["political_control"] = df["political_control"].replace(
+                self.CONTROL_MAP
+            )
 
-                    section_score.weighted_score = round(row[desc] * 100)
-                    section_score.save()
+        for row in totals[["council_id", *fields]].to_dict("records"):
+            plan_score = plan_scores[row.pop("council_id")]
+            for field, value in row.items():
+                # leave existing values alone where the sheet is blank
+                if not pd.isna(value):
+                    setattr(plan_score, field, value)
+        PlanScore.objects.bulk_update(plan_scores.values(), fields, batch_size=1000)
+
+        descriptions = [desc for desc in self.SECTIONS.values() if desc in df.columns]
+        weighted = df.melt(
+            id_vars=["plan_score_id"],
+            value_vars=descriptions,
+            var_name="description",
+            value_name="weighted_score",
+        ).dropna(subset=["weighted_score"])
+
+        sections = self.get_section_ids(weighted["description"].unique())
+        weighted = weighted.assign(
+            plan_section_id=weighted["description"].map(sections),
+            weighted_score=(weighted["weighted_score"] * 100).round(),
+        )
 
-    def label_top_performers(self):
-        plan_sections = PlanSection.objects.filter(year=self.YEAR)
+        self.save_section_scores(weighted, ["weighted_score"])
+
+    def get_plan_score_frame(self, years):
+        fields = [
+            "id",
+            "year",
+            "council_id",
+            "council__name",
+            "council__authority_type",
+            "council__country",
+            "weighted_total",
+            "top_performer",
+            "most_improved",
+        ]
+        df = pd.DataFrame.from_records(
+            PlanScore.objects.filter(year__in=years)
+            .values_list(*fields)
+            .order_by("id"),
+            columns=fields,
+        )
 
-        # reset top performers
-        PlanScore.objects.filter(year=self.YEAR).update(top_performer="")
-        PlanSectionScore.objects.filter(plan_score__year=self.YEAR).update(
-            top_performer=""
+        scoring_groups = {
+            (authority_type, country): group_tag
+            for group_tag, group in Council.SCORING_GROUPS.items()
+            for authority_type in group["types"]
+            for country in group["countries"]
+        }
+        df["scoring_group"] = [
+            scoring_groups.get(key)
+            for key in zip(df["council__authority_type"], df["council__country"])
+        ]
+
+        return df
+
+    def get_section_score_frame(self, years):
+        fields = [
+            "id",
+            "plan_score__year",
+            "plan_score__council_id",
+            "plan_score__council__name",
+            "plan_section__code",
+            "weighted_score",
+            "top_performer",
+            "most_improved",
+        ]
+        df = pd.DataFrame.from_records(
+            PlanSectionScore.objects.filter(plan_score__year__in=years)
+            .values_list(*fields)
+            .order_by("id"),
+            columns=fields,
+        )
+        return df.rename(
+            columns={
+                "plan_score__year": "year",
+                "plan_score__council_id": "council_id",
+                "plan_score__council__name": "council__name",
+                "plan_section__code": "code",
+            }
         )
 
-        for group in Council.SCORING_GROUP_CHOICES:
-            group_tag = group[0]
+    def top_ranked(self, df, group_column, value_column, counts, default_count):
+        """
+        Mask of the rows with the highest values in each group, ties going to
+        the earlier row.
+        """
+        ranks = df.groupby(group_column)[value_column].rank(
+            method="first", ascending=False
+        )
+        return ranks <= df[group_column].map(counts).fillna(default_count)
+
+    def save_labels(self, model, df, field, labels):
+        changed = df[field] != labels
+        to_update = [
+            model(id=int(pk), **{field: label})
+            for pk, label in zip(df.loc[changed, "id"], labels[changed])
+        ]
+        model.objects.bulk_update(to_update, [field], batch_size=1000)
+
+    def report_labels(self, title, df, labels, value_column):
+        if self.commit and self.verbosity < 2:
+            return
 
-            count = self.TOP_PERFORMER_COUNT.get(
-                group_tag, self.DEFAULT_TOP_PERFORMER_COUNT
+        self.stdout.write(f"{BLUE}{title}{NOBOLD}")
+        chosen = (
+            df.assign(label=labels)
+            .loc[labels != ""]
+            .sort_values(["label", value_column], ascending=[True, False])
+        )
+        for label, rows in chosen.groupby("label", sort=False):
+            councils = ", ".join(
+                f"{name} ({value:g})"
+                for name, value in zip(rows["council__name"], rows[value_column])
             )
-            if count == 0:
-                continue
+            self.stdout.write(f"  {label}: {councils}")
 
-            group_params = Council.SCORING_GROUPS[group_tag]
+    def label_top_performers(self):
+        plan_scores = self.get_plan_score_frame([self.YEAR])
+
+        candidates = plan_scores.loc[plan_scores["weighted_total"] > 0]
+        top = candidates.index[
+            self.top_ranked(
+                candidates,
+                "scoring_group",
+                "weighted_total",
+                self.TOP_PERFORMER_COUNT,
+                self.DEFAULT_TOP_PERFORMER_COUNT,
+            )
+        ]
+        labels = pd.Series("", index=plan_scores.index)
+        labels[top] = plan_scores.loc[top, "scoring_group"]
 
-            top_plan_scores = PlanScore.objects.filter(
-                year=self.YEAR,
-                council__authority_type__in=group_params["types"],
-                council__country__in=group_params["countries"],
-                weighted_total__gt=0,
-            ).order_by("-weighted_total")
+        self.save_labels(PlanScore, plan_scores, "top_performer", labels)
+        self.report_labels("Top performers", plan_scores, labels, "weighted_total")
 
-            for plan_score in top_plan_scores.all()[:count]:
-                plan_score.top_performer = group_tag
-                plan_score.save()
+        section_scores = self.get_section_score_frame([self.YEAR])
 
-        for section in plan_sections.all():
-            if section.code in self.SKIP_SECTION_PERFORMERS:
-                continue
-
-            top_section_scores = PlanSectionScore.objects.filter(
-                plan_score__year=self.YEAR,
-                plan_section=section,
-                weighted_score__gte=80,
-            )
+        top = (section_scores["weighted_score"] >= 80) & ~section_scores["code"].isin(
+            self.SKIP_SECTION_PERFORMERS
+        )
+        labels = section_scores["code"].where(top, "")
 
-            for section_score in top_section_scores.all():
-                section_score.top_performer = section.code
-                section_score.save()
+        self.save_labels(PlanSectionScore, section_scores, "top_performer", labels)
+        self.report_labels(
+            "Section top performers", section_scores, labels, "weighted_score"
+        )
 
     def label_most_improved(self, previous_year):
         if not previous_year:
             self.stderr.write("Can't calculate most improved, need previous year")
             return
 
-        plan_sections = PlanSection.objects.filter(year=self.YEAR)
+        years = [int(self.YEAR), int(previous_year)]
 
-        # reset top performers
-        PlanScore.objects.filter(year=self.YEAR).update(most_improved="")
-        PlanSectionScore.objects.filter(plan_score__year=self.YEAR).update(
-            most_improved=""
+        plan_scores = self.get_plan_score_frame(years)
+        previous = (
+            plan_scores.loc[plan_scores["year"] == years[1]]
+            .drop_duplicates("council_id")
+            .set_index("council_id")["weighted_total"]
+        )
+        plan_scores = plan_scores.loc[plan_scores["year"] == years[0]]
+        plan_scores = plan_scores.assign(
+            previous_score=plan_scores["council_id"].map(previous)
+        )
+        plan_scores["difference"] = (
+            plan_scores["weighted_total"] - plan_scores["previous_score"]
         )
 
-        for group in Council.SCORING_GROUP_CHOICES:
-            group_tag = group[0]
-            group_params = Council.SCORING_GROUPS[group_tag]
-
-            score_differences = (
-                PlanScore.objects.filter(
-                    year=self.YEAR,
-                    council__authority_type__in=group_params["types"],
-                    council__country__in=group_params["countries"],
-                    weighted_total__gt=0,
-                )
-                .annotate(
-                    previous_score=Subquery(
-                        PlanScore.objects.filter(
-                            year=previous_year, council_id=OuterRef("council_id")
-                        ).values("weighted_total")
-                    )
-                )
-                .annotate(difference=(F("weighted_total") - F("previous_score")))
-                .exclude(Q(previous_score=0) | Q(weighted_total=0))
-                .order_by("-difference")
-            )
-            count = self.MOST_IMPROVED_COUNT.get(
-                group_tag, self.DEFAULT_MOST_IMPROVED_COUNT
-            )
-            if count == 0:
-                continue
-
-            for most_improved in score_differences.all()[:count]:
-                most_improved.most_improved = group_tag
-                most_improved.save()
-
-        for country in Council.COUNTRY_CHOICES:
-            score_differences = (
-                PlanScore.objects.filter(
-                    year=self.YEAR,
-                    council__country=country[0],
-                    weighted_total__gt=0,
-                )
-                .annotate(
-                    previous_score=Subquery(
-                        PlanScore.objects.filter(
-                            year=previous_year, council_id=OuterRef("council_id")
-                        ).values("weighted_total")
-                    )
-                )
-                .annotate(difference=(F("weighted_total") - F("previous_score")))
-                .exclude(Q(previous_score=0) | Q(weighted_total=0))
-                .order_by("-difference")
+        candidates = plan_scores.loc[
+            (plan_scores["weighted_total"] > 0)
+            & plan_scores["previous_score"].notna()
+            & (plan_scores["previous_score"] != 0)
+        ]
+        labels = pd.Series("", index=plan_scores.index)
+
+        top = candidates.index[
+            self.top_ranked(
+                candidates,
+                "scoring_group",
+                "difference",
+                self.MOST_IMPROVED_COUNT,
+                self.DEFAULT_MOST_IMPROVED_COUNT,
             )
+        ]
+        labels[top] = plan_scores.loc[top, "scoring_group"]
+
+        # the most improved in each country takes precedence over the group
+        top = candidates.index[
+            self.top_ranked(candidates, "council__country", "difference", {}, 1)
+        ]
+        labels[top] = plan_scores.loc[top, "council__country"].map(
+            dict(Council.COUNTRY_CHOICES)
+        )
 
-            most_improved = score_differences.first()
-            most_improved.most_improved = country[1]
-            most_improved.save()
+        self.save_labels(PlanScore, plan_scores, "most_improved", labels)
+        self.report_labels("Most improved", plan_scores, labels, "difference")
 
-        for section in plan_sections.all():
-            if section.code in self.SKIP_SECTION_PERFORMERS:
-                continue
+        section_scores = self.get_section_score_frame(years)
+        previous = (
+            section_scores.loc[section_scores["year"] == years[1]]
+            .drop_duplicates(["council_id", "code"])
+            .set_index(["council_id", "code"])["weighted_score"]
+        )
+        section_scores = section_scores.loc[section_scores["year"] == years[0]]
+        section_scores = section_scores.assign(
+            previous_score=previous.reindex(
+                pd.MultiIndex.from_frame(section_scores[["council_id", "code"]])
+            ).to_numpy()
+        )
+        section_scores["difference"] = (
+            section_scores["weighted_score"] - section_scores["previous_score"]
+        )
 
-            differences = (
-                PlanSectionScore.objects.filter(
-                    plan_score__year=self.YEAR,
-                    plan_section=section,
-                )
-                .annotate(
-                    previous_score=Subquery(
-                        PlanSectionScore.objects.filter(
-                            plan_score__year=previous_year,
-                            plan_section__code=section.code,
-                            plan_score__council_id=OuterRef("plan_score__council_id"),
-                        ).values("weighted_score")
-                    )
-                )
-                .annotate(difference=(F("weighted_score") - F("previous_score")))
-                .exclude(Q(previous_score=0) | Q(weighted_score=0))
-                .order_by("-difference")
+        candidates = section_scores.loc[
+            ~section_scores["code"].isin(self.SKIP_SECTION_PERFORMERS)
+            & (section_scores["weighted_score"] != 0)
+            & section_scores["previous_score"].notna()
+            & (section_scores["previous_score"] != 0)
+        ]
+        top = candidates.index[
+            self.top_ranked(
+                candidates, "code", "difference", {}, self.DEFAULT_MOST_IMPROVED_COUNT
             )
+        ]
+        labels = pd.Series("", index=section_scores.index)
+        labels[top] = section_scores.loc[top, "code"]
 
-            for most_improved in differences.all()[: self.DEFAULT_MOST_IMPROVED_COUNT]:
-                most_improved.most_improved = section.code
-                most_improved.save()
+        self.save_labels(PlanSectionScore, section_scores, "most_improved", labels)
+        self.report_labels(
+            "Section most improved", section_scores, labels, "difference"
+        )
 
     def import_questions(self):
         df = pd.read_csv(self.QUESTIONS_CSV)
@@ -470,6 +615,10 @@ class Command(BaseImportCommand):
             to_create.append(score_obj)
         PlanQuestionScore.objects.bulk_create(to_create)
 
+    def update_averages(self):
+        count = PlanScoreAverage.populate(self.YEAR)
+        self.stdout.write(f"Stored {count} average score combinations")
+
     def handle(
         self,
         update_questions: bool = False,
@@ -481,6 +630,8 @@ class Command(BaseImportCommand):
         **options,
     ):
         self.update_control = update_political_control
+        self.commit = commit
+        self.verbosity = options.get("verbosity", 1)
         self.previous_year = previous_year
         if import_year:
             self.YEAR = import_year
@@ -505,6 +656,9 @@ class Command(BaseImportCommand):
                 self.import_questions()
             self.import_question_scores()
             self.label_most_improved(previous_year)
+            self.update_averages()
+            DataVersion.bump(DataVersion.SCORING)
+            CouncilProfileSnapshot.mark_stale()
 
         if commit:
             self.stdout.write(f"{GREEN}Scores updated{NOBOLD}")
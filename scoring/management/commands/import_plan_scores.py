@@ -13,10 +13,11 @@ import urllib3
 import tempfile
 import zipfile
 
-from caps.models import Council
+from caps.models import Council, CouncilProfileSnapshot, DataVersion
 from caps.utils import char_from_text, integer_from_text
 from scoring.models import (
     PlanScore,
+    PlanScoreAverage,
     PlanSection,
     PlanSectionScore,
     PlanQuestion,
@@ -342,6 +343,9 @@ class Command(BaseCommand):
                 section_score.top_performer = section.code
                 section_score.save()
 
+    def update_averages(self):
+        PlanScoreAverage.populate(self.YEAR)
+
     def handle(self, *args, **options):
         self.get_files()
         self.create_sections()
@@ -351,3 +355,6 @@ class Command(BaseCommand):
         self.import_question_scores()
         self.create_header_scores()
         self.label_top_performers()
+        self.update_averages()
+        DataVersion.bump(DataVersion.SCORING)
+        CouncilProfileSnapshot.mark_stale()
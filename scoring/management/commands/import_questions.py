@@ -18,7 +18,7 @@ from django.core.management.base import BaseCommand, CommandError
 from django.db.models import F, Sum
 from django.template.defaultfilters import pluralize
 
-from caps.models import Council
+from caps.models import Council, DataVersion
 from caps.utils import char_from_text, integer_from_text
 from scoring.models import (
     PlanQuestion,
@@ -141,3 +141,4 @@ class Command(BaseCommand):
         self.setup_sections()
         self.create_sections()
         self.import_questions()
+        DataVersion.bump(DataVersion.SCORING)
@@ -1,7 +1,7 @@
 from django.conf import settings
 from django.http import Http404, HttpResponseServerError
 
-from scoring.models import PlanYear
+from scoring.models import PlanYear, PlanYearRegistry
 
 
 class AddYearMiddleware:
@@ -26,12 +26,12 @@ class AddYearMiddleware:
 
                 if year is not None:
                     try:
-                        plan_year = PlanYear.objects.get(year=year)
+                        plan_year = PlanYearRegistry.get_year(year)
                     except PlanYear.DoesNotExist:
                         raise Http404("No such year")
                 else:
                     try:
-                        plan_year = PlanYear.objects.get(is_current=True)
+                        plan_year = PlanYearRegistry.get_current()
                     except PlanYear.DoesNotExist:
                         raise HttpResponseServerError("No current Plan Year found")
 
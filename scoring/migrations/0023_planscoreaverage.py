@@ -0,0 +1,60 @@
+# Generated by Django 4.2.30 on 2026-10-18 21:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("scoring", "0022_planyearconfig"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PlanScoreAverage",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("year", models.PositiveSmallIntegerField()),
+                (
+                    "scoring_group",
+                    models.CharField(
+                        blank=True,
+                        choices=[
+                            ("single", "Single Tier"),
+                            ("county", "County Council"),
+                            ("district", "District Council"),
+                            ("combined", "Combined Authority"),
+                            ("northern-ireland", "Northern Ireland Council"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                (
+                    "country",
+                    models.PositiveSmallIntegerField(
+                        blank=True,
+                        choices=[
+                            (1, "England"),
+                            (2, "Scotland"),
+                            (3, "Wales"),
+                            (4, "Northern Ireland"),
+                        ],
+                        null=True,
+                    ),
+                ),
+                ("filter_key", models.CharField(blank=True, max_length=200)),
+                ("averages", models.JSONField()),
+            ],
+            options={
+                "unique_together": {("year", "scoring_group", "country", "filter_key")},
+            },
+        ),
+    ]
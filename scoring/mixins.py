@@ -1,8 +1,12 @@
+import hashlib
+
 from django.conf import settings
 from django.contrib.auth.mixins import AccessMixin
+from django.core.cache import cache
+from django.http import HttpResponse
 from django.shortcuts import redirect
 
-from caps.models import Council
+from caps.models import Council, DataVersion
 from scoring.models import PlanScore
 
 
@@ -17,6 +21,76 @@ class PrivateScorecardsAccessMixin(AccessMixin):
         return super().dispatch(request, *args, **kwargs)
 
 
+class PageCacheMixin:
+    """
+    Keep the rendered page in the shared cache until the scores are next
+    imported. Only public pages for anonymous users are cached so this should
+    come after PrivateScorecardsAccessMixin.
+    """
+
+    page_cache_timeout = None
+    # how long to trust the data version before checking the database again
+    data_version_timeout = 60
+
+    def get_data_version(self):
+        version = cache.get("data_version:scoring")
+        if version is None:
+            version = DataVersion.get_version(DataVersion.SCORING)
+            if version is not None:
+                cache.set("data_version:scoring", version, self.data_version_timeout)
+
+        return version
+
+    def get_page_cache_key(self):
+        request = self.request
+        if request.method not in ("GET", "HEAD"):
+            return None
+
+        if (
+            getattr(settings, "SCORECARDS_PRIVATE", False)
+            or request.user.is_authenticated
+        ):
+            return None
+
+        version = self.get_data_version()
+        if version is None:
+            return None
+
+        url = hashlib.md5(
+            f"{request.get_host()}{request.get_full_path()}".encode()
+        ).hexdigest()
+        return f"scoring_page:{version}:{request.year.year}:{url}"
+
+    def dispatch(self, request, *args, **kwargs):
+        cache_key = self.get_page_cache_key()
+        if cache_key is None:
+            return super().dispatch(request, *args, **kwargs)
+
+        response = cache.get(cache_key)
+        if response is not None:
+            return response
+
+        response = super().dispatch(request, *args, **kwargs)
+        if response.status_code == 200:
+            if hasattr(response, "render") and callable(response.render):
+                response.add_post_render_callback(
+                    lambda r: self.cache_response(cache_key, r)
+                )
+            else:
+                self.cache_response(cache_key, response)
+
+        return response
+
+    def cache_response(self, cache_key, response):
+        # store a plain response so the cached copy doesn't get passed through
+        # the template response middleware again
+        cached = HttpResponse(response.content, status=response.status_code)
+        for header, value in response.items():
+            cached[header] = value
+
+        cache.set(cache_key, cached, self.page_cache_timeout)
+
+
 class AdvancedFilterMixin:
     def setup_filter_context(self, context, filter, scoring_group):
         if getattr(filter.form, "cleaned_data", None) is not None:
@@ -1,12 +1,18 @@
+import time
 from collections import defaultdict
+from copy import deepcopy
 
 from django.conf import settings
+from django.core.cache import cache
 from django.db import models
 from django.db.models import Avg, Count, F, IntegerField, Max, OuterRef, Q, Subquery
 from django.db.models.functions import Cast
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 
-from caps.models import Council
+from caps.models import Council, CouncilProfileSnapshot, DataVersion
 from caps.utils import clean_links
+from scoring.cube import ScoreCube
 
 
 # define this here as mixins imports PlanScore so if we import that then we get
@@ -48,6 +54,97 @@ class PlanYearConfig(models.Model):
     value = models.JSONField()
 
 
+class PlanYearRegistry:
+    """
+    In process copy of all the PlanYears, with their previous years, and their
+    configs. These are needed on every scorecards request and rarely change so
+    this saves querying for them each time.
+
+    Cleared when a PlanYear or PlanYearConfig is saved or deleted, and reloaded
+    after RELOAD_AFTER seconds to pick up changes made by other processes.
+    """
+
+    RELOAD_AFTER = 300
+
+    _loaded = None
+
+    @classmethod
+    def clear(cls):
+        cls._loaded = None
+
+    @classmethod
+    def load(cls):
+        years = {plan_year.id: plan_year for plan_year in PlanYear.objects.all()}
+        for plan_year in years.values():
+            # fill in the related object so following it doesn't query
+            if plan_year.previous_year_id in years:
+                plan_year.previous_year = years[plan_year.previous_year_id]
+
+        configs = {}
+        for year, name, value in PlanYearConfig.objects.values_list(
+            "year__year", "name", "value"
+        ):
+            configs[(year, name)] = value
+
+        loaded = {
+            "time": time.monotonic(),
+            "years": {plan_year.year: plan_year for plan_year in years.values()},
+            "current": next((y for y in years.values() if y.is_current), None),
+            "configs": configs,
+        }
+        cls._loaded = loaded
+
+        return loaded
+
+    @classmethod
+    def get_loaded(cls):
+        loaded = cls._loaded
+        if loaded is None or time.monotonic() - loaded["time"] > cls.RELOAD_AFTER:
+            loaded = cls.load()
+
+        return loaded
+
+    @classmethod
+    def get_year(cls, year):
+        try:
+            return cls.get_loaded()["years"][int(year)]
+        except (KeyError, TypeError, ValueError):
+            raise PlanYear.DoesNotExist(f"No PlanYear for {year}")
+
+    @classmethod
+    def get_current(cls):
+        current = cls.get_loaded()["current"]
+        if current is None:
+            raise PlanYear.DoesNotExist("No current PlanYear")
+
+        return current
+
+    @classmethod
+    def get_config(cls, name, year):
+        try:
+            value = cls.get_loaded()["configs"][(int(year), name)]
+        except (KeyError, TypeError, ValueError):
+            raise PlanYearConfig.DoesNotExist(f"No {name} config for {year}")
+
+        # callers may change the value so don't hand out the shared copy
+        return deepcopy(value)
+
+
+@receiver(post_save, sender=PlanYear, dispatch_uid="plan_year_saved")
+@receiver(post_delete, sender=PlanYear, dispatch_uid="plan_year_deleted")
+@receiver(post_save, sender=PlanYearConfig, dispatch_uid="plan_year_config_saved")
+@receiver(post_delete, sender=PlanYearConfig, dispatch_uid="plan_year_config_deleted")
+def clear_plan_year_registry(sender, **kwargs):
+    PlanYearRegistry.clear()
+
+
+@receiver(post_save, sender=PlanYear, dispatch_uid="plan_year_saved_profiles")
+@receiver(post_delete, sender=PlanYear, dispatch_uid="plan_year_deleted_profiles")
+def mark_council_profiles_stale(sender, **kwargs):
+    # council pages show the scores for the current year
+    CouncilProfileSnapshot.mark_stale()
+
+
 class PlanScore(models.Model):
     """
     Overall score for a council's plan for a particular year
@@ -164,14 +261,47 @@ class PlanScore(models.Model):
 
         return questions
 
+    @classmethod
+    def question_scores_for_plans(cls, plan_ids=None, plan_year=None):
+        """
+        Answers to each question for all the plans, along with the score for the
+        previous year's version of the question in the council's previous plan,
+        using a single query.
+
+        Returns a dict of question code to a dict of plan score id to answer.
+        """
+        scores = defaultdict(dict)
+        if not plan_ids:
+            return scores
+
+        plan_placeholders = ", ".join(["%s"] * len(plan_ids))
+        questions = PlanQuestion.objects.raw(
+            f"select q.id, q.code, q.text, q.question_type, q.max_score, q.criteria, s.code as section_code, a.answer, a.score, a.max_score as header_max, q.weighting, q.how_marked, a.evidence_links, ps.id as plan_score_id, c.name as council_name, \
+            pq.code as previous_question_code, pa.id as previous_answer_id, pa.score as previous_score, pq.max_score as previous_max \
+            from scoring_planquestion q join scoring_plansection s on q.section_id = s.id \
+            join scoring_planquestionscore a on q.id = a.plan_question_id \
+            join scoring_planscore ps on a.plan_score_id = ps.id \
+            join caps_council c on ps.council_id = c.id \
+            left join scoring_planquestion pq on q.previous_question_id = pq.id \
+            left join scoring_planquestionscore pa on pa.plan_question_id = pq.id and pa.plan_score_id = ps.previous_year_id \
+            where s.year = %s and a.plan_score_id in ({plan_placeholders}) \
+            order by q.code, c.name",
+            [plan_year, *plan_ids],
+        )
+
+        for question in questions:
+            scores[question.code][question.plan_score_id] = question
+
+        return scores
+
     @classmethod
     def get_average(cls, scoring_group=None, filter=None, year=None, country=None):
         if year is None:
-            plan_year = PlanYear.objects.get(is_current=True)
+            plan_year = PlanYearRegistry.get_current()
             year = plan_year.year
         else:
             try:
-                plan_year = PlanYear.objects.get(year=year)
+                plan_year = PlanYearRegistry.get_year(year)
             except PlanYear.DoesNotExist:
                 plan_year = None
 
@@ -262,6 +392,12 @@ class PlanSection(models.Model):
     long_description = models.TextField(null=True, blank=True)
 
     def get_averages_by_council_group(self):
+        cube = ScoreCube.get()
+        if cube is not None:
+            return cube.section_averages_by_group(
+                self.code, self.year, Council.SCORING_GROUPS
+            )
+
         averages = {}
 
         scores = PlanSectionScore.objects.filter(
@@ -316,6 +452,24 @@ class PlanSection(models.Model):
     @classmethod
     def get_average_scores(
         cls, scoring_group=None, filter=None, year=settings.PLAN_YEAR, country=None
+    ):
+        """
+        Use the averages stored at import time if there are any for this
+        combination of arguments, otherwise fall back to calculating them.
+        """
+        averages = PlanScoreAverage.get_precomputed(
+            scoring_group=scoring_group, filter=filter, year=year, country=country
+        )
+        if averages is not None:
+            return averages
+
+        return cls.calculate_average_scores(
+            scoring_group=scoring_group, filter=filter, year=year, country=country
+        )
+
+    @classmethod
+    def calculate_average_scores(
+        cls, scoring_group=None, filter=None, year=settings.PLAN_YEAR, country=None
     ):
         has_score, has_score_avg = PlanScore.get_average(
             scoring_group=scoring_group, filter=filter, year=year, country=country
@@ -360,6 +514,115 @@ class PlanSection(models.Model):
         return averages
 
 
+class PlanScoreAverage(models.Model):
+    """
+    Stored output of PlanSection.calculate_average_scores for a year, scoring
+    group, country and filter combination. These are generated by the score
+    import commands as calculating them on each request is expensive.
+    """
+
+    year = models.PositiveSmallIntegerField()
+    scoring_group = models.CharField(
+        max_length=20, choices=Council.SCORING_GROUP_CHOICES, blank=True
+    )
+    country = models.PositiveSmallIntegerField(
+        choices=Council.COUNTRY_CHOICES, null=True, blank=True
+    )
+    filter_key = models.CharField(max_length=200, blank=True)
+    averages = models.JSONField()
+
+    class Meta:
+        unique_together = ["year", "scoring_group", "country", "filter_key"]
+
+    @classmethod
+    def make_filter_key(cls, filter=None):
+        """
+        Generate a stable key for the filter params that affect averages,
+        ignoring any that get_average does not use.
+        """
+        if filter is None:
+            return ""
+
+        params = []
+        for field in sorted(PlanSection.FILTER_FIELD_MAP.keys()):
+            if filter.get(field):
+                params.append(f"{field}={filter[field]}")
+
+        return "&".join(params)
+
+    @classmethod
+    def get_precomputed(
+        cls, scoring_group=None, filter=None, year=settings.PLAN_YEAR, country=None
+    ):
+        if year is None:
+            return None
+
+        averages = (
+            cls.objects.filter(
+                year=year,
+                scoring_group=scoring_group["slug"] if scoring_group else "",
+                country=country,
+                filter_key=cls.make_filter_key(filter),
+            )
+            .values_list("averages", flat=True)
+            .first()
+        )
+
+        return averages
+
+    @classmethod
+    def get_filter_combinations(cls, year):
+        """
+        All filters with a single param set for values that exist in the year's
+        scores, plus no filter at all.
+        """
+        filters = [None]
+        for field, lookup in PlanSection.FILTER_FIELD_MAP.items():
+            values = (
+                PlanScore.objects.filter(year=year, total__gt=0)
+                .exclude(**{f"{lookup}__isnull": True})
+                .values_list(lookup, flat=True)
+                .order_by()
+                .distinct()
+            )
+            for value in values:
+                if value:
+                    filters.append({field: value})
+
+        return filters
+
+    @classmethod
+    def populate(cls, year):
+        """
+        Regenerate the stored averages for year. Should be called after
+        scores for the year are imported.
+        """
+        cls.objects.filter(year=year).delete()
+
+        countries = [None] + [code for code, _ in Council.COUNTRY_CHOICES]
+        to_create = []
+        for filter in cls.get_filter_combinations(year):
+            filter_key = cls.make_filter_key(filter)
+            for slug, group in Council.SCORING_GROUPS.items():
+                for country in countries:
+                    averages = PlanSection.calculate_average_scores(
+                        scoring_group=group, filter=filter, year=year, country=country
+                    )
+                    to_create.append(
+                        cls(
+                            year=year,
+                            scoring_group=slug,
+                            country=country,
+                            filter_key=filter_key,
+                            averages=averages,
+                        )
+                    )
+
+        cls.objects.bulk_create(to_create, batch_size=1000)
+
+        return len(to_create)
+
+
 class PlanSectionScore(ScoreFilterMixin, models.Model):
     """
     Score for a section of a council's plan
@@ -495,6 +758,35 @@ class PlanSectionScore(ScoreFilterMixin, models.Model):
 
     @classmethod
     def get_all_council_scores(cls, plan_year=settings.PLAN_YEAR, as_list=False):
+        """
+        Section scores for every council with a score for the year, keyed by
+        council id. Cached across requests until the scores are next imported.
+        """
+        version = DataVersion.get_version(DataVersion.SCORING)
+        councils = None
+        if version is not None:
+            cache_key = f"all_council_scores:{plan_year}:{version}"
+            councils = cache.get(cache_key)
+
+        if councils is None:
+            councils = cls.calculate_all_council_scores(plan_year=plan_year)
+            if version is not None:
+                cache.set(cache_key, councils, None)
+
+        if as_list:
+            # sections are already in code order
+            return defaultdict(
+                list,
+                {
+                    council_id: list(scores.values())
+                    for council_id, scores in councils.items()
+                },
+            )
+
+        return councils
+
+    @classmethod
+    def calculate_all_council_scores(cls, plan_year=settings.PLAN_YEAR):
         """
         This excludes plans with zero score as it's assumed that if they have 0 then they
         were not marked, or the council has no plan
@@ -525,10 +817,7 @@ class PlanSectionScore(ScoreFilterMixin, models.Model):
                 "change",
             )
         )
-        if as_list:
-            councils = defaultdict(list)
-        else:
-            councils = defaultdict(dict)
+        councils = defaultdict(dict)
         for score in scores:
             obj = {
                 "code": score["plan_section__code"],
@@ -539,17 +828,16 @@ class PlanSectionScore(ScoreFilterMixin, models.Model):
             }
             if score["plan_score__previous_year__total"] == 0:
                 obj["change"] = None
-            if as_list:
-                councils[score["plan_score__council_id"]].append(obj)
-            else:
-                councils[score["plan_score__council_id"]][
-                    score["plan_section__code"]
-                ] = obj
+            councils[score["plan_score__council_id"]][score["plan_section__code"]] = obj
 
         return councils
 
     @classmethod
     def get_all_section_averages(cls, council_group=None, plan_year=None):
+        cube = ScoreCube.get()
+        if cube is not None:
+            return cube.section_averages(council_group, plan_year)
+
         section_avgs = cls.objects.select_related("plan_section").filter(
             plan_score__total__gt=0
         )
@@ -565,6 +853,10 @@ class PlanSectionScore(ScoreFilterMixin, models.Model):
 
     @classmethod
     def get_all_section_top_mark_counts(cls, council_group=None, plan_year=None):
+        cube = ScoreCube.get()
+        if cube is not None:
+            return cube.section_top_mark_counts(council_group, plan_year)
+
         section_top_marks = cls.objects.select_related("plan_section").filter(
             score=F("max_score")
         )
@@ -700,6 +992,10 @@ class PlanQuestion(models.Model):
         return self.question_type == "negative"
 
     def get_scores_breakdown(self, year=None, scoring_group=None):
+        cube = ScoreCube.get()
+        if cube is not None:
+            return cube.scores_breakdown(self.id, year, scoring_group)
+
         filters = {
             "plan_question": self,
         }
@@ -718,6 +1014,10 @@ class PlanQuestion(models.Model):
         return counts
 
     def get_score_breakdown_for_councils(self, council_ids, year):
+        cube = ScoreCube.get()
+        if cube is not None:
+            return cube.score_breakdown_for_councils(self.id, council_ids, year)
+
         counts = (
             PlanQuestionScore.objects.filter(
                 plan_score__year=year,
@@ -756,6 +1056,12 @@ class PlanQuestionScore(ScoreFilterMixin, models.Model):
     def all_question_max_score_counts(
         cls, council_group=None, plan_year=None, use_old_max_counts=False
     ):
+        cube = ScoreCube.get()
+        if cube is not None:
+            return cube.question_max_score_counts(
+                council_group, plan_year, use_old_max_counts
+            )
+
         max_counts = PlanQuestionScore.objects.filter(
             score=F("max_score"),
         )
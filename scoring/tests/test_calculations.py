@@ -1,8 +1,18 @@
+from datetime import timedelta
 from unittest import skip
 
-from caps.models import Council
+from caps.models import Council, DataVersion
+from django.core.cache import cache
 from django.test import TestCase
-from scoring.models import PlanScore, PlanSection, PlanSectionScore
+from scoring.cube import ScoreCube
+from scoring.models import (
+    PlanQuestion,
+    PlanQuestionScore,
+    PlanScore,
+    PlanScoreAverage,
+    PlanSection,
+    PlanSectionScore,
+)
 
 
 @skip("Test needs updating/checking with new fixtures")
@@ -102,3 +112,174 @@ class TestGetAllScores(TestCase):
                 },
             },
         )
+
+
+class TestPrecomputedAverageScores(TestCase):
+    fixtures = ["test_homepage.json"]
+
+    def test_precomputed_matches_calculated(self):
+        group = Council.SCORING_GROUPS["single"]
+        calculated = PlanSection.get_average_scores(scoring_group=group, year=2023)
+
+        PlanScoreAverage.populate(2023)
+
+        with self.assertNumQueries(1):
+            precomputed = PlanSection.get_average_scores(scoring_group=group, year=2023)
+
+        self.assertEqual(precomputed, calculated)
+
+    def test_filter_key(self):
+        key = PlanScoreAverage.make_filter_key(
+            {"population": "", "imdq": 3, "county": "Borsetshire", "country": "1"}
+        )
+        self.assertEqual(key, "country=1&imdq=3")
+
+    def test_filtered_averages(self):
+        PlanScoreAverage.populate(2023)
+
+        group = Council.SCORING_GROUPS["single"]
+        with self.assertNumQueries(1):
+            averages = PlanSection.get_average_scores(
+                scoring_group=group, filter={"country": "2"}, year=2023
+            )
+        self.assertEqual(averages["total"]["score"], 25)
+
+        # no precomputed averages for this combination so calculate them
+        averages = PlanSection.get_average_scores(
+            scoring_group=group,
+            filter={"country": "2", "ruc_cluster": "urban"},
+            year=2023,
+        )
+        self.assertEqual(averages["total"]["score"], 0)
+
+
+class TestCachedCouncilScores(TestCase):
+    fixtures = ["test_homepage.json"]
+
+    def setUp(self):
+        cache.clear()
+        ScoreCube.clear()
+
+    def tearDown(self):
+        cache.clear()
+        ScoreCube.clear()
+
+    def test_not_cached_without_version(self):
+        PlanSectionScore.get_all_council_scores(plan_year=2023)
+        with self.assertNumQueries(2):
+            PlanSectionScore.get_all_council_scores(plan_year=2023)
+
+    def test_bump_sets_updated(self):
+        DataVersion.bump(DataVersion.SCORING)
+        first = DataVersion.objects.get(name=DataVersion.SCORING)
+        DataVersion.objects.filter(pk=first.pk).update(
+            updated=first.updated - timedelta(days=1)
+        )
+
+        self.assertEqual(DataVersion.bump(DataVersion.SCORING), 2)
+        second = DataVersion.objects.get(name=DataVersion.SCORING)
+        self.assertGreaterEqual(second.updated, first.updated)
+
+    def test_cached_until_version_bumped(self):
+        DataVersion.bump(DataVersion.SCORING)
+        scores = PlanSectionScore.get_all_council_scores(plan_year=2023)
+
+        # only the version lookup
+        with self.assertNumQueries(1):
+            cached = PlanSectionScore.get_all_council_scores(plan_year=2023)
+        with self.assertNumQueries(1):
+            as_list = PlanSectionScore.get_all_council_scores(
+                plan_year=2023, as_list=True
+            )
+        self.assertEqual(cached, scores)
+        self.assertEqual(as_list[1], [scores[1]["s1_gov"], scores[1]["s2_m_a"]])
+        self.assertEqual(as_list[99], [])
+
+        PlanSectionScore.objects.filter(plan_score__council_id=1).update(score=1)
+        DataVersion.bump(DataVersion.SCORING)
+
+        scores = PlanSectionScore.get_all_council_scores(plan_year=2023)
+        self.assertEqual(scores[1]["s1_gov"]["score"], 1)
+
+
+class TestScoreCube(TestCase):
+    fixtures = ["test_homepage.json"]
+
+    def setUp(self):
+        ScoreCube.clear()
+
+    def tearDown(self):
+        ScoreCube.clear()
+
+    def from_database(self, fn):
+        DataVersion.objects.all().delete()
+        ScoreCube.clear()
+        self.assertIsNone(ScoreCube.get())
+        return fn()
+
+    def from_cube(self, fn):
+        DataVersion.bump(DataVersion.SCORING)
+        ScoreCube.clear()
+        self.assertIsNotNone(ScoreCube.get())
+        with self.assertNumQueries(0):
+            return fn()
+
+    def assertSameResults(self, fn):
+        expected = self.from_database(fn)
+        self.assertEqual(self.from_cube(fn), expected)
+
+    def assertSameRows(self, fn, key):
+        expected = sorted(self.from_database(fn), key=lambda r: str(r[key]))
+        results = sorted(self.from_cube(fn), key=lambda r: str(r[key]))
+        self.assertEqual(results, expected)
+
+    def test_section_averages(self):
+        for group in [None, *Council.SCORING_GROUPS.values()]:
+            self.assertSameRows(
+                lambda: list(
+                    PlanSectionScore.get_all_section_averages(
+                        council_group=group, plan_year=2023
+                    )
+                ),
+                "plan_section__code",
+            )
+            self.assertSameRows(
+                lambda: list(
+                    PlanSectionScore.get_all_section_top_mark_counts(
+                        council_group=group, plan_year=2023
+                    )
+                ),
+                "plan_section__code",
+            )
+
+    def test_section_averages_by_group(self):
+        for section in PlanSection.objects.all():
+            self.assertSameResults(section.get_averages_by_council_group)
+
+    def test_question_max_score_counts(self):
+        group = Council.SCORING_GROUPS["single"]
+        for use_old_max_counts in (False, True):
+            self.assertSameResults(
+                lambda: PlanQuestionScore.all_question_max_score_counts(
+                    council_group=group,
+                    plan_year=2023,
+                    use_old_max_counts=use_old_max_counts,
+                )
+            )
+
+    def test_score_breakdowns(self):
+        group = Council.SCORING_GROUPS["single"]
+        council_ids = list(Council.objects.values_list("id", flat=True))
+        for question in PlanQuestion.objects.all():
+            self.assertSameRows(
+                lambda: list(
+                    question.get_scores_breakdown(year=2023, scoring_group=group)
+                ),
+                "score",
+            )
+            self.assertSameRows(
+                lambda: list(
+                    question.get_score_breakdown_for_councils(council_ids, 2023)
+                ),
+                "score",
+            )
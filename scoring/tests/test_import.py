@@ -0,0 +1,232 @@
+from io import StringIO
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+
+import pandas as pd
+from caps.models import Council
+from django.test import TestCase
+from scoring.management.commands.import_actions_scores import Command
+from scoring.models import PlanScore, PlanSectionScore
+
+
+class TestScoreLabels(TestCase):
+    def setUp(self):
+        # name, authority type, score this year, score last year
+        scores = [
+            ("Ambridge", "UA", 80, 70),
+            ("Borchester", "UA", 80, 50),
+            ("Churchford", "UA", 60, 0),
+            ("Darrington", "COMB", 50, 30),
+            ("Edgeley", "COMB", 50, 30),
+            ("Felpersham", "COMB", 40, 39),
+            ("Grey Gables", "CTY", 55, 50),
+            ("Hollerton", "NMD", 0, None),
+        ]
+        for i, (name, authority_type, score, previous_score) in enumerate(scores):
+            council = Council.objects.create(
+                name=name,
+                slug=name.lower().replace(" ", "-"),
+                country=Council.ENGLAND,
+                authority_type=authority_type,
+                authority_code=f"C{i}",
+                gss_code=f"E0000000{i}",
+            )
+            PlanScore.objects.create(council=council, year=2024, weighted_total=score)
+            if previous_score is not None:
+                PlanScore.objects.create(
+                    council=council, year=2023, weighted_total=previous_score
+                )
+
+        self.command = Command(stdout=StringIO(), stderr=StringIO())
+        self.command.YEAR = 2024
+        self.command.commit = True
+        self.command.verbosity = 1
+
+    def get_labels(self, field):
+        return {
+            name: label
+            for name, label in PlanScore.objects.filter(year=2024).values_list(
+                "council__name", field
+            )
+            if label
+        }
+
+    def test_top_ranked(self):
+        df = pd.DataFrame(
+            {
+                "group": ["a", "a", "a", "b", "b"],
+                "value": [1, 3, 3, 2, 1],
+            }
+        )
+        self.assertEqual(
+            self.command.top_ranked(df, "group", "value", {"b": 2}, 1).tolist(),
+            [False, True, False, True, True],
+        )
+
+    def test_top_performers(self):
+        self.command.label_top_performers()
+
+        # ties go to the earlier score, and zero scores are never labelled
+        self.assertEqual(
+            self.get_labels("top_performer"),
+            {
+                "Ambridge": "single",
+                "Darrington": "combined",
+                "Edgeley": "combined",
+                "Grey Gables": "county",
+            },
+        )
+
+    def test_most_improved(self):
+        self.command.label_most_improved(2023)
+
+        # the most improved in England is labelled with the country instead of
+        # the group, and councils with no previous score are left out
+        self.assertEqual(
+            self.get_labels("most_improved"),
+            {
+                "Ambridge": "single",
+                "Borchester": "England",
+                "Darrington": "combined",
+                "Grey Gables": "county",
+            },
+        )
+
+    def test_labels_replaced(self):
+        PlanScore.objects.filter(council__name="Felpersham", year=2024).update(
+            top_performer="combined", most_improved="combined"
+        )
+        self.command.label_top_performers()
+        self.command.label_most_improved(2023)
+
+        self.assertNotIn("Felpersham", self.get_labels("top_performer"))
+        self.assertNotIn("Felpersham", self.get_labels("most_improved"))
+
+    def test_most_improved_needs_previous_year(self):
+        self.command.label_most_improved(None)
+        self.assertEqual(self.get_labels("most_improved"), {})
+        self.assertIn("need previous year", self.command.stderr.getvalue())
+
+
+class TestImportScores(TestCase):
+    def setUp(self):
+        self.councils = [
+            Council.objects.create(
+                name=name,
+                slug=name.lower(),
+                country=Council.ENGLAND,
+                authority_type="UA",
+                authority_code=name[:3].upper(),
+                gss_code=gss_code,
+            )
+            for name, gss_code in (
+                ("Borsetshire", "E00000001"),
+                ("Setborshire", "E00000002"),
+            )
+        ]
+        self.previous = PlanScore.objects.create(
+            council=self.councils[0], year=2023, weighted_total=40
+        )
+
+        self.tmp = TemporaryDirectory()
+        self.command = Command(stdout=StringIO(), stderr=StringIO())
+        self.command.YEAR = 2024
+        self.command.previous_year = 2023
+        self.command.update_control = True
+        self.command.SECTION_SCORES_CSV = Path(self.tmp.name, "sections.csv")
+        self.command.OVERALL_SCORES_CSV = Path(self.tmp.name, "overall.csv")
+        self.command.create_sections()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write_scores(self, transport_score):
+        pd.DataFrame(
+            [
+                ["E00000001", "Transport", transport_score, 20],
+                ["E00000001", "Biodiversity", None, 10],
+                ["E00000001", "overall", 20, 30],
+                ["E00000002", "Transport", 5, 20],
+                ["E99999999", "Transport", 5, 20],
+            ],
+            columns=["gss", "section", "score", "max_score"],
+        ).to_csv(self.command.SECTION_SCORES_CSV, index=False)
+        pd.DataFrame(
+            [
+                ["Borsetshire", "E00000001", 0.5, 0.55, "LAB", 0.6, 0.4],
+                ["Setborshire", "E00000002", 0.25, 0.2, "CON", 0.2, None],
+            ],
+            columns=[
+                "council",
+                "gss",
+                "raw_total",
+                "weighted_total",
+                "political_control",
+                "Transport",
+                "Biodiversity",
+            ],
+        ).to_csv(self.command.OVERALL_SCORES_CSV, index=False)
+
+    def import_scores(self):
+        with patch("builtins.print"):
+            self.command.import_section_scores()
+            self.command.import_overall_scores()
+
+    def get_section_scores(self):
+        return set(
+            PlanSectionScore.objects.values_list(
+                "plan_score__council__name",
+                "plan_section__description",
+                "score",
+                "max_score",
+                "weighted_score",
+            )
+        )
+
+    def test_import(self):
+        self.write_scores(15)
+        self.import_scores()
+
+        plan_scores = {
+            plan_score.council_id: plan_score
+            for plan_score in PlanScore.objects.filter(year=2024)
+        }
+        self.assertEqual(len(plan_scores), 2)
+
+        plan_score = plan_scores[self.councils[0].id]
+        self.assertEqual(plan_score.total, 50)
+        self.assertEqual(plan_score.weighted_total, 55)
+        self.assertEqual(plan_score.political_control, "Labour")
+        self.assertEqual(plan_score.previous_year, self.previous)
+
+        plan_score = plan_scores[self.councils[1].id]
+        self.assertEqual(plan_score.total, 25)
+        self.assertEqual(plan_score.weighted_total, 20)
+        self.assertEqual(plan_score.political_control, "Conservative")
+        self.assertIsNone(plan_score.previous_year)
+
+        self.assertEqual(
+            self.get_section_scores(),
+            {
+                ("Borsetshire", "Transport", 15, 20, 60),
+                ("Borsetshire", "Biodiversity", 0, 10, 40),
+                ("Setborshire", "Transport", 5, 20, 20),
+            },
+        )
+
+    def test_reimport(self):
+        self.write_scores(15)
+        self.import_scores()
+        ids = set(PlanSectionScore.objects.values_list("id", flat=True))
+
+        self.write_scores(18)
+        self.import_scores()
+
+        self.assertEqual(PlanScore.objects.filter(year=2024).count(), 2)
+        self.assertEqual(
+            set(PlanSectionScore.objects.values_list("id", flat=True)), ids
+        )
+        self.assertIn(
+            ("Borsetshire", "Transport", 18, 20, 60), self.get_section_scores()
+        )
@@ -1,8 +1,17 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
 
-from caps.models import Council
-from scoring.models import PlanScore, PlanSectionScore
+from caps.models import Council, DataVersion
+from scoring.cube import ScoreCube
+from scoring.models import (
+    PlanScore,
+    PlanSectionScore,
+    PlanYear,
+    PlanYearConfig,
+    PlanYearRegistry,
+)
 
 
 def strip_sections(sections):
@@ -40,6 +49,108 @@ class TestHomePageView(TestCase):
             self.assertEquals(councils[0]["name"], name)
 
 
+class TestPageCache(TestCase):
+    fixtures = ["test_homepage.json"]
+
+    def setUp(self):
+        cache.clear()
+        ScoreCube.clear()
+        DataVersion.bump(DataVersion.SCORING)
+        self.client = Client()
+        self.url = reverse("scoring:home", urlconf="scoring.urls")
+
+    def tearDown(self):
+        cache.clear()
+        ScoreCube.clear()
+
+    def get(self, url):
+        return self.client.get(url, HTTP_HOST="councilclimatescorecards.com")
+
+    def test_page_cached(self):
+        response = self.get(self.url)
+        self.assertEqual(response.status_code, 200)
+
+        with self.assertNumQueries(0):
+            cached = self.get(self.url)
+        self.assertEqual(cached.content, response.content)
+
+        # query string is part of the key
+        response = self.get(self.url + "?sort_by=s1_gov")
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNotNone(response.context)
+
+    def test_cache_invalidated_by_import(self):
+        self.get(self.url)
+        DataVersion.bump(DataVersion.SCORING)
+        cache.delete("data_version:scoring")
+
+        response = self.get(self.url)
+        self.assertIsNotNone(response.context)
+
+    @override_settings(SCORECARDS_PRIVATE=True)
+    def test_private_not_cached(self):
+        response = self.get(self.url)
+        self.assertEqual(response.status_code, 302)
+
+        User.objects.create_user("test", password="test")
+        self.client.login(username="test", password="test")
+        self.get(self.url)
+        response = self.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNotNone(response.context)
+
+        self.client.logout()
+        response = self.get(self.url)
+        self.assertEqual(response.status_code, 302)
+
+
+class TestPlanYearRegistry(TestCase):
+    def setUp(self):
+        self.previous = PlanYear.objects.create(year=2023)
+        self.current = PlanYear.objects.create(
+            year=2025, previous_year=self.previous, is_current=True
+        )
+        PlanYearRegistry.clear()
+
+    def tearDown(self):
+        PlanYearRegistry.clear()
+
+    def test_years_loaded_once(self):
+        with self.assertNumQueries(2):
+            current = PlanYearRegistry.get_current()
+            self.assertEqual(current.year, 2025)
+            self.assertEqual(current.previous_year.year, 2023)
+            self.assertEqual(PlanYearRegistry.get_year("2023").year, 2023)
+
+        with self.assertRaises(PlanYear.DoesNotExist):
+            PlanYearRegistry.get_year(2021)
+
+    def test_reloaded_on_save(self):
+        PlanYearRegistry.get_current()
+        self.previous.is_current = True
+        self.previous.save()
+        self.current.is_current = False
+        self.current.save()
+
+        self.assertEqual(PlanYearRegistry.get_current().year, 2023)
+
+    def test_config(self):
+        with self.assertRaises(PlanYearConfig.DoesNotExist):
+            PlanYearRegistry.get_config("removed_questions", 2025)
+
+        PlanYearConfig.objects.create(
+            year=self.current, name="removed_questions", value=["s1_b_h_q1"]
+        )
+        config = PlanYearRegistry.get_config("removed_questions", 2025)
+        self.assertEqual(config, ["s1_b_h_q1"])
+
+        # changing the returned value should not affect later calls
+        config.append("s1_b_h_q2")
+        with self.assertNumQueries(0):
+            config = PlanYearRegistry.get_config("removed_questions", 2025)
+        self.assertEqual(config, ["s1_b_h_q1"])
+
+
 @override_settings(PLAN_YEAR="2023")
 class TestAnswerView(TestCase):
     fixtures = ["test_answers.json"]
@@ -634,6 +745,38 @@ class TestPreviousYearAnswerView(TestCase):
             ],
         )
 
+    def test_answer_view_comparisons(self):
+        url = reverse("scoring:council", urlconf="scoring.urls", args=["borsetshire"])
+        response = self.client.get(
+            url,
+            {"comparisons": ["east-borsetshire", "west-borsetshire"]},
+            HTTP_HOST="councilclimatescorecards.com",
+        )
+        sections = response.context["sections"]
+        answers = {answer["code"]: answer for answer in sections[0]["answers"]}
+
+        comparisons = answers["s1_b_h_q1_sp1"]["comparisons"]
+        self.assertEqual(len(comparisons), 2)
+        self.assertEqual(comparisons[0]["answer"], "True")
+        self.assertEqual(comparisons[0]["previous_score"], 1.0)
+        self.assertEqual(comparisons[0]["change"], 0)
+        # west borsetshire has no answers
+        self.assertEqual(comparisons[1], {"score": "-", "max": "-"})
+
+    def test_question_scores_for_plans(self):
+        with self.assertNumQueries(1):
+            scores = PlanScore.question_scores_for_plans(
+                plan_ids=[5, 6, 7], plan_year=2025
+            )
+
+        self.assertEqual(sorted(scores.keys()), ["s1_b_h_q1", "s1_b_h_q1_sp1"])
+        self.assertEqual(sorted(scores["s1_b_h_q1_sp1"].keys()), [5, 6])
+        answer = scores["s1_b_h_q1_sp1"][5]
+        self.assertEqual(answer.council_name, "Borsetshire County")
+        self.assertEqual(answer.previous_question_code, "s1_b_h_q1_sp1")
+        self.assertEqual(answer.previous_score, 1.0)
+        self.assertIsNone(scores["s1_b_h_q1"][5].previous_answer_id)
+
 
 @override_settings(PLAN_YEAR="2023")
 class TestQuestionViewFilters(TestCase):
@@ -25,6 +25,7 @@ from scoring.filters import NationPlanScoreFilter, PlanScoreFilter, QuestionScor
 from scoring.forms import ScoringSort, ScoringSortCA
 from scoring.mixins import (
     AdvancedFilterMixin,
+    PageCacheMixin,
     PrivateScorecardsAccessMixin,
     SearchAutocompleteMixin,
 )
@@ -70,6 +71,7 @@ class PrivacyView(TemplateView):
 
 class BaseCouncilListView(
     PrivateScorecardsAccessMixin,
+    PageCacheMixin,
     SearchAutocompleteMixin,
     AdvancedFilterMixin,
     FilterView,
@@ -77,6 +79,24 @@ class BaseCouncilListView(
     def get_missing_councils(self, council_ids, scoring_group):
         return []
 
+    def get_all_council_scores(self, year=None):
+        """
+        Section scores for all councils, fetched at most once per year for each
+        request however many times they're needed.
+        """
+        if year is None:
+            year = self.request.year.year
+
+        if not hasattr(self.request, "all_council_scores"):
+            self.request.all_council_scores = {}
+
+        if year not in self.request.all_council_scores:
+            self.request.all_council_scores[year] = (
+                PlanSectionScore.get_all_council_scores(plan_year=year, as_list=True)
+            )
+
+        return self.request.all_council_scores[year]
+
     def get_averages(self, context):
         scoring_group = self.get_scoring_group()
         country = self.kwargs.get("nation_name")
@@ -116,9 +136,7 @@ class BaseCouncilListView(
         scoring_group = self.get_scoring_group()
         councils = context["object_list"].values()
 
-        all_scores = PlanSectionScore.get_all_council_scores(
-            plan_year=self.request.year.year, as_list=True
-        )
+        all_scores = self.get_all_council_scores()
 
         councils = list(councils.all())
         council_ids = []
@@ -251,9 +269,7 @@ class HomePageView(BaseCouncilListView):
 
         averages, section_averages = self.get_averages(context)
 
-        all_scores = PlanSectionScore.get_all_council_scores(
-            plan_year=self.request.year.year, as_list=True
-        )
+        all_scores = self.get_all_council_scores()
 
         if self.request.year.previous_year:
             previous_averages = PlanSection.get_average_scores(
@@ -384,7 +400,9 @@ class HomePageView(BaseCouncilListView):
 
 
 @method_decorator(cache_control(**cache_settings), name="dispatch")
-class CouncilView(PrivateScorecardsAccessMixin, SearchAutocompleteMixin, DetailView):
+class CouncilView(
+    PrivateScorecardsAccessMixin, PageCacheMixin, SearchAutocompleteMixin, DetailView
+):
     model = Council
     context_object_name = "council"
     template_name = "scoring/council.html"
@@ -438,14 +456,24 @@ class CouncilView(PrivateScorecardsAccessMixin, SearchAutocompleteMixin, DetailV
 
         return is_active, inactive_type
 
-    def get_comparison_data(self):
+    def add_previous_score(self, q, question, previous_q_overrides):
+        if (
+            not q["code"] in previous_q_overrides
+            and q.get("previous_q_code")
+            and question.previous_answer_id is not None
+            and question.previous_score is not None
+        ):
+            q["previous_score"] = question.previous_score
+            q["previous_max"] = question.previous_max
+            q["change"] = int(q["score"] - q["previous_score"])
+
+        return q
+
+    def get_comparison_data(self, plan_score):
         comparison_slugs = self.request.GET.getlist("comparisons")
         comparisons = None
-        comparison_answers = defaultdict(dict)
         comparison_sections = {}
-        previous_q_overrides = defaults.get_config(
-            "previous_q_overrides", self.request.year.year, default=[]
-        )
+        plan_ids = [plan_score.id]
         if comparison_slugs:
             comparisons = (
                 PlanScore.objects.select_related("council")
@@ -465,51 +493,15 @@ class CouncilView(PrivateScorecardsAccessMixin, SearchAutocompleteMixin, DetailV
                 plan_year=self.request.year.year,
                 previous_year=True,
             )
+            plan_ids.extend(p.id for p in comparisons)
 
-            comparison_ids = [p.id for p in comparisons]
-            if len(comparison_ids) > 0:
-                for question in PlanScore.questions_answered_for_councils(
-                    plan_ids=comparison_ids, plan_year=self.request.year.year
-                ):
-                    q = self.make_question_obj(question)
-                    comparison_answers[question.code][question.council_name] = q
-                prev_plans = PlanScore.objects.filter(id__in=comparison_ids).values(
-                    "previous_year_id", "previous_year__year"
-                )
-                ids = []
-                year = None
-                for plan in prev_plans:
-                    ids.append(plan["previous_year_id"])
-                    year = plan["previous_year__year"]
-
-                previous_answers = defaultdict(dict)
-                for question in PlanScore.questions_answered_for_councils(
-                    plan_ids=ids, plan_year=year
-                ):
-                    previous_answers[question.code][question.council_name] = {}
-                    previous_answers[question.code][question.council_name][
-                        "previous_score"
-                    ] = question.score
-                    previous_answers[question.code][question.council_name][
-                        "previous_max"
-                    ] = question.max_score
-
-                for code in comparison_answers.keys():
-                    for council, answer in comparison_answers[code].items():
-                        prev_code = answer.get("previous_q_code")
-                        if (
-                            not code in previous_q_overrides
-                            and prev_code
-                            and previous_answers[prev_code].get(council)
-                        ):
-                            answer["previous_score"] = previous_answers[prev_code][
-                                council
-                            ]["previous_score"]
-                            answer["change"] = int(
-                                answer["score"] - answer["previous_score"]
-                            )
-
-        return comparisons, comparison_answers, comparison_sections
+        # answers for the council and everything it's compared with, including
+        # their previous scores, in one go
+        answers = PlanScore.question_scores_for_plans(
+            plan_ids=plan_ids, plan_year=self.request.year.year
+        )
+
+        return comparisons, answers, comparison_sections
 
     def get_section_details(self, plan_score, group, comparisons, comparison_sections):
         sections = PlanSectionScore.sections_for_council(
@@ -526,7 +518,7 @@ class CouncilView(PrivateScorecardsAccessMixin, SearchAutocompleteMixin, DetailV
         section_avgs = PlanSectionScore.get_all_section_averages(
             council_group=group, plan_year=self.request.year.year
         )
-        for section in section_avgs.all():
+        for section in section_avgs:
             sections[section["plan_section__code"]]["avg"] = round(
                 section["avg_score"], 1
             )
@@ -534,7 +526,7 @@ class CouncilView(PrivateScorecardsAccessMixin, SearchAutocompleteMixin, DetailV
         section_top_marks = PlanSectionScore.get_all_section_top_mark_counts(
             council_group=group, plan_year=self.request.year.year
         )
-        for section in section_top_marks.all():
+        for section in section_top_marks:
             sections[section["plan_section__code"]]["max_count"] = section[
                 "max_score_count"
             ]
@@ -544,9 +536,7 @@ class CouncilView(PrivateScorecardsAccessMixin, SearchAutocompleteMixin, DetailV
 
         return sections
 
-    def add_answer_details(
-        self, plan_score, group, sections, comparisons, comparison_answers
-    ):
+    def add_answer_details(self, plan_score, group, sections, comparisons, answers):
         question_max_counts = PlanQuestionScore.all_question_max_score_counts(
             council_group=group, plan_year=self.request.year.year
         )
@@ -555,25 +545,15 @@ class CouncilView(PrivateScorecardsAccessMixin, SearchAutocompleteMixin, DetailV
             "previous_q_overrides", self.request.year.year, default=[]
         )
 
-        previous_questions = defaultdict(dict)
-        if plan_score.previous_year is not None:
-            prev_answers = plan_score.previous_year.questions_answered()
-            for pa in prev_answers:
-                previous_questions[pa.section_code][pa.code] = pa
+        for plan_answers in answers.values():
+            question = plan_answers.get(plan_score.id)
+            if question is None:
+                continue
 
-        for question in plan_score.questions_answered():
             section = question.section_code
 
             q = self.make_question_obj(question)
-            if (
-                not q["code"] in previous_q_overrides
-                and q.get("previous_q_code")
-                and previous_questions[section].get(q["previous_q_code"])
-            ):
-                pq = previous_questions[section][q["previous_q_code"]]
-                q["previous_score"] = pq.score
-                q["previous_max"] = pq.max_score
-                q["change"] = int(q["score"] - q["previous_score"])
+            q = self.add_previous_score(q, question, previous_q_overrides)
 
             q["council_count"] = question_max_counts.get(question.code, 0)
             q["comparisons"] = []
@@ -581,9 +561,16 @@ class CouncilView(PrivateScorecardsAccessMixin, SearchAutocompleteMixin, DetailV
             # display something
             if comparisons is not None:
                 for c in comparisons:
+                    comparison = plan_answers.get(c.id)
+                    if comparison is None:
+                        q["comparisons"].append({"score": "-", "max": "-"})
+                        continue
+
                     q["comparisons"].append(
-                        comparison_answers[question.code].get(
-                            c.council.name, {"score": "-", "max": "-"}
+                        self.add_previous_score(
+                            self.make_question_obj(comparison),
+                            comparison,
+                            previous_q_overrides,
                         )
                     )
 
@@ -681,16 +668,14 @@ class CouncilView(PrivateScorecardsAccessMixin, SearchAutocompleteMixin, DetailV
 
         context = self.add_previous_scores(council, context, plan_score)
 
-        comparisons, comparison_answers, comparison_sections = (
-            self.get_comparison_data()
-        )
+        comparisons, answers, comparison_sections = self.get_comparison_data(plan_score)
 
         sections = self.get_section_details(
             plan_score, group, comparisons, comparison_sections
         )
 
         sections = self.add_answer_details(
-            plan_score, group, sections, comparisons, comparison_answers
+            plan_score, group, sections, comparisons, answers
         )
 
         council_count = PlanScore.objects.filter(
@@ -987,7 +972,9 @@ class CouncilTypeTopPerformerView(TemplateView):
 
 
 @method_decorator(cache_control(**cache_settings), name="dispatch")
-class SectionView(PrivateScorecardsAccessMixin, SearchAutocompleteMixin, DetailView):
+class SectionView(
+    PrivateScorecardsAccessMixin, PageCacheMixin, SearchAutocompleteMixin, DetailView
+):
     model = PlanSection
     context_object_name = "section"
     template_name = "scoring/section.html"
@@ -1327,6 +1314,7 @@ class SectionCouncilTopPerformerPreview(PrivateScorecardsAccessMixin, TemplateVi
 @method_decorator(cache_control(**cache_settings), name="dispatch")
 class QuestionView(
     PrivateScorecardsAccessMixin,
+    PageCacheMixin,
     SearchAutocompleteMixin,
     AdvancedFilterMixin,
     DetailView,
@@ -243,7 +243,7 @@ class CouncilView(PrivateScorecardsAccessMixin, DetailView):
         section_avgs = PlanSectionScore.get_all_section_averages(
             council_group=group, plan_year=2021
         )
-        for section in section_avgs.all():
+        for section in section_avgs:
             sections[section["plan_section__code"]]["avg"] = round(
                 section["avg_score"], 1
             )
@@ -251,7 +251,7 @@ class CouncilView(PrivateScorecardsAccessMixin, DetailView):
         section_top_marks = PlanSectionScore.get_all_section_top_mark_counts(
             council_group=group, plan_year=2021
         )
-        for section in section_top_marks.all():
+        for section in section_top_marks:
             sections[section["plan_section__code"]]["max_count"] = section[
                 "max_score_count"
             ]